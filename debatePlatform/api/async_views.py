@@ -0,0 +1,158 @@
+"""
+Async implementations of the read endpoints of the API.
+
+Django REST framework dispatches synchronously, so under ASGI a request to a
+DRF view holds a worker thread from the first byte to the last. A view with
+`AsyncReadMixin` gets an async entry point instead: GET and HEAD requests to
+an action with an async implementation (`alist`, `aretrieve`, `aget`) run
+`adispatch`, which awaits the ORM (`aget`, `acount`, `async for`) and the
+cache (`aget`, `aset`) and renders the same response as the sync action.
+Every other request is handed to the regular DRF view in a thread, as Django
+does for sync views.
+
+Two steps still run in a thread: authentication, as simplejwt has no async
+authenticator, and serialization, which reads pending votes from the vote
+buffer with the blocking Redis client.
+
+Served through WSGI, the view runs in an event loop of its own per request
+and gives the same responses.
+"""
+import functools
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.http import Http404
+from rest_framework.response import Response
+from rest_framework.throttling import ScopedRateThrottle
+
+ASYNC_METHODS = ('GET', 'HEAD')
+
+
+class AsyncScopedRateThrottle(ScopedRateThrottle):
+    """`ScopedRateThrottle` that can also keep its history with the async cache calls."""
+
+    async def aallow_request(self, request, view):
+        self.scope = getattr(view, self.scope_attr, None)
+        if not self.scope:
+            return True
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+        self.history = await self.cache.aget(self.key, [])
+        self.now = self.timer()
+        while self.history and self.history[-1] <= self.now - self.duration:
+            self.history.pop()
+        if len(self.history) >= self.num_requests:
+            return self.throttle_failure()
+        self.history.insert(0, self.now)
+        await self.cache.aset(self.key, self.history, self.duration)
+        return True
+
+
+class AsyncReadMixin:
+    """
+    Serves GET and HEAD through `adispatch` when the view implements the
+    action asynchronously: `alist` and `aretrieve` for viewsets (provided here
+    for querysets), `aget` for plain generic views.
+    """
+
+    @classmethod
+    def as_view(cls, *args, **initkwargs):
+        view = super().as_view(*args, **initkwargs)
+        actions = getattr(view, 'actions', None)
+        handler_name = f"a{actions['get']}" if actions and 'get' in actions else 'aget'
+        threaded_view = sync_to_async(view)
+
+        @functools.wraps(view)
+        async def async_view(request, *args, **kwargs):
+            if request.method not in ASYNC_METHODS or not hasattr(cls, handler_name):
+                return await threaded_view(request, *args, **kwargs)
+
+            self = cls(**view.initkwargs)
+            if actions is not None:
+                # As in `ViewSetMixin.as_view`, so `action` and the Allow header come out the same.
+                self.action_map = {'head': actions['get'], **actions}
+                for method, action in self.action_map.items():
+                    setattr(self, method, getattr(self, action))
+            self.setup(request, *args, **kwargs)
+            return await self.adispatch(request, getattr(self, handler_name), *args, **kwargs)
+
+        return async_view
+
+    async def adispatch(self, request, handler, *args, **kwargs):
+        """`APIView.dispatch` with the I/O of `initial` and of the handler awaited."""
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await self.ainitial(request, *args, **kwargs)
+            response = await handler(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def ainitial(self, request, *args, **kwargs):
+        self.format_kwarg = self.get_format_suffix(**kwargs)
+        request.accepted_renderer, request.accepted_media_type = self.perform_content_negotiation(request)
+        request.version, request.versioning_scheme = self.determine_version(request, *args, **kwargs)
+
+        await sync_to_async(self.perform_authentication)(request)
+        self.check_permissions(request)
+        await self.acheck_throttles(request)
+
+    async def acheck_throttles(self, request):
+        throttle_durations = []
+        for throttle in self.get_throttles():
+            if hasattr(throttle, 'aallow_request'):
+                allowed = await throttle.aallow_request(request, self)
+            else:
+                allowed = await sync_to_async(throttle.allow_request)(request, self)
+            if not allowed:
+                throttle_durations.append(throttle.wait())
+
+        if throttle_durations:
+            durations = [duration for duration in throttle_durations if duration is not None]
+            self.throttled(request, max(durations, default=None))
+
+    async def apaginate_queryset(self, queryset):
+        if self.paginator is None:
+            return None
+        return await self.paginator.apaginate_queryset(queryset, self.request, view=self)
+
+    async def aget_object(self):
+        """`GenericAPIView.get_object` with the lookup awaited."""
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            obj = await queryset.aget(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        except queryset.model.DoesNotExist:
+            raise Http404(f"No {queryset.model._meta.object_name} matches the given query.")
+        except (TypeError, ValueError, ValidationError):
+            raise Http404
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+    async def aserialize(self, instance, **kwargs):
+        """The serialized data of loaded objects, rendered in a thread as serializers may do blocking I/O."""
+        serializer = self.get_serializer(instance, **kwargs)
+        return await sync_to_async(lambda: serializer.data)()
+
+    async def alist(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = await self.apaginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(await self.aserialize(page, many=True))
+        return Response(await self.aserialize([obj async for obj in queryset], many=True))
+
+    async def aretrieve(self, request, *args, **kwargs):
+        return Response(await self.aserialize(await self.aget_object()))
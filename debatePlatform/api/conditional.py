@@ -0,0 +1,92 @@
+"""
+Conditional GET support (ETag / Last-Modified) for the debate and argument APIs.
+
+Validators come from the version counters in `debate.caching`, so a request
+whose `If-None-Match` or `If-Modified-Since` still matches is answered with
+304 before any queryset is built or serializer run. Debates also show the xp,
+level and wins of their author and participants; those change with every vote,
+so they have versions of their own (`touch_users`) that the validators of a
+debate combine with the debate's version.
+"""
+import hashlib
+from email.utils import formatdate
+
+from django.utils.cache import get_conditional_response
+
+from debate.caching import aget_last_modified, aget_versions, get_last_modified, get_versions
+
+
+class ConditionalGetMixin:
+    """
+    Adds ETag and Last-Modified to `list` and `retrieve`, and to `alist` and
+    `aretrieve` of views with `AsyncReadMixin`. Views name the version
+    their data depends on with `get_list_version_name()` and
+    `get_object_version_name()`; returning `None` disables the validators.
+    `get_version_names()` adds the versions of what the data shows besides.
+    """
+
+    def get_list_version_name(self):
+        return None
+
+    def get_object_version_name(self):
+        return None
+
+    def get_version_names(self, version_name):
+        """All versions the data named `version_name` depends on, that one first."""
+        return [version_name]
+
+    async def aget_version_names(self, version_name):
+        return self.get_version_names(version_name)
+
+    def make_validators(self, version_name, versions, modified):
+        request = self.request
+        renderer = getattr(request, 'accepted_renderer', None)
+        representation = (f"{version_name}:{':'.join(map(str, versions))}:{getattr(renderer, 'format', '')}:"
+                          f"{request.get_full_path()}")
+        etag = f'"{hashlib.md5(representation.encode()).hexdigest()}"'
+        return etag, int(modified) if modified is not None else None
+
+    def get_validators(self, version_name):
+        names = self.get_version_names(version_name)
+        return self.make_validators(version_name, get_versions(names), get_last_modified(names))
+
+    async def aget_validators(self, version_name):
+        names = await self.aget_version_names(version_name)
+        return self.make_validators(version_name, await aget_versions(names), await aget_last_modified(names))
+
+    @staticmethod
+    def add_validators(response, etag, last_modified):
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = formatdate(last_modified, usegmt=True)
+            response['Cache-Control'] = 'no-cache'
+        return response
+
+    def conditional(self, version_name, handler, request, *args, **kwargs):
+        if version_name is None:
+            return handler(request, *args, **kwargs)
+
+        etag, last_modified = self.get_validators(version_name)
+        not_modified = get_conditional_response(request._request, etag=etag, last_modified=last_modified)
+        return self.add_validators(not_modified or handler(request, *args, **kwargs), etag, last_modified)
+
+    async def aconditional(self, version_name, handler, request, *args, **kwargs):
+        if version_name is None:
+            return await handler(request, *args, **kwargs)
+
+        etag, last_modified = await self.aget_validators(version_name)
+        not_modified = get_conditional_response(request._request, etag=etag, last_modified=last_modified)
+        return self.add_validators(not_modified or await handler(request, *args, **kwargs), etag, last_modified)
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(self.get_list_version_name(), super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(self.get_object_version_name(), super().retrieve, request, *args, **kwargs)
+
+    async def alist(self, request, *args, **kwargs):
+        return await self.aconditional(self.get_list_version_name(), super().alist, request, *args, **kwargs)
+
+    async def aretrieve(self, request, *args, **kwargs):
+        return await self.aconditional(self.get_object_version_name(), super().aretrieve, request, *args, **kwargs)
@@ -1,5 +1,7 @@
 from django_filters import rest_framework as filters
+from rest_framework.filters import SearchFilter
 from debate.models import Debate
+from debate.search import search_debates
 
 class DebateFilter(filters.FilterSet):
     category = filters.CharFilter(
@@ -9,4 +11,17 @@ class DebateFilter(filters.FilterSet):
 
     class Meta:
         model = Debate
-        fields = ['category']
\ No newline at end of file
+        fields = ['category']
+
+
+class DebateSearchFilter(SearchFilter):
+    """
+    Searches debates through the full-text index instead of `icontains` on
+    every search field, and orders the results by relevance.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        return search_debates(queryset, query)
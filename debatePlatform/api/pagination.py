@@ -0,0 +1,147 @@
+from django.core.paginator import InvalidPage, Paginator
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from debate.pagination import KeysetPaginator, InvalidCursor, aestimate_count, estimate_count
+
+
+class CountedPaginator(Paginator):
+    """A paginator that is given its count up front, so building a page runs no COUNT query."""
+
+    def __init__(self, object_list, per_page, count, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count = count
+
+
+class SearchPagination(PageNumberPagination):
+    """Page-number pagination for results ordered by relevance, with an async variant for the async views."""
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        paginator = CountedPaginator(queryset, page_size, await queryset.acount())
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+
+        self.page.object_list = [row async for row in self.page.object_list]
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        return list(self.page)
+
+
+class DebateCursorPagination(BasePagination):
+    """
+    Cursor pagination over `(participant_count, created_at, id)`, so every page
+    costs the same as the first. Pass `estimate_total=true` to get an estimated
+    total instead of paying for an exact COUNT(*).
+
+    Search results are ordered by relevance rather than by the cursor key, so
+    they fall back to page-number pagination.
+    """
+    page_size = 20
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    estimate_query_param = 'estimate_total'
+
+    def __init__(self):
+        self.fallback = None
+        self.page = None
+        self.estimated_total = None
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+
+        if self.is_search(queryset):
+            self.fallback = SearchPagination()
+            self.fallback.page_size = page_size
+            return self.fallback.paginate_queryset(queryset, request, view)
+
+        try:
+            self.page = KeysetPaginator(queryset, page_size).page(request.query_params.get(self.cursor_query_param))
+        except InvalidCursor:
+            raise NotFound("Invalid cursor.")
+
+        if self.wants_estimate(request):
+            self.estimated_total = estimate_count(queryset)
+        return list(self.page)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+
+        if self.is_search(queryset):
+            self.fallback = SearchPagination()
+            self.fallback.page_size = page_size
+            return await self.fallback.apaginate_queryset(queryset, request, view)
+
+        try:
+            self.page = await KeysetPaginator(queryset, page_size).apage(
+                request.query_params.get(self.cursor_query_param))
+        except InvalidCursor:
+            raise NotFound("Invalid cursor.")
+
+        if self.wants_estimate(request):
+            self.estimated_total = await aestimate_count(queryset)
+        return list(self.page)
+
+    @staticmethod
+    def is_search(queryset):
+        return bool(queryset.query.order_by) and queryset.query.order_by[0] == '-search_rank'
+
+    def wants_estimate(self, request):
+        return request.query_params.get(self.estimate_query_param, '').lower() in ('1', 'true')
+
+    def get_link(self, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        if self.fallback is not None:
+            return self.fallback.get_paginated_response(data)
+
+        payload = {
+            'next': self.get_link(self.page.next_cursor),
+            'previous': self.get_link(self.page.previous_cursor),
+        }
+        if self.estimated_total is not None:
+            payload['estimated_total'] = self.estimated_total
+        payload['results'] = data
+        return Response(payload)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'estimated_total': {'type': 'integer', 'description': f"Only with `{self.estimate_query_param}=true`."},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {'name': self.cursor_query_param, 'required': False, 'in': 'query',
+             'description': 'The pagination cursor value.', 'schema': {'type': 'string'}},
+            {'name': self.page_size_query_param, 'required': False, 'in': 'query',
+             'description': f'Number of results per page, at most {self.max_page_size}.',
+             'schema': {'type': 'integer'}},
+            {'name': self.estimate_query_param, 'required': False, 'in': 'query',
+             'description': 'Include an estimated total count.', 'schema': {'type': 'boolean'}},
+        ]
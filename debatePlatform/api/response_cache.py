@@ -0,0 +1,63 @@
+"""
+Cache of serialized API responses, keyed by the version of the data they show.
+
+A cached representation is never invalidated explicitly: a change bumps the
+version, the next request misses and stores the new representation under the
+new key, and the old entry expires. The key holds every version the view's
+`get_version_names()` lists, so a debate's entry also follows the xp, level
+and wins of the users it shows without those changes touching the debate.
+"""
+from django.core.cache import cache
+from rest_framework.response import Response
+
+from debate.caching import aget_versions, arecord_cache_access, get_versions, record_cache_access, versions_token
+
+RESPONSE_CACHE_TIMEOUT = 60 * 10
+
+
+class CachedRetrieveMixin:
+    """
+    Serves `retrieve`, and `aretrieve` of views with `AsyncReadMixin`, from the
+    cache. Views name the cache in `response_cache_name` and the versions the
+    response depends on with `get_object_version_name()` and
+    `get_version_names()`, as for `ConditionalGetMixin`.
+    Responses carry `X-Cache: HIT` or `MISS`; the counters are available from
+    `debate.caching.cache_stats`.
+    """
+    response_cache_name = None
+
+    def retrieve(self, request, *args, **kwargs):
+        version_name = self.get_object_version_name()
+        if version_name is None:
+            return super().retrieve(request, *args, **kwargs)
+
+        versions = get_versions(self.get_version_names(version_name))
+        key = f"response:{self.response_cache_name}:{version_name}:{versions_token(versions)}"
+        data = cache.get(key)
+        record_cache_access(self.response_cache_name, hit=data is not None)
+        if data is not None:
+            return Response(data, headers={'X-Cache': 'HIT'})
+
+        response = super().retrieve(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, RESPONSE_CACHE_TIMEOUT)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    async def aretrieve(self, request, *args, **kwargs):
+        version_name = self.get_object_version_name()
+        if version_name is None:
+            return await super().aretrieve(request, *args, **kwargs)
+
+        versions = await aget_versions(await self.aget_version_names(version_name))
+        key = f"response:{self.response_cache_name}:{version_name}:{versions_token(versions)}"
+        data = await cache.aget(key)
+        await arecord_cache_access(self.response_cache_name, hit=data is not None)
+        if data is not None:
+            return Response(data, headers={'X-Cache': 'HIT'})
+
+        response = await super().aretrieve(request, *args, **kwargs)
+        if response.status_code == 200:
+            await cache.aset(key, response.data, RESPONSE_CACHE_TIMEOUT)
+        response['X-Cache'] = 'MISS'
+        return response
@@ -1,5 +1,8 @@
+from rest_framework import serializers
 from rest_framework.views import APIView
 
+from debate.vote_buffer import apply_pending
+
 
 class SerializerGetter:
     def __init__(self, default, **kwargs):
@@ -26,4 +29,24 @@ class SerializerFactory:
         )
 
     def __call__(self, *args, **kwargs):
-        return self.serializer_getter(*args, **kwargs)
\ No newline at end of file
+        return self.serializer_getter(*args, **kwargs)
+
+
+class PendingCountsListSerializer(serializers.ListSerializer):
+    """Adds buffered vote deltas to a whole list of arguments or users with one lookup."""
+
+    def to_representation(self, data):
+        items = list(data.all() if hasattr(data, 'all') else data)
+        apply_pending(items)
+        return super().to_representation(items)
+
+
+class PendingCountsMixin:
+    """
+    Makes `vote_count` and `xp` include the deltas still waiting in the vote buffer.
+    Set `list_serializer_class = PendingCountsListSerializer` in Meta as well.
+    """
+
+    def to_representation(self, instance):
+        apply_pending([instance])
+        return super().to_representation(instance)
@@ -3,8 +3,10 @@ from rest_framework import serializers
 from django.contrib.auth.password_validation import validate_password
 from django.utils.translation import gettext_lazy as _
 from debate.models import Category, Debate, Argument, Vote
+from debate.participants import is_participant
 from user.models import User
 from datetime import timedelta
+from .serializer_utils import PendingCountsMixin, PendingCountsListSerializer
 
 """-------------------   Authentication Serializers   -------------------"""
 
@@ -114,13 +116,14 @@ class UserLoginSerializer(serializers.Serializer):
 """-------------------   User Serializers   -------------------"""
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(PendingCountsMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ('id', 'username', 'email', 'xp', 'level', 'wins')
+        list_serializer_class = PendingCountsListSerializer
 
 
-class UserStatSerializer(serializers.ModelSerializer):
+class UserStatSerializer(PendingCountsMixin, serializers.ModelSerializer):
     """
     Serializer for the User model including specific fields.
     """
@@ -128,6 +131,7 @@ class UserStatSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ('id', 'username', 'xp', 'level', 'wins')
+        list_serializer_class = PendingCountsListSerializer
 
 
 """-------------------   Debate Serializers   -------------------"""
@@ -143,7 +147,19 @@ class CategorySerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class ArgumentSerializer(serializers.ModelSerializer):
+class CategoryListSerializer(serializers.Serializer):
+    """
+    Serializes the entries of the category registry, including how many
+    Scheduled and Ongoing debates each category has.
+    """
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    slug = serializers.SlugField()
+    scheduled_count = serializers.IntegerField()
+    ongoing_count = serializers.IntegerField()
+
+
+class ArgumentSerializer(PendingCountsMixin, serializers.ModelSerializer):
     """
     Serializer class for the Argument model.
     """
@@ -151,9 +167,10 @@ class ArgumentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Argument
         fields = "__all__"
+        list_serializer_class = PendingCountsListSerializer
 
 
-class DebateArgumentSerializer(serializers.ModelSerializer):
+class DebateArgumentSerializer(PendingCountsMixin, serializers.ModelSerializer):
     """
     Handles the serialization of Argument model instances only for the DebateSerializer class.
     """
@@ -161,6 +178,7 @@ class DebateArgumentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Argument
         fields = ['id', 'text', 'vote_count', 'side', 'created_at', 'winner', 'author']
+        list_serializer_class = PendingCountsListSerializer
 
 
 class CreateArgumentSerializer(serializers.ModelSerializer):
@@ -177,7 +195,7 @@ class CreateArgumentSerializer(serializers.ModelSerializer):
         if debate.status != "Ongoing":
             raise serializers.ValidationError(
                 {"debate": "Arguments can only be submitted while the debate is ongoing."})
-        if self.context['request'].user not in debate.participants.all():
+        if not is_participant(debate.pk, self.context['request'].user.pk):
             raise serializers.ValidationError(
                 {"debate": "You can't submit arguments to a debate you're not participating in."})
         return data
@@ -204,6 +222,55 @@ class DebateSerializer(serializers.ModelSerializer):
                   'status', 'participants', 'debate_arguments']
 
 
+class UserStubSerializer(serializers.ModelSerializer):
+    """
+    Minimal representation of a user for nesting in list responses.
+    """
+
+    class Meta:
+        model = User
+        fields = ('id', 'username', 'slug')
+
+
+class CategoryStubSerializer(serializers.ModelSerializer):
+    """
+    Minimal representation of a category for nesting in list responses.
+    """
+
+    class Meta:
+        model = Category
+        fields = ('id', 'name', 'slug')
+
+
+class DebateListSerializer(serializers.ModelSerializer):
+    """
+    Summary representation of a Debate for the list action.
+
+    Instead of nesting every participant and argument, it reports their counts and
+    small author/category stubs, so the size of a list response depends on the page
+    size only. Nested collections can be requested with `?expand=participants,arguments`.
+    """
+
+    EXPANDABLE_FIELDS = {
+        'participants': lambda: UserStatSerializer(many=True, read_only=True),
+        'arguments': lambda: DebateArgumentSerializer(many=True, read_only=True, source='debate_arguments'),
+    }
+
+    author = UserStubSerializer(read_only=True)
+    category = CategoryStubSerializer(read_only=True)
+    argument_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Debate
+        fields = ['id', 'title', 'description', 'category', 'author', 'created_at', 'start_time', 'end_time',
+                  'status', 'participant_count', 'argument_count']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for name in self.context.get('expand', ()):
+            self.fields[name] = self.EXPANDABLE_FIELDS[name]()
+
+
 class CreateDebateSerializer(serializers.ModelSerializer):
     """
     Serializer for creating a Debate object.
@@ -228,6 +295,25 @@ class CreateDebateSerializer(serializers.ModelSerializer):
         return data
 
 
+class AddParticipantsSerializer(serializers.Serializer):
+    """
+    Validates the ids of the users a moderator adds to a debate, checking that
+    they all belong to active users with a single query.
+    """
+    MAX_USERS = 500
+
+    users = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False,
+                                  max_length=MAX_USERS)
+
+    def validate_users(self, user_ids):
+        user_ids = list(dict.fromkeys(user_ids))
+        found = set(User.objects.filter(pk__in=user_ids, is_active=True).values_list('pk', flat=True))
+        unknown = [str(user_id) for user_id in user_ids if user_id not in found]
+        if unknown:
+            raise serializers.ValidationError(f"There are no active users with the ids {', '.join(unknown)}.")
+        return user_ids
+
+
 class UpdateDebateSerializer(serializers.Serializer):
     title = serializers.CharField(max_length=255)
     description = serializers.CharField()
@@ -235,10 +321,8 @@ class UpdateDebateSerializer(serializers.Serializer):
     end_time = serializers.DateTimeField()
 
     def validate(self, data):
-        title = data.get('title')
-        description = data.get('description')
-        start_time = data.get('start_time')
-        end_time = data.get('end_time')
+        start_time = data.get('start_time', getattr(self.instance, 'start_time', None))
+        end_time = data.get('end_time', getattr(self.instance, 'end_time', None))
 
         if timezone.now() >= start_time - timedelta(minutes=30):
             raise serializers.ValidationError(
@@ -252,6 +336,19 @@ class UpdateDebateSerializer(serializers.Serializer):
             raise serializers.ValidationError(
                 {"start_time": "Start time must be in the future."})
 
+        return data
+
+    def update(self, instance, validated_data):
+        previous_start_time, previous_end_time = instance.start_time, instance.end_time
+
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        instance.save(update_fields=list(validated_data))
+
+        if (instance.start_time, instance.end_time) != (previous_start_time, previous_end_time):
+            instance.reschedule_status_transitions(previous_start_time, previous_end_time)
+        return instance
+
 
 class VoteSerializer(serializers.ModelSerializer):
     class Meta:
@@ -0,0 +1,124 @@
+"""
+Server-Sent Events streams for clients that cannot use WebSockets.
+
+The views are async, so an idle subscriber waits on the channel layer instead of
+holding a worker thread. That only holds when they are served over ASGI
+(`debatePlatform.asgi`): under WSGI a stream never ends and keeps its worker
+busy for as long as the client stays connected, so they must not be routed to
+WSGI workers.
+"""
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from django.http import Http404, StreamingHttpResponse
+from django.views import View
+
+from debate import live
+
+TALLY_TICK = 0.25
+KEEPALIVE_INTERVAL = 15
+
+
+def _frame(seq, tallies, argument_ids):
+    sides = {"Pro": 0, "Con": 0}
+    for side, vote_count in tallies.values():
+        sides[side] = sides.get(side, 0) + vote_count
+    arguments = {argument_id: tallies[argument_id][1] if argument_id in tallies else None
+                 for argument_id in argument_ids}
+    data = {"arguments": arguments, "sides": sides}
+    return f"id: {seq}\nevent: tally\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+class DebateVoteStream(View):
+    """
+    Streams the vote count of every argument of a debate and the totals per side.
+
+    The first frame holds every argument. After that, votes are combined on a
+    fixed tick of `TALLY_TICK` seconds, and each frame carries only the arguments
+    that changed in that tick, plus the side totals; a deleted argument is sent
+    as `null`. Frame ids are the debate's
+    live event sequence numbers. A client that reconnects with a `Last-Event-ID`
+    that is still current skips the full frame.
+
+    Workers may deliver events out of order. Events the initial tallies already
+    include are skipped; after that, each argument only skips events older than
+    the last one applied to it. Serve it over ASGI only (see the module docs).
+    """
+
+    async def get(self, request, debate_id):
+        channel_layer = get_channel_layer()
+        channel_name = await channel_layer.new_channel()
+        group_name = live.group_name(debate_id)
+        # Subscribe before reading the tallies, so no vote can fall in between.
+        await channel_layer.group_add(group_name, channel_name)
+
+        state = await sync_to_async(live.vote_tallies)(debate_id)
+        if state is None:
+            await channel_layer.group_discard(group_name, channel_name)
+            raise Http404("Debate not found.")
+
+        seq, tallies = state
+        last_event_id = request.headers.get('Last-Event-ID')
+
+        async def stream():
+            nonlocal seq
+            loop = asyncio.get_running_loop()
+            # The seq the initial tallies were read at, the newest seq applied per
+            # argument, and counts of arguments whose creation has not arrived yet.
+            tallies_seq, argument_seqs, early_counts, deleted = seq, {}, {}, set()
+            try:
+                yield "retry: 2000\n\n"
+                if last_event_id != str(seq):
+                    yield _frame(seq, tallies, tallies)
+
+                changed, last_sent = set(), loop.time()
+                while True:
+                    deadline = loop.time() + TALLY_TICK
+                    while (timeout := deadline - loop.time()) > 0:
+                        try:
+                            message = await asyncio.wait_for(channel_layer.receive(channel_name), timeout)
+                        except asyncio.TimeoutError:
+                            break
+                        event = message.get("event", {})
+                        event_seq = event.get("seq", 0)
+                        if event_seq <= tallies_seq:
+                            continue
+                        seq = max(seq, event_seq)
+                        if event["type"] == live.VOTE_COUNT_CHANGED:
+                            argument_id = event["argument_id"]
+                            if event_seq <= argument_seqs.get(argument_id, 0) or argument_id in deleted:
+                                continue
+                            argument_seqs[argument_id] = event_seq
+                            if argument_id in tallies:
+                                tallies[argument_id] = (tallies[argument_id][0], event["vote_count"])
+                                changed.add(argument_id)
+                            else:
+                                early_counts[argument_id] = event["vote_count"]
+                        elif event["type"] == live.ARGUMENT_CREATED and event["argument"]["id"] not in deleted:
+                            argument = event["argument"]
+                            vote_count = early_counts.pop(argument["id"], argument["vote_count"])
+                            if event_seq > argument_seqs.get(argument["id"], 0):
+                                argument_seqs[argument["id"]], vote_count = event_seq, argument["vote_count"]
+                            tallies[argument["id"]] = (argument["side"], vote_count)
+                            changed.add(argument["id"])
+                        elif event["type"] == live.ARGUMENT_DELETED:
+                            deleted.add(event["argument_id"])
+                            early_counts.pop(event["argument_id"], None)
+                            if tallies.pop(event["argument_id"], None) is not None:
+                                changed.add(event["argument_id"])
+
+                    if changed:
+                        yield _frame(seq, tallies, changed)
+                        changed, last_sent = set(), loop.time()
+                    elif loop.time() - last_sent > KEEPALIVE_INTERVAL:
+                        yield ": keepalive\n\n"
+                        last_sent = loop.time()
+            finally:
+                await channel_layer.group_discard(group_name, channel_name)
+
+        response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
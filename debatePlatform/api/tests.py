@@ -1,3 +1,457 @@
-from django.test import TestCase
+import asyncio
+import json
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from channels.layers import get_channel_layer
+from django.core.cache import cache
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase
+from django.urls import resolve, reverse
+from django.utils import timezone
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from debate import live
+from debate.arguments import delete_argument
+from debate.caching import debate_version_name, get_version
+from debate.testing import PASSWORD, QueryBudgetTestCase, seed_round
+from debate.models import Argument
+from debate.votes import VOTE_REWARD_XP, toggle_vote
+from user.models import User
+
+
+class APIQueryBudgetTestCase(QueryBudgetTestCase):
+    client_class = APIClient
+
+    def login(self, user):
+        self.client.force_authenticate(user)
+
+
+class AuthenticationQueryBudgetTests(APIQueryBudgetTestCase):
+    """Query and row budgets of the authentication endpoints."""
+
+    def test_register(self):
+        self.assertQueryBudget(
+            lambda data: self.client.post('/api/register/', {
+                'username': f"api-{data.users[0].username}", 'email': f"api-{data.users[0].email}",
+                'password': "A-long-password-1", 'confirm_password': "A-long-password-1",
+            }),
+            queries=3, rows=1)
+
+    def test_login(self):
+        self.assertQueryBudget(
+            lambda data: self.client.post('/api/login/', {'username': data.users[0].username,
+                                                             'password': PASSWORD}),
+            queries=2, rows=2)
+
+    def test_token_refresh(self):
+        self.assertQueryBudget(
+            lambda data: self.client.post(reverse('token_refresh'),
+                                          {'refresh': str(RefreshToken.for_user(data.users[0]))}),
+            queries=2, rows=1, login=lambda data: data.users[0])
+
+    def test_token_blacklist(self):
+        self.assertQueryBudget(
+            lambda data: self.client.post(reverse('token_blacklist'),
+                                          {'refresh': str(RefreshToken.for_user(data.users[0]))}),
+            queries=7, rows=3, login=lambda data: data.users[0])
+
+
+class ReadQueryBudgetTests(APIQueryBudgetTestCase):
+    """Query and row budgets of the read endpoints."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.admin = User.objects.create_superuser(username="budget-admin", slug="budget-admin", password="x")
+
+    def test_categories(self):
+        self.assertQueryBudget(lambda data: self.client.get(reverse('categories')), queries=1, rows=3)
+
+    def test_debate_list(self):
+        debate_ids = set()
+        for data, response in self.assertQueryBudget(lambda data: self.client.get(reverse('debates-list')),
+                                                     queries=1, rows=21):
+            debate_ids |= {debate.pk for debates in data.debates.values() for debate in debates}
+            shown = {debate['id'] for debate in response.data['results']}
+            self.assertEqual(len(shown), min(len(debate_ids), 20))
+            self.assertLessEqual(shown, debate_ids)
+
+    def test_debate_list_expanded(self):
+        # The expanded page lists every participant of its debates, so only the query count is bounded.
+        self.assertQueryBudget(lambda data: self.client.get(reverse('debates-list'),
+                                                            {'expand': 'participants,arguments'}),
+                               queries=3)
+
+    def test_debate_search(self):
+        self.assertQueryBudget(lambda data: self.client.get(reverse('debates-list'), {'search': 'Debate Ongoing'}),
+                               queries=2, rows=21)
+
+    def test_debate_detail(self):
+        # The representation lists every participant, so only the query count is bounded.
+        # One of the queries looks up whose versions the cached response follows.
+        for data, response in self.assertQueryBudget(
+                lambda data: self.client.get(reverse('debates-detail', args=[data.debate().pk])), queries=4):
+            debate = data.debate()
+            self.assertEqual((response.data['id'], response.data['author']['id']), (debate.pk, debate.author_id))
+            self.assertEqual({user['id'] for user in response.data['participants']}, data.participants[debate.pk])
+            self.assertEqual({user['id']: user['xp'] for user in response.data['participants']},
+                             {user.pk: user.xp for user in data.users if user.pk in data.participants[debate.pk]})
+
+    def test_argument_list(self):
+        # The listing returns every argument, so only the query count is bounded.
+        argument_ids = set()
+        for data, response in self.assertQueryBudget(lambda data: self.client.get(reverse('arguments-list')),
+                                                     queries=1):
+            argument_ids |= {argument.pk for arguments in data.arguments.values() for argument in arguments}
+            self.assertEqual({argument['id'] for argument in response.data}, argument_ids)
+
+    def test_argument_detail(self):
+        self.assertQueryBudget(lambda data: self.client.get(reverse('arguments-detail', args=[data.argument().pk])),
+                               queries=2, rows=2)
+
+    def test_user_detail(self):
+        for data, response in self.assertQueryBudget(
+                lambda data: self.client.get(reverse('user-detail', args=[data.users[0].slug])), queries=1, rows=1):
+            user = data.users[0]
+            self.assertEqual((response.data['username'], response.data['xp'], response.data['level']),
+                             (user.username, user.xp, user.level))
+
+    def test_cache_stats(self):
+        self.assertQueryBudget(lambda data: self.client.get(reverse('cache_stats')),
+                               queries=0, rows=0, login=lambda data: self.admin)
+
+
+class WriteQueryBudgetTests(APIQueryBudgetTestCase):
+    """Query and row budgets of the write endpoints."""
+
+    def test_create_debate(self):
+        start_time = timezone.now() + timedelta(days=1)
+        self.assertQueryBudget(
+            lambda data: self.client.post(reverse('debates-list'), {
+                'title': "A new debate", 'description': "Is it new?", 'category': data.categories[0].pk,
+                'start_time': start_time.isoformat(), 'end_time': (start_time + timedelta(hours=1)).isoformat(),
+            }),
+            queries=2, rows=2, login=lambda data: data.users[0])
+
+    def test_update_debate(self):
+        start_time = timezone.now() + timedelta(days=3)
+        self.assertQueryBudget(
+            lambda data: self.client.patch(reverse('debates-detail', args=[data.debate("Scheduled").pk]), {
+                'title': "A new title", 'description': "A new description",
+                'start_time': start_time.isoformat(), 'end_time': (start_time + timedelta(hours=1)).isoformat(),
+            }),
+            queries=2, rows=1, login=lambda data: data.debate("Scheduled").author)
+
+    def test_delete_debate(self):
+        self.assertQueryBudget(
+            lambda data: self.client.delete(reverse('debates-detail', args=[data.debate("Scheduled").pk])),
+            queries=4, rows=1, login=lambda data: data.debate("Scheduled").author)
+
+    def test_create_argument(self):
+        self.assertQueryBudget(
+            lambda data: self.client.post(reverse('arguments-list'), {
+                'text': "A new argument", 'side': "Con", 'debate': data.debate().pk,
+            }),
+            queries=3, rows=7, login=lambda data: data.user(data.argument().author_id))
+
+    def test_delete_argument(self):
+        # Takes back the author's xp in the same transaction as the delete, like the web view.
+        self.assertQueryBudget(
+            lambda data: self.client.delete(reverse('arguments-detail', args=[data.argument().pk])),
+            queries=6, rows=1, login=lambda data: data.user(data.argument().author_id))
+
+    def test_vote(self):
+        # Casting runs the insert in a savepoint of its own, three queries and its returned id more than an unvote.
+        self.assertQueryBudget(lambda data: self.client.post('/api/vote/', {'argument': data.argument().pk}),
+                               queries=10, rows=4, login=lambda data: data.outsider(data.debate()))
+
+    def test_unvote(self):
+        self.assertQueryBudget(lambda data: self.client.post('/api/vote/', {'argument': data.argument().pk}),
+                               queries=7, rows=3,
+                               login=lambda data: User.objects.filter(user_votes__argument=data.argument())[0])
+
+    def test_join(self):
+        # Besides the debate and the inserted row, the live event reads the joined user and the new count.
+        self.assertQueryBudget(lambda data: self.client.post(reverse('join_debate', args=[data.debate().pk])),
+                               queries=5, rows=4, login=lambda data: data.outsider(data.debate()))
+
+    def test_add_participants(self):
+        # Adds every user of the round, so only the query count is bounded.
+        self.assertQueryBudget(
+            lambda data: self.client.post(reverse('add_participants', args=[data.debate().pk]),
+                                          {'users': [user.pk for user in data.users]}, format='json'),
+            queries=6, login=lambda data: data.debate().author)
+
+
+class AsyncReadParityTests(TestCase):
+    """The async read endpoints answer exactly like the sync DRF views they wrap."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_round()
+
+    def respond(self, view, path, params):
+        match = resolve(path)
+        response = view(APIRequestFactory().get(path, params), *match.args, **match.kwargs)
+        return response.render() if hasattr(response, 'render') else response
+
+    def assertParity(self, path, params=None):
+        """Compares both paths twice, once with each of them filling the caches the other one reads."""
+        view = resolve(path).func
+        self.assertTrue(iscoroutinefunction(view))
+        for order in ((view.__wrapped__, async_to_sync(view)), (async_to_sync(view), view.__wrapped__)):
+            cache.clear()
+            first, second = (self.respond(handler, path, params) for handler in order)
+            self.assertEqual(first.status_code, second.status_code)
+            self.assertEqual(first.content, second.content)
+            headers = [{name: value for name, value in response.items() if name != 'X-Cache'}
+                       for response in (first, second)]
+            self.assertEqual(headers[0], headers[1])
+        return first
+
+    def test_categories(self):
+        self.assertParity(reverse('categories'))
+
+    def test_debate_list(self):
+        self.assertParity(reverse('debates-list'))
+        self.assertParity(reverse('debates-list'), {'expand': 'participants,arguments', 'category': 'topic'})
+
+    def test_debate_list_pages(self):
+        first = self.assertParity(reverse('debates-list'), {'page_size': 3, 'estimate_total': 'true'})
+        cursor = first.data['next'].split('cursor=')[1].split('&')[0]
+        self.assertParity(reverse('debates-list'), {'page_size': 3, 'cursor': cursor})
+        self.assertEqual(self.assertParity(reverse('debates-list'), {'cursor': 'nonsense'}).status_code, 404)
+
+    def test_debate_search(self):
+        self.assertParity(reverse('debates-list'), {'search': 'Debate', 'page_size': 3, 'page': 2})
+        self.assertEqual(self.assertParity(reverse('debates-list'), {'search': 'Debate', 'page': 9}).status_code,
+                         404)
+
+    def test_debate_search_without_terms(self):
+        response = self.assertParity(reverse('debates-list'), {'search': '!!!', 'estimate_total': 'true'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['estimated_total'], 0)
+        self.assertEqual(json.loads(response.content)['results'], [])
+
+    def test_debate_detail(self):
+        self.assertParity(reverse('debates-detail', args=[self.data.debate().pk]))
+        self.assertEqual(self.assertParity(reverse('debates-detail', args=[0])).status_code, 404)
+
+    def test_user_detail(self):
+        self.assertParity(reverse('user-detail', args=[self.data.users[0].slug]))
+        self.assertEqual(self.assertParity(reverse('user-detail', args=['nobody'])).status_code, 404)
+
+
+class ConditionalGetTests(TestCase):
+    """A stored ETag stops matching once anything the representation shows has changed."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_round()
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.debate = self.data.debate()
+        self.participant = User.objects.get(pk=min(self.data.participants[self.debate.pk]))
+
+    def assertRevalidated(self, url, params, change):
+        first = self.client.get(url, params)
+        self.assertEqual(self.client.get(url, params, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        second = self.client.get(url, params, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second['ETag'], first['ETag'])
+        return first, second
+
+    def participant_xp(self, response):
+        debate = response.data if 'participants' in response.data else next(
+            debate for debate in response.data['results'] if debate['id'] == self.debate.pk)
+        return next(user['xp'] for user in debate['participants'] if user['id'] == self.participant.pk)
+
+    def raise_xp(self):
+        self.participant.xp += 10
+        self.participant.save()
+
+    def test_detail(self):
+        first, second = self.assertRevalidated(reverse('debates-detail', args=[self.debate.pk]), None,
+                                               self.raise_xp)
+        self.assertEqual(self.participant_xp(second), self.participant_xp(first) + 10)
+
+    def test_expanded_list(self):
+        first, second = self.assertRevalidated(reverse('debates-list'), {'expand': 'participants'}, self.raise_xp)
+        self.assertEqual(self.participant_xp(second), self.participant_xp(first) + 10)
+
+    def test_score_changes_leave_other_representations_alone(self):
+        other = next(debate for debates in self.data.debates.values() for debate in debates
+                     if debate.author_id != self.participant.pk
+                     and self.participant.pk not in self.data.participants[debate.pk])
+        urls = [(reverse('debates-detail', args=[other.pk]), None), (reverse('debates-list'), None)]
+        etags = [self.client.get(url, params)['ETag'] for url, params in urls]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.raise_xp()
+        for (url, params), etag in zip(urls, etags):
+            self.assertEqual(self.client.get(url, params, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
+class ResponseCacheTests(TestCase):
+    """A cached debate is served again only while the scores of its users are unchanged."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_round()
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.debate = self.data.debate()
+        self.url = reverse('debates-detail', args=[self.debate.pk])
+
+    def test_vote_in_another_debate(self):
+        argument = Argument.objects.exclude(debate=self.debate).filter(
+            author_id__in=self.data.participants[self.debate.pk])[0]
+        voter = User.objects.exclude(pk=argument.author_id).exclude(user_votes__argument=argument)[0]
+        xp = lambda response: next(user['xp'] for user in response.data['participants']
+                                   if user['id'] == argument.author_id)
+
+        self.assertEqual(self.client.get(self.url)['X-Cache'], "MISS")
+        cached = self.client.get(self.url)
+        self.assertEqual(cached['X-Cache'], "HIT")
+        with self.captureOnCommitCallbacks(execute=True):
+            toggle_vote(voter, argument)
+        fresh = self.client.get(self.url)
+        self.assertEqual(fresh['X-Cache'], "MISS")
+        self.assertEqual(xp(fresh), xp(cached) + VOTE_REWARD_XP)
+
+
+class AddParticipantsTests(TestCase):
+    """Only the author of a debate or staff add participants, and only existing, active users."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_round()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.debate = self.data.debate()
+        self.url = reverse('add_participants', args=[self.debate.pk])
+
+    def test_author_adds_users(self):
+        self.client.force_authenticate(self.debate.author)
+        user_ids = [user.pk for user in self.data.users]
+        response = self.client.post(self.url, {'users': user_ids}, format='json')
+        members = self.data.participants[self.debate.pk]
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'added': [pk for pk in user_ids if pk not in members],
+                                         'already_participants': [pk for pk in user_ids if pk in members]})
+
+    def test_other_users_are_refused(self):
+        self.client.force_authenticate(next(user for user in self.data.users if user.pk != self.debate.author_id))
+        response = self.client.post(self.url, {'users': [self.data.users[0].pk]}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_unknown_users_are_rejected(self):
+        self.client.force_authenticate(self.debate.author)
+        response = self.client.post(self.url, {'users': [self.data.users[0].pk, 0, 999999]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class VoteStreamTests(TransactionTestCase):
+    """The vote stream sends a full frame, then the changes of each tick, and resumes from `Last-Event-ID`."""
+
+    def setUp(self):
+        cache.clear()
+        self.data = seed_round()
+        self.debate = self.data.debate()
+        self.arguments = self.data.arguments[self.debate.pk]
+        self.url = reverse('debate_vote_stream', args=[self.debate.pk])
+
+    async def chunks(self, response, count):
+        content = response.streaming_content
+        chunks = [await asyncio.wait_for(anext(content), 5) for _ in range(count)]
+        await content.aclose()
+        return chunks
+
+    def frame(self, chunk):
+        lines = dict(line.split(": ", 1) for line in chunk.decode().strip().split("\n"))
+        self.assertEqual(lines['event'], "tally")
+        return int(lines['id']), json.loads(lines['data'])
+
+    def vote_twice(self, argument):
+        voters = (User.objects.exclude(pk=argument.author_id).exclude(user_votes__argument=argument)
+                  .order_by('pk')[:2])
+        # Both events are sent on the same commit, so they fall into one tick.
+        with transaction.atomic():
+            for voter in voters:
+                toggle_vote(voter, argument)
+
+    async def test_full_frame_then_coalesced_changes(self):
+        argument = self.arguments[0]
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response['Content-Type'], "text/event-stream")
+        content = response.streaming_content
+        retry, first = [await asyncio.wait_for(anext(content), 5) for _ in range(2)]
+        await sync_to_async(self.vote_twice)(argument)
+        update = await asyncio.wait_for(anext(content), 5)
+        await content.aclose()
+
+        self.assertEqual(retry, b"retry: 2000\n\n")
+        seq, data = self.frame(first)
+        self.assertEqual(data, {'arguments': {str(argument.pk): 3 for argument in self.arguments},
+                                'sides': {'Pro': 6, 'Con': 6}})
+        update_seq, data = self.frame(update)
+        self.assertEqual(data, {'arguments': {str(argument.pk): 5}, 'sides': {'Pro': 8, 'Con': 6}})
+        self.assertGreater(update_seq, seq)
+
+    async def test_deleted_argument_is_sent_as_null(self):
+        argument = self.arguments[1]
+        argument_id = argument.pk
+        response = await self.async_client.get(self.url)
+        content = response.streaming_content
+        for _ in range(2):
+            await asyncio.wait_for(anext(content), 5)
+        await sync_to_async(delete_argument)(argument)
+        update = await asyncio.wait_for(anext(content), 5)
+        await content.aclose()
+
+        _, data = self.frame(update)
+        self.assertEqual(data, {'arguments': {str(argument_id): None}, 'sides': {'Pro': 6, 'Con': 3}})
+
+    async def test_events_out_of_order(self):
+        first, second = self.arguments[:2]
+        seq = await sync_to_async(get_version)(debate_version_name(self.debate.pk))
+        events = [(seq + 2, first, 10), (seq + 1, second, 7), (seq + 1, first, 9), (seq, second, 1)]
+        with mock.patch('api.streams.TALLY_TICK', 1):
+            response = await self.async_client.get(self.url)
+            content = response.streaming_content
+            for _ in range(2):
+                await asyncio.wait_for(anext(content), 5)
+            for event_seq, argument, vote_count in events:
+                await get_channel_layer().group_send(live.group_name(self.debate.pk), {
+                    'type': 'debate.event',
+                    'event': {'type': live.VOTE_COUNT_CHANGED, 'seq': event_seq, 'debate': self.debate.pk,
+                              'argument_id': argument.pk, 'vote_count': vote_count}})
+            update = await asyncio.wait_for(anext(content), 5)
+            await content.aclose()
+
+        update_seq, data = self.frame(update)
+        self.assertEqual(update_seq, seq + 2)
+        self.assertEqual(data, {'arguments': {str(first.pk): 10, str(second.pk): 7}, 'sides': {'Pro': 13, 'Con': 10}})
+
+    async def test_resume_skips_the_full_frame_and_keeps_alive(self):
+        seq = await sync_to_async(get_version)(debate_version_name(self.debate.pk))
+        with mock.patch('api.streams.KEEPALIVE_INTERVAL', 0):
+            current = await self.async_client.get(self.url, headers={'Last-Event-ID': str(seq)})
+            self.assertEqual(await self.chunks(current, 2), [b"retry: 2000\n\n", b": keepalive\n\n"])
+
+        stale = await self.async_client.get(self.url, headers={'Last-Event-ID': str(seq - 1)})
+        _, data = self.frame((await self.chunks(stale, 2))[1])
+        self.assertEqual(len(data['arguments']), len(self.arguments))
+
+    async def test_unknown_debate(self):
+        response = await self.async_client.get(reverse('debate_vote_stream', args=[0]))
+        self.assertEqual(response.status_code, 404)
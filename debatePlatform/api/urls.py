@@ -1,8 +1,9 @@
 from django.urls import path, include
 from .views import UserRegisterView, UserLoginView, CustomTokenRefreshView, CustomTokenBlacklistView, CategoryListing, \
     DebateViewSet, ArgumentViewSet, \
-    VoteView, UserRetrieveView, JoinDebateView
+    VoteView, UserRetrieveView, JoinDebateView, AddParticipantsView, CacheStatsView
 from rest_framework.routers import DefaultRouter
+from .streams import DebateVoteStream
 
 router = DefaultRouter()
 router.register('debates', DebateViewSet, basename='debates')
@@ -19,4 +20,7 @@ urlpatterns = [
     path('categories/', CategoryListing.as_view(), name='categories'),
     path('vote/', VoteView.as_view(), name='vote'),
     path('debates/<int:debate_id>/join/', JoinDebateView.as_view(), name='join_debate'),
+    path('debates/<int:debate_id>/participants/', AddParticipantsView.as_view(), name='add_participants'),
+    path('debates/<int:debate_id>/votes/stream/', DebateVoteStream.as_view(), name='debate_vote_stream'),
+    path('stats/cache/', CacheStatsView.as_view(), name='cache_stats'),
 ]
@@ -1,23 +1,33 @@
 from django_filters.rest_framework import DjangoFilterBackend
-from drf_spectacular.utils import extend_schema
+from drf_spectacular.utils import extend_schema, extend_schema_view, OpenApiParameter
 from rest_framework import generics, views, viewsets, mixins
 from rest_framework.decorators import permission_classes
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from rest_framework import status
 from user.models import User
-from debate.models import Debate, Argument, Category, Vote
-from .serializers import UserRegisterSerializer, CategorySerializer, DebateSerializer, \
+from debate.arguments import delete_argument
+from debate.models import Debate, Argument
+from debate.participants import add_participants
+from debate.retries import retry_on_lock
+from debate.votes import toggle_vote
+from debate.categories import aget_categories, get_categories
+from debate.caching import (adebate_user_ids, debate_user_ids, debate_version_name, user_version_name, cache_stats,
+                            DEBATES, USERS)
+from .serializers import UserRegisterSerializer, CategoryListSerializer, DebateSerializer, \
     CreateDebateSerializer, ArgumentSerializer, CreateArgumentSerializer, VoteSerializer, UserSerializer, \
-    UpdateDebateSerializer, UserStatSerializer
+    UpdateDebateSerializer, UserStatSerializer, DebateListSerializer, AddParticipantsSerializer
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView, TokenBlacklistView
 from .serializer_utils import SerializerFactory
 from django.db import models
+from django.db.models.functions import Coalesce
 from .permissions import IsOwnerOrModeratorOrReadOnly
-from django.db import transaction
 from rest_framework.throttling import ScopedRateThrottle
-from .filters import DebateFilter
-from rest_framework.filters import SearchFilter
+from .filters import DebateFilter, DebateSearchFilter
+from .pagination import DebateCursorPagination
+from .conditional import ConditionalGetMixin
+from .response_cache import CachedRetrieveMixin
+from .async_views import AsyncReadMixin, AsyncScopedRateThrottle
 
 """---------------------------------   Authentication Views   ---------------------------------------"""
 
@@ -76,19 +86,26 @@ class CustomTokenBlacklistView(TokenBlacklistView):
 
 
 @extend_schema(tags=["Categories"])
-class CategoryListing(generics.ListAPIView):
+class CategoryListing(AsyncReadMixin, generics.ListAPIView):
     """
-    Handles listing of all categories.
+    Handles listing of all categories, served from the shared category registry.
     """
-    queryset = Category.objects.all()
-    serializer_class = CategorySerializer
+    serializer_class = CategoryListSerializer
     permission_classes = [AllowAny]
     throttle_scope = 'general'
-    throttle_classes = [ScopedRateThrottle]
+    throttle_classes = [AsyncScopedRateThrottle]
+
+    def get_queryset(self):
+        return get_categories()
+
+    async def aget(self, request, *args, **kwargs):
+        return Response(self.get_serializer(await aget_categories(), many=True).data)
 
 
 @extend_schema(tags=["Debates"])
-class DebateViewSet(viewsets.ModelViewSet):
+@extend_schema_view(list=extend_schema(parameters=[OpenApiParameter(
+    'expand', str, description="Comma-separated nested collections to include: `participants`, `arguments`.")]))
+class DebateViewSet(ConditionalGetMixin, CachedRetrieveMixin, AsyncReadMixin, viewsets.ModelViewSet):
     """
     Provides CRUD functionality for managing Debate instances.
 
@@ -101,24 +118,85 @@ class DebateViewSet(viewsets.ModelViewSet):
     """
     queryset = Debate.objects.select_related('category', 'author') \
         .prefetch_related('participants', 'debate_arguments') \
-        .annotate(participant_count=models.Count('participants')) \
         .order_by('-participant_count', '-created_at')
 
+    response_cache_name = 'debate_detail'
+
+    expand_prefetches = {
+        'participants': 'participants',
+        'arguments': 'debate_arguments',
+    }
+
     serializer_class = SerializerFactory(
         default=DebateSerializer,
+        list=DebateListSerializer,
         update=UpdateDebateSerializer,
         partial_update=UpdateDebateSerializer,
         create=CreateDebateSerializer
     )
-    throttle_classes = [ScopedRateThrottle]
+    throttle_classes = [AsyncScopedRateThrottle]
     throttle_scope = 'general'
 
-    filter_backends = [DjangoFilterBackend, SearchFilter]
+    pagination_class = DebateCursorPagination
+    filter_backends = [DjangoFilterBackend, DebateSearchFilter]
     filterset_class = DebateFilter
     search_fields = ['title', 'description']
 
+    def get_list_version_name(self):
+        return DEBATES
+
+    def get_object_version_name(self):
+        return debate_version_name(self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+
+    def get_version_names(self, version_name):
+        # Lists only show users when they expand the participants; any user's
+        # change may concern them. A debate follows its own users.
+        if version_name == DEBATES:
+            return [DEBATES, USERS] if 'participants' in self.get_expand() else [DEBATES]
+        debate_id = str(self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+        if not debate_id.isdigit():
+            return [version_name]
+        return [version_name, *map(user_version_name, debate_user_ids(int(debate_id)))]
+
+    async def aget_version_names(self, version_name):
+        if version_name == DEBATES:
+            return self.get_version_names(version_name)
+        debate_id = str(self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+        if not debate_id.isdigit():
+            return [version_name]
+        return [version_name, *map(user_version_name, await adebate_user_ids(int(debate_id)))]
+
+    def get_expand(self):
+        """Returns the nested collections requested with `?expand=`, ignoring unknown names."""
+        requested = self.request.query_params.get('expand', '')
+        return [name for name in self.expand_prefetches if name in requested.split(',')]
+
+    def get_queryset(self):
+        if self.action == 'retrieve':
+            return super().get_queryset()
+        if self.action != 'list':
+            # Writes only need the debate and its author for the permission check.
+            return Debate.objects.select_related('author')
+
+        argument_count = (Argument.objects.filter(debate_id=models.OuterRef('pk'))
+                          .order_by()
+                          .values('debate_id')
+                          .annotate(count=models.Count('*'))
+                          .values('count'))
+        return (Debate.objects.select_related('category', 'author')
+                .prefetch_related(*[self.expand_prefetches[name] for name in self.get_expand()])
+                .annotate(argument_count=Coalesce(models.Subquery(argument_count), 0))
+                .order_by('-participant_count', '-created_at'))
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action == 'list':
+            context['expand'] = self.get_expand()
+        return context
+
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        debate = serializer.save(author=self.request.user)
+        debate.schedule_status_transitions()
 
     def get_permissions(self):
         if self.action in ("update", "partial_update", "destroy"):
@@ -131,8 +209,8 @@ class DebateViewSet(viewsets.ModelViewSet):
 
 
 @extend_schema(tags=["Arguments"])
-class ArgumentViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, mixins.CreateModelMixin,
-                      mixins.DestroyModelMixin, viewsets.GenericViewSet):
+class ArgumentViewSet(ConditionalGetMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin,
+                      mixins.CreateModelMixin, mixins.DestroyModelMixin, viewsets.GenericViewSet):
     """
     This class provides a viewset for handling argument-related operations.
 
@@ -143,8 +221,7 @@ class ArgumentViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, mixins.C
     """
 
     queryset = Argument.objects.select_related('debate', 'author') \
-        .prefetch_related('votes') \
-        .order_by('-vote_count', '-created_at')
+        .order_by('-vote_count', '-created_at', '-id')
     serializer_class = SerializerFactory(
         default=ArgumentSerializer,
         create=CreateArgumentSerializer
@@ -161,9 +238,23 @@ class ArgumentViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, mixins.C
             permission_classes = [AllowAny]
         return [permission() for permission in permission_classes]
 
+    def get_list_version_name(self):
+        return DEBATES
+
+    def get_object_version_name(self):
+        argument_id = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        if not argument_id.isdigit():
+            return None
+        debate_id = Argument.objects.filter(pk=argument_id).values_list('debate_id', flat=True).first()
+        return debate_version_name(debate_id) if debate_id else None
+
+    @retry_on_lock
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    def perform_destroy(self, instance):
+        delete_argument(instance)
+
 
 @extend_schema(tags=["Votes"])
 class VoteView(generics.CreateAPIView):
@@ -188,27 +279,15 @@ class VoteView(generics.CreateAPIView):
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-        user = request.user
-        argument = serializer.validated_data['argument']
-
-        vote = Vote.objects.filter(argument=argument, user=user).first()
-        with transaction.atomic():
-            if vote:
-                vote.delete()
-                message = "Your vote was removed!"
-                Argument.objects.filter(id=argument.id).update(vote_count=models.F('vote_count') - 1)
-                User.objects.filter(id=argument.author.id).update(xp=models.F('xp') - 2)
-            else:
-                Vote.objects.create(argument=argument, user=user)
-                message = "Your vote was added!"
-                Argument.objects.filter(id=argument.id).update(vote_count=models.F('vote_count') + 1)
-                User.objects.filter(id=argument.author.id).update(xp=models.F('xp') + 2)
+        result = toggle_vote(request.user, serializer.validated_data['argument'])
+        message = "Your vote was added!" if result.voted else "Your vote was removed!"
 
-        return Response({"message": message}, status=status.HTTP_200_OK)
+        return Response({"message": message, "voted": result.voted, "vote_count": result.vote_count},
+                        status=status.HTTP_200_OK)
 
 
 @extend_schema(tags=["User"])
-class UserRetrieveView(mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+class UserRetrieveView(AsyncReadMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
     """
     Handles the retrieval of user details.
     """
@@ -216,7 +295,7 @@ class UserRetrieveView(mixins.RetrieveModelMixin, viewsets.GenericViewSet):
     serializer_class = UserStatSerializer
     permission_classes = [IsOwnerOrModeratorOrReadOnly]
     throttle_scope = 'general'
-    throttle_classes = [ScopedRateThrottle]
+    throttle_classes = [AsyncScopedRateThrottle]
     lookup_field = 'slug'
 
 
@@ -240,14 +319,55 @@ class JoinDebateView(views.APIView):
         except Debate.DoesNotExist:
             return Response({"message": "Debate not found."}, status=status.HTTP_404_NOT_FOUND)
 
-        if debate.status in ("Finished", "Cancelled"):
-            return Response({"message": "Debate is already finished/cancelled."}, status=status.HTTP_400_BAD_REQUEST)
+        if debate.status in ("Finished", "Canceled"):
+            return Response({"message": "Debate is already finished/canceled."}, status=status.HTTP_400_BAD_REQUEST)
 
-        if request.user in debate.participants.prefetch_related('debate_arguments'):
+        if not add_participants(debate, [request.user.pk]):
             return Response({"message": "You are already in the debate."}, status=status.HTTP_400_BAD_REQUEST)
 
-        debate.participants.add(request.user)
-        debate.save()
-
         return Response({"message": "You have joined the debate."}, status=status.HTTP_200_OK)
 
+
+@extend_schema(tags=["Debates"])
+class AddParticipantsView(generics.GenericAPIView):
+    """
+    Lets the author of a debate or a staff member add many users to it at once.
+
+    The users are added with a single bulk insert; users who already take part
+    are left as they are. The response lists which users were added and which
+    were participants already.
+    """
+    serializer_class = AddParticipantsSerializer
+    permission_classes = [IsAuthenticated, IsOwnerOrModeratorOrReadOnly]
+    throttle_classes = [ScopedRateThrottle]
+    throttle_scope = 'general'
+
+    def post(self, request, debate_id):
+        try:
+            debate = Debate.objects.select_related('author').get(id=debate_id)
+        except Debate.DoesNotExist:
+            return Response({"message": "Debate not found."}, status=status.HTTP_404_NOT_FOUND)
+        self.check_object_permissions(request, debate)
+
+        if debate.status in ("Finished", "Canceled"):
+            return Response({"message": "Debate is already finished/canceled."}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user_ids = serializer.validated_data['users']
+        added = add_participants(debate, user_ids)
+
+        return Response({"added": [user_id for user_id in user_ids if user_id in added],
+                         "already_participants": [user_id for user_id in user_ids if user_id not in added]},
+                        status=status.HTTP_200_OK)
+
+
+@extend_schema(tags=["Stats"])
+class CacheStatsView(views.APIView):
+    """
+    Reports the hit and miss counters of the response caches. Staff only.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response({name: cache_stats(name) for name in (DebateViewSet.response_cache_name,)})
@@ -21,6 +21,10 @@ class DebateAdmin(admin.ModelAdmin):
         'end_time',
         'status'
     )
+    list_select_related = (
+        'category',
+        'author',
+    )
     readonly_fields = (
         'created_at',
     )
@@ -32,6 +36,14 @@ class DebateAdmin(admin.ModelAdmin):
         'description'
     )
 
+    def save_model(self, request, obj, form, change):
+        previous_times = (form.initial.get('start_time'), form.initial.get('end_time'))
+        super().save_model(request, obj, form, change)
+        if not change:
+            obj.schedule_status_transitions()
+        elif {'start_time', 'end_time', 'status'} & set(form.changed_data):
+            obj.reschedule_status_transitions(*previous_times)
+
 
 @admin.register(Argument)
 class ArgumentAdmin(admin.ModelAdmin):
@@ -45,6 +57,10 @@ class ArgumentAdmin(admin.ModelAdmin):
         'created_at',
 
     )
+    list_select_related = (
+        'debate',
+        'author',
+    )
     readonly_fields = (
         'created_at',
     )
@@ -64,6 +80,10 @@ class VoteAdmin(admin.ModelAdmin):
         "user",
         "created_at"
     )
+    list_select_related = (
+        "argument",
+        "user",
+    )
     readonly_fields = (
         "created_at",
     )
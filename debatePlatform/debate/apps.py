@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class DebateConfig(AppConfig):
@@ -7,3 +8,14 @@ class DebateConfig(AppConfig):
 
     def ready(self):
         import debate.signals
+        post_migrate.connect(restore_search_index, sender=self)
+
+
+def restore_search_index(sender, using, plan=None, **kwargs):
+    from django.db import connections
+    from django.db.migrations.recorder import MigrationRecorder
+    from .search import ensure_search_index
+
+    connection = connections[using]
+    if (sender.label, '0006_debate_search_index') in MigrationRecorder(connection).applied_migrations():
+        ensure_search_index(connection)
@@ -0,0 +1,34 @@
+"""
+Deleting arguments, shared by the web and API views.
+
+An argument's author keeps only what the remaining rows account for, the same
+rule `reconcile_counters` recomputes: deleting the argument takes back the xp
+of its votes, buffered ones included, and for a winning argument also the win
+and its reward.
+"""
+from django.db import models, transaction
+
+from user import leaderboard
+from user.models import User, level_expression
+from .caching import touch_users_on_commit
+from .retries import retry_on_lock
+from .transitions import WINNER_REWARD_XP
+from .vote_buffer import apply_pending
+from .votes import VOTE_REWARD_XP
+
+
+@retry_on_lock
+def delete_argument(argument):
+    """Deletes `argument` and takes back the xp and wins it earned its author."""
+    with transaction.atomic():
+        argument = apply_pending([argument])[0]
+        lost_wins = 1 if argument.winner else 0
+        lost_xp = argument.vote_count * VOTE_REWARD_XP + lost_wins * WINNER_REWARD_XP
+        new_xp = models.F('xp') - lost_xp
+        User.objects.filter(pk=argument.author_id).update(
+            xp=new_xp, wins=models.F('wins') - lost_wins, level=level_expression(new_xp))
+        leaderboard.record_changes(leaderboard.XP, {argument.author_id: -lost_xp})
+        leaderboard.record_changes(leaderboard.WINS, {argument.author_id: -lost_wins})
+        if lost_xp:
+            touch_users_on_commit([argument.author_id])
+        argument.delete()
@@ -0,0 +1,235 @@
+"""
+Version keys for cached data.
+
+Cached entries include the current version of what they were built from in
+their key, so invalidation is a single `bump_version` instead of hunting down
+every key that may hold stale data. Old entries simply stop being read and
+expire on their own.
+"""
+import hashlib
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import transaction
+
+HOME_RAILS = "home_rails"
+DEBATES = "debates"
+USERS = "users"
+
+DEBATE_USERS_CACHE_TIMEOUT = 60 * 10
+
+
+def _version_key(name):
+    return f"version:{name}"
+
+
+def _modified_key(name):
+    return f"modified:{name}"
+
+
+def get_version(name):
+    key = _version_key(name)
+    version = cache.get(key)
+    if version is None:
+        # Seed from the clock so a counter that was evicted never repeats a value
+        # that may still be part of a cached key.
+        cache.add(key, time.time_ns() // 1000, None)
+        version = cache.get(key)
+    return version
+
+
+async def aget_version(name):
+    key = _version_key(name)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, time.time_ns() // 1000, None)
+        version = await cache.aget(key)
+    return version
+
+
+def _seed_versions(keys, found):
+    seed = time.time_ns() // 1000
+    for key in keys:
+        if key not in found:
+            cache.add(key, seed, None)
+
+
+def get_versions(names):
+    """`get_version` for several names with one round trip, two when some are not set yet."""
+    keys = [_version_key(name) for name in names]
+    found = cache.get_many(keys)
+    if len(found) < len(keys):
+        _seed_versions(keys, found)
+        found = cache.get_many(keys)
+    return [found[key] for key in keys]
+
+
+async def aget_versions(names):
+    keys = [_version_key(name) for name in names]
+    found = await cache.aget_many(keys)
+    if len(found) < len(keys):
+        seed = time.time_ns() // 1000
+        for key in keys:
+            if key not in found:
+                await cache.aadd(key, seed, None)
+        found = await cache.aget_many(keys)
+    return [found[key] for key in keys]
+
+
+def versions_token(versions):
+    """A single value standing for several versions, short enough for a cache key."""
+    if len(versions) == 1:
+        return str(versions[0])
+    return hashlib.md5(":".join(map(str, versions)).encode()).hexdigest()
+
+
+def bump_version(name):
+    try:
+        return cache.incr(_version_key(name))
+    except ValueError:
+        get_version(name)
+        return cache.incr(_version_key(name))
+
+
+def bump_version_on_commit(name):
+    """
+    Bumps the version once the current transaction commits, so a concurrent
+    request cannot cache data it read before the commit under the new version.
+    """
+    transaction.on_commit(lambda: bump_version(name))
+
+
+def debate_version_name(debate_id):
+    return f"debate:{debate_id}"
+
+
+def touch_debate(debate_id):
+    """
+    Marks a debate as changed: bumps its own version and the version shared by
+    all debates, and records when that happened. Returns the debate's new version.
+    """
+    now = time.time()
+    cache.set_many({_modified_key(debate_version_name(debate_id)): now, _modified_key(DEBATES): now}, None)
+    bump_version(DEBATES)
+    return bump_version(debate_version_name(debate_id))
+
+
+def touch_debate_on_commit(debate_id):
+    transaction.on_commit(lambda: touch_debate(debate_id))
+
+
+def user_version_name(user_id):
+    return f"user:{user_id}"
+
+
+def touch_users(user_ids):
+    """
+    Marks the xp, level and wins of users as changed: bumps their own versions and
+    the version shared by all users. Debates that show the users depend on these
+    versions next to their own, so a score change leaves the debates alone.
+    """
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    now = time.time()
+    cache.set_many({_modified_key(name): now for name in [USERS, *map(user_version_name, user_ids)]}, None)
+    bump_version(USERS)
+    for user_id in user_ids:
+        bump_version(user_version_name(user_id))
+
+
+def touch_users_on_commit(user_ids):
+    user_ids = set(user_ids)
+    if user_ids:
+        transaction.on_commit(lambda: touch_users(user_ids))
+
+
+def _debate_users_query(debate_id):
+    from .models import Debate
+
+    authored = Debate.objects.filter(pk=debate_id).order_by().values_list('author_id', flat=True)
+    joined = (Debate.participants.through.objects.filter(debate_id=debate_id).order_by()
+              .values_list('user_id', flat=True))
+    return authored.union(joined)
+
+
+def debate_user_ids(debate_id):
+    """
+    The ids of the author and participants of a debate, cached under the debate's
+    version, which every join bumps.
+    """
+    key = f"debate_users:{debate_id}:{get_version(debate_version_name(debate_id))}"
+    user_ids = cache.get(key)
+    if user_ids is None:
+        user_ids = sorted(_debate_users_query(debate_id))
+        cache.set(key, user_ids, DEBATE_USERS_CACHE_TIMEOUT)
+    return user_ids
+
+
+async def adebate_user_ids(debate_id):
+    key = f"debate_users:{debate_id}:{await aget_version(debate_version_name(debate_id))}"
+    user_ids = await cache.aget(key)
+    if user_ids is None:
+        user_ids = sorted([user_id async for user_id in _debate_users_query(debate_id)])
+        await cache.aset(key, user_ids, DEBATE_USERS_CACHE_TIMEOUT)
+    return user_ids
+
+
+def touch_debates(debate_ids):
+    """`touch_debate` for several debates, bumping the version shared by all debates once."""
+    debate_ids = list(debate_ids)
+    if not debate_ids:
+        return
+    now = time.time()
+    cache.set_many({_modified_key(name): now for name in [DEBATES, *map(debate_version_name, debate_ids)]}, None)
+    bump_version(DEBATES)
+    for debate_id in debate_ids:
+        bump_version(debate_version_name(debate_id))
+
+
+def get_modified(name):
+    """The time of the last touch of `name` as a UNIX timestamp, `None` if unknown."""
+    return cache.get(_modified_key(name))
+
+
+async def aget_modified(name):
+    return await cache.aget(_modified_key(name))
+
+
+def _latest(found):
+    return max(found.values()) if found else None
+
+
+def get_last_modified(names):
+    """The latest `get_modified` of several names, `None` if none is known."""
+    return _latest(cache.get_many([_modified_key(name) for name in names]))
+
+
+async def aget_last_modified(names):
+    return _latest(await cache.aget_many([_modified_key(name) for name in names]))
+
+
+def _stats_key(name, outcome):
+    return f"stats:{name}:{outcome}"
+
+
+def record_cache_access(name, hit):
+    """Counts a hit or miss of the cache called `name`; the counters live in the shared cache."""
+    key = _stats_key(name, "hits" if hit else "misses")
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+# The generic `aincr` of Django's cache backends reads and writes in two steps and
+# would lose concurrent increments.
+arecord_cache_access = sync_to_async(record_cache_access)
+
+
+def cache_stats(name):
+    counts = cache.get_many([_stats_key(name, "hits"), _stats_key(name, "misses")])
+    hits, misses = counts.get(_stats_key(name, "hits"), 0), counts.get(_stats_key(name, "misses"), 0)
+    return {"hits": hits, "misses": misses, "hit_ratio": hits / (hits + misses) if hits + misses else None}
@@ -0,0 +1,66 @@
+"""
+Category registry shared by the navigation, the category pages and the API.
+
+The categories and their number of Scheduled and Ongoing debates are read
+with one query and cached under the `categories` version key. Saving or
+deleting a category or a debate, and every bulk status transition, bumps the
+version.
+"""
+from dataclasses import dataclass
+
+from django.core.cache import cache
+from django.db import models
+
+from .caching import aget_version, get_version
+from .models import Category
+
+CATEGORIES = "categories"
+CATEGORIES_TIMEOUT = 60 * 60
+
+
+@dataclass(frozen=True)
+class CategoryEntry:
+    id: int
+    name: str
+    slug: str
+    scheduled_count: int
+    ongoing_count: int
+
+    @property
+    def active_count(self):
+        return self.scheduled_count + self.ongoing_count
+
+
+def _category_rows():
+    return (Category.objects
+            .annotate(scheduled_count=models.Count('category_debates',
+                                                   filter=models.Q(category_debates__status="Scheduled")),
+                      ongoing_count=models.Count('category_debates',
+                                                 filter=models.Q(category_debates__status="Ongoing")))
+            .order_by('pk')
+            .values_list('pk', 'name', 'slug', 'scheduled_count', 'ongoing_count'))
+
+
+def get_categories():
+    """Returns every category as a `CategoryEntry`, in id order."""
+    key = f"categories:{get_version(CATEGORIES)}"
+    categories = cache.get(key)
+    if categories is None:
+        categories = [CategoryEntry(*row) for row in _category_rows()]
+        cache.set(key, categories, CATEGORIES_TIMEOUT)
+    return categories
+
+
+async def aget_categories():
+    """Async variant of `get_categories`, sharing its cache entry."""
+    key = f"categories:{await aget_version(CATEGORIES)}"
+    categories = await cache.aget(key)
+    if categories is None:
+        categories = [CategoryEntry(*row) async for row in _category_rows()]
+        await cache.aset(key, categories, CATEGORIES_TIMEOUT)
+    return categories
+
+
+def get_category_by_slug(slug):
+    """Returns the first category with `slug`, or `None`."""
+    return next((category for category in get_categories() if category.slug == slug), None)
@@ -0,0 +1,34 @@
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from . import live
+
+
+class DebateConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Streams a debate to the page showing it: a snapshot on connect, then every
+    event published for the debate. The socket is read-only.
+    """
+
+    async def connect(self):
+        self.debate_id = self.scope['url_route']['kwargs']['debate_id']
+        self.group_name = live.group_name(self.debate_id)
+
+        # Joining the group before taking the snapshot means no event can fall
+        # in between; events already included in the snapshot are dropped by seq.
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        state = await database_sync_to_async(live.snapshot)(self.debate_id)
+
+        # Accepting first, as a rejected handshake reaches the browser as 1006 and
+        # only an accepted socket can tell it to stop reconnecting with 4404.
+        await self.accept()
+        if state is None:
+            await self.close(code=4404)
+            return
+        await self.send_json(state)
+
+    async def disconnect(self, code):
+        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def debate_event(self, message):
+        await self.send_json(message['event'])
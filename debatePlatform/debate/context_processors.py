@@ -1,10 +1,12 @@
-from .models import Category
-from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
+from .caching import get_version
+from .categories import get_categories, CATEGORIES
 
-def category_processor(request):
-    categories = cache.get('categories')
-    if not categories:
-        categories = Category.objects.all()
-        cache.set('categories', categories, 60*60)
-    return {'categories': categories}
 
+def category_processor(request):
+    # The list is only fetched when a template actually uses it, not when the
+    # cached navigation fragment is served.
+    return {
+        'categories': SimpleLazyObject(get_categories),
+        'categories_version': SimpleLazyObject(lambda: get_version(CATEGORIES)),
+    }
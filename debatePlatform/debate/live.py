@@ -0,0 +1,97 @@
+"""
+Live updates for debate pages over WebSockets.
+
+Everyone watching a debate is subscribed to its channel layer group. Writes
+publish small events to that group once their transaction commits: a new or
+deleted argument, a changed vote count, a joined participant or a new status. A
+client that (re)connects first receives a snapshot of the debate and then
+only these deltas. Every event carries a per-debate sequence number, and the
+snapshot carries the sequence number it was taken at, so the client can drop
+deltas the snapshot already includes. Two workers may deliver events out of
+order, so past the snapshot a client compares an event only with the last one
+it applied to the same argument or count. The sequence is the debate's version from
+`caching.touch_debate`, which the API also uses for its ETags. Events carry absolute values, so applying one
+twice is harmless.
+"""
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+from .caching import debate_version_name, get_version, touch_debate
+
+ARGUMENT_CREATED = "argument.created"
+ARGUMENT_DELETED = "argument.deleted"
+VOTE_COUNT_CHANGED = "vote_count.changed"
+PARTICIPANT_JOINED = "participant.joined"
+STATUS_CHANGED = "status.changed"
+
+
+def group_name(debate_id):
+    return f"debate_{debate_id}"
+
+
+def user_payload(user):
+    return {"id": user.pk, "username": user.username, "slug": user.slug}
+
+
+def argument_payload(argument):
+    return {
+        "id": argument.pk,
+        "text": argument.text,
+        "side": argument.side,
+        "vote_count": argument.vote_count,
+        "winner": argument.winner,
+        "created_at": argument.created_at.isoformat(),
+        "author": user_payload(argument.author),
+    }
+
+
+def publish(debate_id, event_type, **data):
+    """Sends an event to everyone watching the debate once the current transaction commits."""
+    def send():
+        seq = touch_debate(debate_id)
+        channel_layer = get_channel_layer()
+        if channel_layer is None:
+            return
+        event = {"type": event_type, "seq": seq, "debate": debate_id, **data}
+        async_to_sync(channel_layer.group_send)(group_name(debate_id), {"type": "debate.event", "event": event})
+
+    # A broken channel layer must not fail a write that has already committed.
+    transaction.on_commit(send, robust=True)
+
+
+def snapshot(debate_id):
+    """The state a client needs to render a debate page, or `None` if the debate does not exist."""
+    from .models import Argument, Debate
+    from .vote_buffer import apply_pending
+
+    seq = get_version(debate_version_name(debate_id))
+    debate = Debate.objects.filter(pk=debate_id).values('id', 'status', 'participant_count').first()
+    if debate is None:
+        return None
+
+    arguments = list(Argument.objects.filter(debate_id=debate_id).select_related('author').order_by('created_at', 'id'))
+    apply_pending(arguments)
+    return {
+        "type": "snapshot",
+        "seq": seq,
+        "debate": debate,
+        "arguments": [argument_payload(argument) for argument in arguments],
+    }
+
+
+def vote_tallies(debate_id):
+    """
+    The sequence number and `{argument_id: (side, vote_count)}` of a debate,
+    or `None` if the debate does not exist.
+    """
+    from .models import Argument, Debate
+    from .vote_buffer import apply_pending
+
+    seq = get_version(debate_version_name(debate_id))
+    if not Debate.objects.filter(pk=debate_id).exists():
+        return None
+
+    arguments = list(Argument.objects.filter(debate_id=debate_id).only('id', 'side', 'vote_count'))
+    apply_pending(arguments)
+    return seq, {argument.pk: (argument.side, argument.vote_count) for argument in arguments}
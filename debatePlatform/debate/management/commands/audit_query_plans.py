@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from debate.query_audit import audit
+
+
+class Command(BaseCommand):
+    help = ("Runs EXPLAIN on the hot querysets of the views and tasks and flags full table scans and "
+            "temporary B-tree sorts. Run it against a database of realistic size, e.g. filled by `seed_data`.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--plans', action='store_true', help="Print the plan of every query, not only flagged ones.")
+        parser.add_argument('--strict', action='store_true', help="Exit with an error when any query is flagged.")
+        parser.add_argument('--analyze', action='store_true',
+                            help="Run ANALYZE first, so the planner picks indexes with the statistics production has.")
+
+    def handle(self, *args, **options):
+        if options['analyze']:
+            with connections[options['database']].cursor() as cursor:
+                cursor.execute("ANALYZE")
+        reports = audit(options['database'])
+        flagged = [report for report in reports if report.issues]
+
+        for report in reports:
+            if report.issues:
+                self.stdout.write(self.style.WARNING(f"{report.query.name} ({report.query.source}): "
+                                                     f"{', '.join(report.issues)}"))
+            elif options['plans']:
+                self.stdout.write(f"{report.query.name} ({report.query.source}): ok")
+            if report.issues or options['plans']:
+                self.stdout.write("    " + report.plan.replace("\n", "\n    "))
+
+        summary = f"{len(reports)} queries audited, {len(flagged)} flagged."
+        if flagged and options['strict']:
+            raise CommandError(summary)
+        self.stdout.write(self.style.SUCCESS(summary) if not flagged else summary)
@@ -0,0 +1,195 @@
+import asyncio
+import io
+import json
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from unittest import mock
+from urllib.parse import urlsplit
+
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db.backends.utils import CursorWrapper
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.throttling import ScopedRateThrottle
+
+from api.async_views import AsyncScopedRateThrottle
+from .benchmark_endpoints import Command as EndpointBenchmark, build_scenarios, summarize
+
+READ_SCENARIOS = ['api_list', 'api_detail', 'api_search', 'api_categories']
+HOST = 'localhost'
+
+
+def with_latency(method, seconds):
+    """Wraps a `CursorWrapper` method so every query waits `seconds` first, like a round trip to a remote server."""
+    def execute(cursor, *args, **kwargs):
+        time.sleep(seconds)
+        return method(cursor, *args, **kwargs)
+    return execute
+
+
+async def asgi_get(application, path):
+    """Sends a GET through the ASGI application and returns the status code."""
+    path, _, query = path.partition('?')
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': query.encode(), 'root_path': '',
+        'headers': [(b'host', HOST.encode())], 'client': ('127.0.0.1', 0), 'server': (HOST, 80),
+    }
+    finished = asyncio.Event()
+    messages = iter([{'type': 'http.request', 'body': b'', 'more_body': False}])
+    status = None
+
+    async def receive():
+        message = next(messages, None)
+        if message is None:
+            # Django listens for a disconnect while the view runs; the client hangs up once the body is sent.
+            await finished.wait()
+            return {'type': 'http.disconnect'}
+        return message
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+        elif not message.get('more_body', False):
+            finished.set()
+
+    await application(scope, receive, send)
+    return status
+
+
+def wsgi_get(application, path):
+    """Sends a GET through the WSGI application and returns the status code."""
+    path, _, query = path.partition('?')
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query, 'SCRIPT_NAME': '',
+        'SERVER_NAME': HOST, 'SERVER_PORT': '80', 'HTTP_HOST': HOST, 'SERVER_PROTOCOL': 'HTTP/1.1',
+        'REMOTE_ADDR': '127.0.0.1', 'wsgi.version': (1, 0), 'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr, 'wsgi.multithread': True,
+        'wsgi.multiprocess': False, 'wsgi.run_once': False,
+    }
+    status = []
+    response = application(environ, lambda line, headers, exc_info=None: status.append(int(line.split()[0])))
+    try:
+        for _ in response:
+            pass
+    finally:
+        response.close()
+    return status[0]
+
+
+async def http_get(base_url, path):
+    """Sends a GET over a new connection to a running server and returns the status code."""
+    url = urlsplit(base_url)
+    reader, writer = await asyncio.open_connection(url.hostname, url.port or 80)
+    try:
+        writer.write(f"GET {url.path.rstrip('/')}{path} HTTP/1.1\r\nHost: {url.netloc}\r\n"
+                     f"Connection: close\r\n\r\n".encode())
+        await writer.drain()
+        status_line = await reader.readline()
+        while await reader.read(65536):
+            pass
+    finally:
+        writer.close()
+    return int(status_line.split()[1])
+
+
+class Command(BaseCommand):
+    help = ("Measures how many concurrent connections one process serves on the read endpoints of the API: "
+            "under ASGI, where the async views run on the event loop, and under WSGI with a fixed pool of "
+            "worker threads, where connections beyond the pool wait for a thread. Reports throughput and "
+            "p50/p95/p99 latency per concurrency level as JSON. Run `seed_data` first.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--servers', nargs='+', choices=['asgi', 'wsgi'], default=['asgi', 'wsgi'])
+        parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 8, 32, 128],
+                            help="Concurrent connections, one run per level.")
+        parser.add_argument('--threads', type=int, default=8,
+                            help="Worker threads of the WSGI process, as with `gunicorn --threads`.")
+        parser.add_argument('--db-latency', type=float, default=0,
+                            help="Milliseconds added to every query, to emulate a database on another host.")
+        parser.add_argument('--requests', type=int, default=500, help="Requests per run.")
+        parser.add_argument('--scenarios', nargs='+', choices=READ_SCENARIOS, default=READ_SCENARIOS)
+        parser.add_argument('--url', help="Base URL of a running server, e.g. one started with uvicorn or "
+                                          "gunicorn, to measure instead of the in-process applications.")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help="Also write the report to this file.")
+
+    def handle(self, *args, **options):
+        if min(options['concurrency']) < 1 or options['threads'] < 1:
+            raise CommandError("--concurrency levels and --threads must be at least 1.")
+        rng = random.Random(options['seed'])
+        factories = build_scenarios(rng, EndpointBenchmark.load_targets())
+
+        servers = [options['url']] if options['url'] else options['servers']
+        report = {'started_at': timezone.now().isoformat(), 'requests_per_run': options['requests'],
+                  'scenarios': options['scenarios'], 'wsgi_threads': options['threads'],
+                  'db_latency_ms': options['db_latency'], 'servers': {}}
+        with ExitStack() as stack:
+            if not options['url']:
+                # As in production: no debug toolbar and no query log.
+                stack.enter_context(override_settings(DEBUG=False))
+                stack.enter_context(mock.patch.object(ScopedRateThrottle, 'allow_request', return_value=True))
+                stack.enter_context(mock.patch.object(AsyncScopedRateThrottle, 'aallow_request', return_value=True))
+            if options['db_latency'] and not options['url']:
+                for name in ('execute', 'executemany'):
+                    stack.enter_context(mock.patch.object(
+                        CursorWrapper, name, with_latency(getattr(CursorWrapper, name), options['db_latency'] / 1000)))
+            for server in servers:
+                runs = report['servers'][server] = {}
+                for concurrency in options['concurrency']:
+                    paths = [factories[rng.choice(options['scenarios'])]().path for _ in range(options['requests'])]
+                    runs[concurrency] = asyncio.run(self.run(server, options, paths, concurrency))
+                    self.stderr.write(f"{server}, {concurrency} concurrent: {runs[concurrency]['throughput_rps']} "
+                                      f"req/s, p95 {runs[concurrency]['latency_ms']['p95']} ms, "
+                                      f"{runs[concurrency]['errors']} errors")
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output + "\n")
+        self.stdout.write(output)
+
+    @staticmethod
+    async def run(server, options, paths, concurrency):
+        """Keeps `concurrency` connections busy, each sending its next request once the last one was answered."""
+        pool = None
+        if options['url']:
+            async def send(path):
+                return await http_get(options['url'], path)
+        elif server == 'asgi':
+            application = get_asgi_application()
+
+            async def send(path):
+                return await asgi_get(application, path)
+        else:
+            application = get_wsgi_application()
+            pool = ThreadPoolExecutor(max_workers=options['threads'])
+
+            async def send(path):
+                return await asyncio.get_running_loop().run_in_executor(pool, wsgi_get, application, path)
+
+        latencies, statuses = [], {}
+        remaining = iter(paths)
+
+        async def connection():
+            for path in remaining:
+                began = time.perf_counter()
+                try:
+                    status = await send(path)
+                except OSError:
+                    status = 599
+                latencies.append((time.perf_counter() - began) * 1000)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        began = time.perf_counter()
+        await asyncio.gather(*[connection() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - began
+        if pool is not None:
+            pool.shutdown()
+        return summarize(latencies, statuses, elapsed)
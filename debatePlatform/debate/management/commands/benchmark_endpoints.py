@@ -0,0 +1,222 @@
+import json
+import random
+import statistics
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+from contextlib import ExitStack
+from dataclasses import dataclass
+from unittest import mock
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.utils import timezone
+from rest_framework.throttling import ScopedRateThrottle
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.async_views import AsyncScopedRateThrottle
+from debate.models import Argument, Debate
+from debate.seeding import WORDS
+from user.models import User
+
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    path: str
+    auth: bool = False
+    body: dict = None
+
+
+def build_scenarios(rng, targets):
+    """Request factories per scenario; each call returns the next request to send."""
+    def pick(name):
+        return rng.choice(targets[name])
+
+    return {
+        'listing': lambda: Scenario('listing', 'GET', "/debates/"),
+        'detail': lambda: Scenario('detail', 'GET', f"/debates/{pick('debates')}/"),
+        'search': lambda: Scenario('search', 'GET', f"/search/?query={rng.choice(WORDS)}"),
+        'vote': lambda: Scenario('vote', 'POST', "/api/vote/", auth=True, body={'argument': pick('arguments')}),
+        'join': lambda: Scenario('join', 'POST', f"/api/debates/{pick('open_debates')}/join/", auth=True),
+        'api_list': lambda: Scenario('api_list', 'GET', "/api/debates/"),
+        'api_detail': lambda: Scenario('api_detail', 'GET', f"/api/debates/{pick('debates')}/"),
+        'api_search': lambda: Scenario('api_search', 'GET', f"/api/debates/?search={rng.choice(WORDS)}"),
+        'api_categories': lambda: Scenario('api_categories', 'GET', "/api/categories/"),
+    }
+
+
+SCENARIOS = ['listing', 'detail', 'search', 'vote', 'join', 'api_list', 'api_detail', 'api_search',
+             'api_categories']
+
+
+class InProcessTransport:
+    """Sends requests through the Django test client, in this process."""
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def send(self, scenario, token):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = Client(raise_request_exception=False)
+        headers = {'HTTP_AUTHORIZATION': f"Bearer {token}"} if token else {}
+        if scenario.method == 'GET':
+            return client.get(scenario.path, **headers).status_code
+        return client.post(scenario.path, scenario.body or {}, content_type='application/json',
+                           **headers).status_code
+
+    def close(self):
+        connections.close_all()
+
+
+class HTTPTransport:
+    """Sends requests to a running server."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def send(self, scenario, token):
+        data = json.dumps(scenario.body or {}).encode() if scenario.method == 'POST' else None
+        request = urllib.request.Request(self.base_url + scenario.path, data=data, method=scenario.method,
+                                         headers={'Content-Type': 'application/json'})
+        if token:
+            request.add_header('Authorization', f"Bearer {token}")
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as error:
+            return error.code
+
+    def close(self):
+        pass
+
+
+def summarize(latencies, statuses, elapsed):
+    latencies = sorted(latencies)
+    percentiles = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else latencies * 99
+    return {
+        'requests': len(latencies),
+        'errors': sum(count for status, count in statuses.items() if status >= 400),
+        'status': {str(status): count for status, count in sorted(statuses.items())},
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else None,
+        'latency_ms': {
+            'mean': round(statistics.fmean(latencies), 2),
+            'p50': round(percentiles[49], 2),
+            'p95': round(percentiles[94], 2),
+            'p99': round(percentiles[98], 2),
+            'max': round(latencies[-1], 2),
+        },
+    }
+
+
+class Command(BaseCommand):
+    help = ("Drives the listing, detail, search, vote, join and API endpoints with concurrent requests and "
+            "reports throughput and p50/p95/p99 latency per scenario as JSON. Run `seed_data` first.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=SCENARIOS)
+        parser.add_argument('--requests', type=int, default=200, help="Requests per scenario.")
+        parser.add_argument('--concurrency', type=int, default=4, help="Concurrent clients.")
+        parser.add_argument('--warmup', type=int, default=10, help="Untimed requests per scenario.")
+        parser.add_argument('--url', help="Base URL of a running server. Defaults to the in-process test client.")
+        parser.add_argument('--users', type=int, default=50,
+                            help="Number of users the authenticated requests are spread over.")
+        parser.add_argument('--keep-throttling', action='store_true',
+                            help="Keep the API rate limits when running in-process.")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help="Also write the report to this file.")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        targets = self.load_targets()
+        tokens = [str(RefreshToken.for_user(user).access_token)
+                  for user in User.objects.filter(is_active=True).order_by('?')[:options['users']]]
+        if not tokens:
+            raise CommandError("No users to authenticate as. Run `seed_data` first.")
+
+        transport = HTTPTransport(options['url']) if options['url'] else InProcessTransport()
+        factories = build_scenarios(rng, targets)
+        report = {
+            'commit': self.current_commit(),
+            'started_at': timezone.now().isoformat(),
+            'target': options['url'] or "in-process",
+            'concurrency': options['concurrency'],
+            'requests_per_scenario': options['requests'],
+            'scenarios': {},
+        }
+
+        with ExitStack() as stack:
+            if not options['url'] and not options['keep_throttling']:
+                stack.enter_context(mock.patch.object(ScopedRateThrottle, 'allow_request', return_value=True))
+                stack.enter_context(mock.patch.object(AsyncScopedRateThrottle, 'aallow_request', return_value=True))
+            for name in options['scenarios']:
+                self.run(transport, factories[name], tokens, rng, options['warmup'], 1)
+                report['scenarios'][name] = self.run(transport, factories[name], tokens, rng, options['requests'],
+                                                     options['concurrency'])
+                self.stderr.write(f"{name}: {report['scenarios'][name]['throughput_rps']} req/s, "
+                                  f"p95 {report['scenarios'][name]['latency_ms']['p95']} ms")
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output + "\n")
+        self.stdout.write(output)
+
+    @staticmethod
+    def load_targets():
+        targets = {
+            'debates': list(Debate.objects.order_by('?').values_list('pk', flat=True)[:1000]),
+            'open_debates': list(Debate.objects.filter(status__in=("Scheduled", "Ongoing"))
+                                 .order_by('?').values_list('pk', flat=True)[:1000]),
+            'arguments': list(Argument.objects.filter(debate__status="Ongoing")
+                              .order_by('?').values_list('pk', flat=True)[:1000]),
+        }
+        empty = [name for name, ids in targets.items() if not ids]
+        if empty:
+            raise CommandError(f"No {', '.join(empty)} to benchmark against. Run `seed_data` first.")
+        return targets
+
+    @staticmethod
+    def run(transport, factory, tokens, rng, count, concurrency):
+        latencies, statuses = [], {}
+        lock = threading.Lock()
+        remaining = iter(range(count))
+
+        def worker():
+            try:
+                while True:
+                    with lock:
+                        if next(remaining, None) is None:
+                            return
+                        scenario = factory()
+                        token = rng.choice(tokens) if scenario.auth else None
+                    began = time.perf_counter()
+                    status = transport.send(scenario, token)
+                    latency = (time.perf_counter() - began) * 1000
+                    with lock:
+                        latencies.append(latency)
+                        statuses[status] = statuses.get(status, 0) + 1
+            finally:
+                transport.close()
+
+        began = time.perf_counter()
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return summarize(latencies, statuses, time.perf_counter() - began)
+
+    @staticmethod
+    def current_commit():
+        try:
+            return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                  check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,115 @@
+import json
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+from django.db import models, transaction
+from django.utils import timezone
+
+from debate.models import Debate
+from debate.search import search_debates
+from user.models import User
+
+TOPICS = [
+    "climate", "policy", "education", "freedom", "economy", "energy", "nuclear", "privacy", "internet", "health",
+    "vaccine", "taxes", "income", "universal", "basic", "school", "uniform", "space", "exploration", "artificial",
+    "intelligence", "robots", "jobs", "automation", "democracy", "voting", "election", "social", "media", "censorship",
+    "speech", "animal", "rights", "zoo", "meat", "vegan", "diet", "sports", "doping", "olympics", "city", "transport",
+    "cars", "bicycles", "housing", "rent", "control", "minimum", "wage", "immigration", "borders", "trade", "tariffs",
+]
+SYLLABLES = ["ka", "lo", "mi", "ren", "tas", "vo", "pel", "dri", "sun", "gar", "ne", "bu", "fo", "ith", "qua", "zel"]
+
+
+def build_vocabulary(rng, size=20_000):
+    """Synthetic words with Zipf-like weights, so common words are common and topics are rare."""
+    words = sorted({"".join(rng.choices(SYLLABLES, k=rng.randint(2, 4))) for _ in range(size)})
+    rng.shuffle(words)
+    weights = [1 / rank for rank in range(1, len(words) + 1)]
+    return words, weights
+
+
+class Command(BaseCommand):
+    help = ("Compares the latency of the old substring search with the full-text index at growing "
+            "numbers of debates. Everything is seeded inside a transaction that is rolled back.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+        parser.add_argument('--repeat', type=int, default=5, help="Timed runs per query and size.")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--json', action='store_true', help="Print the results as JSON.")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        vocabulary = build_vocabulary(rng)
+        queries = ["climate", "universal basic income", "zoo", "robots jobs automation"]
+        results = []
+
+        with transaction.atomic():
+            author = User.objects.create(username=f"benchmark-{time.time_ns()}", slug=f"benchmark-{time.time_ns()}")
+            seeded = Debate.objects.count()
+
+            for size in sorted(options['sizes']):
+                if size > seeded:
+                    self.seed(author, size - seeded, rng, vocabulary, options['batch_size'])
+                    seeded = size
+
+                for query in queries:
+                    results.append({
+                        "debates": seeded,
+                        "query": query,
+                        "substring_ms": self.measure(self.substring_search, query, options['repeat']),
+                        "fulltext_ms": self.measure(self.fulltext_search, query, options['repeat']),
+                    })
+                    if not options['json']:
+                        row = results[-1]
+                        self.stdout.write(f"{row['debates']:>9} debates  {query!r:<28} "
+                                          f"substring {row['substring_ms']['p50']:>9.2f} ms  "
+                                          f"full-text {row['fulltext_ms']['p50']:>9.2f} ms")
+
+            transaction.set_rollback(True)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+
+    def seed(self, author, count, rng, vocabulary, batch_size):
+        words, weights = vocabulary
+        now = timezone.now()
+
+        def text(length):
+            chosen = rng.choices(words, weights, k=length)
+            chosen[rng.randrange(length)] = rng.choice(TOPICS)
+            return " ".join(chosen)
+
+        for offset in range(0, count, batch_size):
+            Debate.objects.bulk_create([
+                Debate(
+                    title=text(6).capitalize(),
+                    description=text(40),
+                    author=author,
+                    start_time=now,
+                    end_time=now,
+                    status="Finished",
+                )
+                for _ in range(min(batch_size, count - offset))
+            ])
+
+    @staticmethod
+    def substring_search(query):
+        return (Debate.objects.filter(models.Q(title__contains=query) | models.Q(description__contains=query))
+                .order_by('-participant_count', '-created_at'))
+
+    @staticmethod
+    def fulltext_search(query):
+        return search_debates(Debate.objects.all(), query)
+
+    @staticmethod
+    def measure(search, query, repeat):
+        timings = []
+        for _ in range(repeat):
+            began = time.perf_counter()
+            list(Paginator(search(query), 8).page(1))
+            timings.append((time.perf_counter() - began) * 1000)
+        return {"p50": statistics.median(timings), "max": max(timings)}
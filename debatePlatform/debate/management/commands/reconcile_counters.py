@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from debate.reconciliation import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = ("Recomputes Argument.vote_count and User.xp, wins and level from the Vote and Argument tables. "
+            "With --dry-run, only reports the mismatches.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help="Number of ids checked and corrected per transaction.")
+        parser.add_argument('--dry-run', action='store_true', help="Report mismatches without correcting them.")
+
+    def handle(self, *args, **options):
+        results = reconcile_counters(options['chunk_size'], options['dry_run'])
+
+        for name, result in results.items():
+            for mismatch in result.mismatches:
+                self.stdout.write(f"{mismatch.model} {mismatch.pk}: {mismatch.field} "
+                                  f"{mismatch.stored} -> {mismatch.expected}")
+            if options['dry_run']:
+                self.stdout.write(self.style.WARNING(
+                    f"Checked {result.checked} {name}, {len(result.mismatches)} mismatches found."))
+            else:
+                self.stdout.write(self.style.SUCCESS(
+                    f"Checked {result.checked} {name}, {result.corrected} corrected."))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from debate.models import Debate, counted_participants
+
+
+class Command(BaseCommand):
+    help = "Recomputes Debate.participant_count from the participants table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help="Number of debate ids recounted per transaction.")
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        last_id = Debate.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        corrected = 0
+
+        for start in range(0, last_id + 1, chunk_size):
+            with transaction.atomic():
+                corrected += (Debate.objects
+                              .filter(pk__gte=start, pk__lt=start + chunk_size)
+                              .exclude(participant_count=counted_participants())
+                              .update(participant_count=counted_participants()))
+
+        self.stdout.write(self.style.SUCCESS(f"Recounted participants, {corrected} debates corrected."))
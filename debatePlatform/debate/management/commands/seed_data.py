@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from debate.seeding import LAYOUTS, seed
+
+
+class Command(BaseCommand):
+    help = ("Bulk-creates synthetic users, categories, debates in every status, participants, arguments and votes "
+            "with realistic skew, for load testing on a local database.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--categories', type=int, default=10)
+        parser.add_argument('--debates', type=int, default=500)
+        parser.add_argument('--mean-participants', type=int, default=12,
+                            help="Average number of participants per debate; the distribution is long-tailed.")
+        parser.add_argument('--password', default="password", help="Password of every seeded user.")
+        parser.add_argument('--prefix', help="Username prefix; defaults to one derived from the current time.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--seed', type=int, help="Random seed, for reproducible data sets.")
+        parser.add_argument('--layout', choices=LAYOUTS, default="skewed",
+                            help="Shape of the data; 'uniform' gives every debate the same size.")
+
+    def handle(self, *args, **options):
+        summary = seed(users=options['users'], categories=options['categories'], debates=options['debates'],
+                       mean_participants=options['mean_participants'], password=options['password'],
+                       prefix=options['prefix'], batch_size=options['batch_size'], seed=options['seed'],
+                       layout=options['layout'], log=self.stdout.write)
+
+        debates = ", ".join(f"{count} {status.lower()}" for status, count in sorted(summary.debates.items()))
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {summary.users} users, {summary.categories} categories, {sum(summary.debates.values())} "
+            f"debates ({debates}), {summary.participants} participants, {summary.arguments} arguments and "
+            f"{summary.votes} votes."))
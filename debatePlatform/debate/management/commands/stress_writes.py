@@ -0,0 +1,141 @@
+import json
+import random
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client, override_settings
+from django.utils import timezone
+
+from debate.models import Argument, Debate
+from user.models import User
+from .benchmark_endpoints import summarize
+
+OPERATIONS = {'vote': 6, 'join': 2, 'argument': 1, 'read': 1}
+MODES = ['current', 'default', 'concurrent']
+
+
+def sqlite_mode(mode):
+    """
+    Switches the SQLite connections opened from now on to the stock settings
+    (`default`: rollback journal, deferred transactions, no lock retries) or to
+    `SQLITE_CONCURRENT_OPTIONS` with lock retries (`concurrent`). Returns the
+    contexts to enter; `current` keeps the configured settings.
+    """
+    options = connections.settings['default']['OPTIONS']
+    original = dict(options)
+    stack = ExitStack()
+    stack.callback(lambda: (options.clear(), options.update(original), connections.close_all()))
+    if mode == 'default':
+        options.pop('init_command', None)
+        options.pop('transaction_mode', None)
+        stack.enter_context(override_settings(DATABASE_LOCK_RETRIES=0))
+    elif mode == 'concurrent':
+        options.update(settings.SQLITE_CONCURRENT_OPTIONS)
+    connections.close_all()
+    if mode == 'default':
+        # The journal mode is stored in the database file, so WAL stays on until it is switched back.
+        with connections['default'].cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode=DELETE")
+    return stack
+
+
+class Command(BaseCommand):
+    help = ("Sends votes, joins and new arguments from many threads at once, next to readers of the debate "
+            "listing, and reports throughput and error rate per operation as JSON. `--modes default concurrent` "
+            "runs it with the stock SQLite settings and again with SQLITE_CONCURRENT_OPTIONS and lock retries, "
+            "for a before/after comparison. It writes to the database; run it against data from `seed_data`.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', nargs='+', choices=MODES, default=['current'])
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--requests', type=int, default=2000, help="Requests per mode, over all threads.")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help="Also write the report to this file.")
+
+    def handle(self, *args, **options):
+        if options['modes'] != ['current'] and connections['default'].vendor != 'sqlite':
+            raise CommandError("--modes default and concurrent only apply to SQLite.")
+        rng = random.Random(options['seed'])
+        users = list(User.objects.filter(is_active=True).order_by('?')[:options['threads']])
+        debates = list(Debate.objects.filter(status="Ongoing").values_list('pk', flat=True)[:500])
+        arguments = list(Argument.objects.filter(debate__status="Ongoing").values_list('pk', flat=True)[:2000])
+        if len(users) < options['threads'] or not debates or not arguments:
+            raise CommandError("Not enough users, ongoing debates or arguments. Run `seed_data` first.")
+
+        report = {'started_at': timezone.now().isoformat(), 'threads': options['threads'],
+                  'requests': options['requests'], 'modes': {}}
+        for mode in options['modes']:
+            with sqlite_mode(mode):
+                report['modes'][mode] = self.run(users, debates, arguments, rng, options['requests'])
+            overall = report['modes'][mode]['all']
+            self.stderr.write(f"{mode}: {overall['throughput_rps']} req/s, {overall['errors']} errors "
+                              f"({overall['error_rate']:.1%})")
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output + "\n")
+        self.stdout.write(output)
+
+    @staticmethod
+    def request(client, operation, rng, debates, arguments):
+        headers = {'HTTP_REFERER': "/debates/"}
+        if operation == 'vote':
+            return client.post(f"/{rng.choice(arguments)}/vote/", **headers)
+        if operation == 'join':
+            return client.post(f"/{rng.choice(debates)}/join/", **headers)
+        if operation == 'argument':
+            return client.post(f"/{rng.choice(debates)}/create_argument/",
+                               {'side': rng.choice(("Pro", "Con")), 'text': "A stress-test argument."}, **headers)
+        return client.get("/debates/")
+
+    def run(self, users, debates, arguments, rng, count):
+        names, weights = zip(*OPERATIONS.items())
+        results = {name: ([], {}) for name in names}
+        lock = threading.Lock()
+        remaining = iter(range(count))
+        clients = []
+        for user in users:
+            clients.append(Client(raise_request_exception=False))
+            clients[-1].force_login(user)
+
+        def worker(client):
+            try:
+                while True:
+                    with lock:
+                        if next(remaining, None) is None:
+                            return
+                        operation = rng.choices(names, weights)[0]
+                    began = time.perf_counter()
+                    status = self.request(client, operation, rng, debates, arguments).status_code
+                    latency = (time.perf_counter() - began) * 1000
+                    with lock:
+                        latencies, statuses = results[operation]
+                        latencies.append(latency)
+                        statuses[status] = statuses.get(status, 0) + 1
+            finally:
+                connections.close_all()
+
+        began = time.perf_counter()
+        threads = [threading.Thread(target=worker, args=(client,)) for client in clients]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - began
+
+        summary = {name: summarize(latencies, statuses, elapsed)
+                   for name, (latencies, statuses) in results.items() if latencies}
+        everything = [latency for latencies, _ in results.values() for latency in latencies]
+        statuses = {}
+        for _, counts in results.values():
+            for status, number in counts.items():
+                statuses[status] = statuses.get(status, 0) + number
+        summary['all'] = summarize(everything, statuses, elapsed)
+        for numbers in summary.values():
+            numbers['error_rate'] = round(numbers['errors'] / numbers['requests'], 4)
+        return summary
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.3 on 2026-10-18 12:07
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('debate', '0002_category_slug'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='debate',
+            index=models.Index(fields=['status', 'start_time'], name='debate_status_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='debate',
+            index=models.Index(fields=['status', 'end_time'], name='debate_status_end_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.3 on 2026-10-18 12:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('debate', '0003_debate_status_time_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='debate',
+            index=models.Index(fields=['status', 'created_at'], name='debate_status_created_idx'),
+        ),
+    ]
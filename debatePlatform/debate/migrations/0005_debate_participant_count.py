@@ -0,0 +1,34 @@
+# Generated by Django 5.1.3 on 2026-10-18 12:10
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def count_participants(apps, schema_editor):
+    Debate = apps.get_model('debate', 'Debate')
+    Participant = Debate.participants.through
+    participants = (Participant.objects.filter(debate_id=models.OuterRef('pk'))
+                    .order_by().values('debate_id').annotate(count=models.Count('*')).values('count'))
+    Debate.objects.update(participant_count=Coalesce(models.Subquery(participants), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('debate', '0004_debate_status_created_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='debate',
+            name='participant_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Participant count'),
+        ),
+        migrations.RunPython(count_participants, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='debate',
+            index=models.Index(fields=['-participant_count', '-created_at'], name='debate_popularity_idx'),
+        ),
+    ]
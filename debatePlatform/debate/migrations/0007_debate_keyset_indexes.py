@@ -0,0 +1,31 @@
+# Generated by Django 5.1.3 on 2026-10-18 12:16
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('debate', '0006_debate_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='debate',
+            name='debate_popularity_idx',
+        ),
+        migrations.AddIndex(
+            model_name='debate',
+            index=models.Index(fields=['-participant_count', '-created_at', '-id'], name='debate_popularity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='debate',
+            index=models.Index(fields=['category', '-participant_count', '-created_at', '-id'], name='debate_category_popularity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='debate',
+            index=models.Index(fields=['status', '-participant_count', '-created_at', '-id'], name='debate_status_popularity_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.3 on 2026-10-18 12:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('debate', '0007_debate_keyset_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='argument',
+            index=models.Index(fields=['debate', '-vote_count', '-created_at', '-id'], name='argument_debate_ranking_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='argument',
+            index=models.Index(fields=['-vote_count', '-created_at', '-id'], name='argument_ranking_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='debate',
+            index=models.Index(fields=['author', '-created_at'], name='debate_author_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='debate',
+            index=models.Index(fields=['-created_at'], name='debate_created_idx'),
+        ),
+    ]
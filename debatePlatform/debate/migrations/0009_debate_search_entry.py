@@ -0,0 +1,25 @@
+# Generated by Django 5.1.3 on 2026-10-18 13:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('debate', '0008_argument_ranking_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DebateSearchEntry',
+            fields=[
+                ('debate', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_entry', serialize=False, to='debate.debate')),
+                ('document', models.TextField(db_column='debate_debate_fts')),
+            ],
+            options={
+                'db_table': 'debate_debate_fts',
+                'managed': False,
+            },
+        ),
+    ]
@@ -5,6 +5,7 @@ from user.models import User
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 from django.db import transaction
+from django.db.models.functions import Coalesce
 
 class Category(models.Model):
     name = models.CharField(max_length=30, verbose_name=_("Name"))
@@ -39,10 +40,53 @@ class Debate(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="Scheduled", verbose_name=_("Status"))
     participants = models.ManyToManyField(User, related_name="participated_debates", verbose_name=_("Participants"),
                                           blank=True)
+    participant_count = models.PositiveIntegerField(default=0, editable=False, verbose_name=_("Participant count"))
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'start_time'], name='debate_status_start_idx'),
+            models.Index(fields=['status', 'end_time'], name='debate_status_end_idx'),
+            models.Index(fields=['status', 'created_at'], name='debate_status_created_idx'),
+            models.Index(fields=['-participant_count', '-created_at', '-id'], name='debate_popularity_idx'),
+            models.Index(fields=['category', '-participant_count', '-created_at', '-id'],
+                         name='debate_category_popularity_idx'),
+            models.Index(fields=['status', '-participant_count', '-created_at', '-id'],
+                         name='debate_status_popularity_idx'),
+            models.Index(fields=['author', '-created_at'], name='debate_author_created_idx'),
+            models.Index(fields=['-created_at'], name='debate_created_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembering the status as loaded lets a save tell which transition it makes
+        # without reading the row again.
+        if 'status' in field_names:
+            instance._loaded_status = values[field_names.index('status')]
+        return instance
+
+    @property
+    def previous_status(self):
+        """The status currently stored in the database, `None` for unsaved debates."""
+        if self._state.adding:
+            return None
+        if not hasattr(self, '_loaded_status'):
+            self._loaded_status = Debate.objects.filter(pk=self.pk).values_list('status', flat=True).first()
+        return self._loaded_status
+
+    def save(self, *args, **kwargs):
+        # participant_count is only ever changed with F-expressions by the participants
+        # m2m_changed receiver, so a plain save() of a loaded debate must not write back
+        # the value it read earlier.
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name != 'participant_count']
+        super().save(*args, **kwargs)
+        self._loaded_status = self.status
+
     def update_status(self):
         previous_status = self.status
 
@@ -56,24 +100,26 @@ class Debate(models.Model):
         if previous_status != self.status:
             self.save()
 
+    def schedule_status_transitions(self):
+        """Queues the Scheduled -> Ongoing -> Finished transitions once the current transaction commits."""
+        from .tasks import schedule_status_transitions
+        transaction.on_commit(lambda: schedule_status_transitions(self))
+
+    def reschedule_status_transitions(self, previous_start_time, previous_end_time):
+        """Drops the transitions queued for the previous times and queues them for the current ones."""
+        from .tasks import revoke_status_transitions
+        transaction.on_commit(lambda: revoke_status_transitions(self.pk, previous_start_time, previous_end_time))
+        self.schedule_status_transitions()
+
     def cancel_debate(self):
+        from .tasks import revoke_status_transitions
         self.status = "Canceled"
         self.save()
+        transaction.on_commit(lambda: revoke_status_transitions(self.pk, self.start_time, self.end_time))
 
     def finish_debate(self):
-        winner = self.debate_arguments.select_related('author').order_by('-vote_count').first()
-        if not winner or winner.vote_count == 0:
-            return
-
-        reward_xp = 150
-
-        with transaction.atomic():
-            winner.winner = True
-            winner.author.xp += reward_xp
-            winner.author.wins += 1
-            winner.author.save()
-            winner.save()
-
+        from .transitions import finalize_debates
+        finalize_debates([self.pk])
 
     def clean(self):
         if not self.start_time or not self.end_time:
@@ -86,6 +132,35 @@ class Debate(models.Model):
             raise ValidationError(_("Start time must be in the future."))
 
 
+class DebateSearchEntry(models.Model):
+    """
+    A row of the SQLite full-text index of debates (see `debate/search.py`). It
+    shares its rowid with the debate, so searches join it like a one-to-one
+    relation. The table is created by migration `0006_debate_search_index` and
+    filled by triggers, never through this model.
+    """
+    debate = models.OneToOneField(Debate, on_delete=models.DO_NOTHING, primary_key=True, db_column='rowid',
+                                  related_name='search_entry')
+    # The hidden FTS5 column named after the table: MATCH on it searches every
+    # indexed column and bm25() takes it to rank the matched row.
+    document = models.TextField(db_column='debate_debate_fts')
+
+    class Meta:
+        managed = False
+        db_table = 'debate_debate_fts'
+
+
+def counted_participants():
+    """Expression that counts a debate's participants, for recomputing `Debate.participant_count`."""
+    participants = (Debate.participants.through.objects
+                    .filter(debate_id=models.OuterRef('pk'))
+                    .order_by()
+                    .values('debate_id')
+                    .annotate(count=models.Count('*'))
+                    .values('count'))
+    return Coalesce(models.Subquery(participants), 0)
+
+
 class Argument(models.Model):
     SIDE_CHOICES = [
         ("Pro", "Pro"),
@@ -107,6 +182,12 @@ class Argument(models.Model):
     def __str__(self):
         return self.text[:100]
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['debate', '-vote_count', '-created_at', '-id'], name='argument_debate_ranking_idx'),
+            models.Index(fields=['-vote_count', '-created_at', '-id'], name='argument_ranking_idx'),
+        ]
+
 
 class Vote(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="user_votes", verbose_name=_("User"))
@@ -118,3 +199,13 @@ class Vote(models.Model):
 
     class Meta:
         unique_together = ("user", "argument")
+
+
+class VoteBufferFlush(models.Model):
+    """
+    Token of a vote buffer snapshot whose deltas were written to the database,
+    committed in the same transaction, so a flush that stopped before dropping
+    the snapshot is not applied twice (see `debate/vote_buffer.py`).
+    """
+    token = models.CharField(max_length=32, unique=True)
+    flushed_at = models.DateTimeField(auto_now_add=True)
@@ -0,0 +1,194 @@
+"""
+Keyset (cursor) pagination for debate listings.
+
+Instead of OFFSET/LIMIT, a page starts right after the sort key of the last
+row of the previous page, so the database seeks straight to it in the
+`(-participant_count, -created_at, -id)` index and page N costs the same as
+page 1. No COUNT(*) is needed either: one extra row tells whether a next page
+exists.
+"""
+import base64
+import binascii
+import hashlib
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db import connections, models
+from django.db.models.expressions import RawSQL
+from django.http import Http404
+from django.utils.dateparse import parse_datetime
+
+ORDERING = ('participant_count', 'created_at', 'id')
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(direction, debate):
+    position = [getattr(debate, field) for field in ORDERING]
+    position[1] = position[1].isoformat()
+    payload = json.dumps([direction, *position], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        direction, participant_count, created_at, pk = json.loads(base64.urlsafe_b64decode(padded))
+        created_at = parse_datetime(created_at)
+        if direction not in ('next', 'previous') or created_at is None:
+            raise InvalidCursor(cursor)
+        return direction, (int(participant_count), created_at, int(pk))
+    except (TypeError, ValueError, binascii.Error) as exc:
+        raise InvalidCursor(cursor) from exc
+
+
+class KeysetPage:
+    """A page of objects with the cursors of its neighbours (`None` at either end)."""
+    is_keyset = True
+
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """Paginates debates by `(participant_count, created_at, id)`, most popular first."""
+
+    def __init__(self, queryset, per_page):
+        self.queryset = queryset
+        self.per_page = per_page
+
+    def _seek(self, queryset, position, operator):
+        # A row-value comparison lets both SQLite and PostgreSQL turn the cursor into an
+        # index range instead of filtering rows one by one.
+        connection = connections[queryset.db]
+        participant_count, created_at, pk = position
+        table = connection.ops.quote_name(queryset.model._meta.db_table)
+        columns = ", ".join(f"{table}.{connection.ops.quote_name(field)}" for field in ORDERING)
+        condition = RawSQL(f"({columns}) {operator} (%s, %s, %s)",
+                           (participant_count, connection.ops.adapt_datetimefield_value(created_at), pk),
+                           output_field=models.BooleanField())
+        return queryset.filter(condition)
+
+    def _query(self, cursor):
+        """The query for the page at `cursor`, one row longer than a page, and the direction it reads in."""
+        descending = self.queryset.order_by(*[f'-{field}' for field in ORDERING])
+        if not cursor:
+            return descending[:self.per_page + 1], None
+
+        direction, position = decode_cursor(cursor)
+        if direction == 'next':
+            return self._seek(descending, position, '<')[:self.per_page + 1], direction
+        ascending = self.queryset.order_by(*ORDERING)
+        return self._seek(ascending, position, '>')[:self.per_page + 1], direction
+
+    def _page(self, rows, direction):
+        has_more, rows = len(rows) > self.per_page, rows[:self.per_page]
+        if direction is None:
+            return KeysetPage(rows, encode_cursor('next', rows[-1]) if has_more else None, None)
+
+        if direction == 'next':
+            next_cursor = encode_cursor('next', rows[-1]) if has_more else None
+            previous_cursor = encode_cursor('previous', rows[0]) if rows else None
+        else:
+            rows = rows[::-1]
+            next_cursor = encode_cursor('next', rows[-1]) if rows else None
+            previous_cursor = encode_cursor('previous', rows[0]) if has_more else None
+
+        return KeysetPage(rows, next_cursor, previous_cursor)
+
+    def page(self, cursor=None):
+        query, direction = self._query(cursor)
+        return self._page(list(query), direction)
+
+    async def apage(self, cursor=None):
+        query, direction = self._query(cursor)
+        return self._page([row async for row in query], direction)
+
+
+class KeysetPaginationMixin:
+    """
+    Replaces ListView's page-number pagination with `KeysetPaginator`. The page
+    is selected with the `cursor` query parameter; the template gets `page_obj`
+    with `next_cursor` and `previous_cursor`.
+    """
+    cursor_kwarg = 'cursor'
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = KeysetPaginator(queryset, page_size)
+        try:
+            page = paginator.page(self.request.GET.get(self.cursor_kwarg))
+        except InvalidCursor:
+            raise Http404("Invalid cursor.")
+        return paginator, page, page.object_list, page.has_other_pages()
+
+
+def _count_key(sql, params):
+    return 'estimated_count:' + hashlib.sha1(f"{sql}{params!r}".encode()).hexdigest()
+
+
+def estimate_count(queryset, timeout=60):
+    """
+    Cheap stand-in for `queryset.count()`. PostgreSQL answers from the planner's
+    row estimate; other backends count once and reuse the result for `timeout`
+    seconds.
+    """
+    connection = connections[queryset.db]
+    queryset = queryset.order_by()
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except EmptyResultSet:
+        # `queryset.none()` and the like match nothing without asking the database.
+        return 0
+
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+    key = _count_key(sql, params)
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, timeout)
+    return count
+
+
+async def aestimate_count(queryset, timeout=60):
+    """Async variant of `estimate_count`, sharing its cached counts."""
+    if connections[queryset.db].vendor == 'postgresql':
+        return await sync_to_async(estimate_count)(queryset, timeout)
+
+    queryset = queryset.order_by()
+    try:
+        key = _count_key(*queryset.query.sql_with_params())
+    except EmptyResultSet:
+        return 0
+    count = await cache.aget(key)
+    if count is None:
+        count = await queryset.acount()
+        await cache.aset(key, count, timeout)
+    return count
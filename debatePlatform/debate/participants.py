@@ -0,0 +1,79 @@
+"""
+Debate membership, shared by the web and API views.
+
+Membership is tested with one lookup on the `(debate, user)` unique index of
+the participants table, never by loading the participants. Joins are
+idempotent inserts: `INSERT ... ON CONFLICT DO NOTHING RETURNING` adds the
+users who are not participants yet in one statement and reports which rows
+it really inserted, so concurrent joins of the same user can neither fail on
+the constraint nor count the user twice. Backends without it lock the debate
+row before they look up which users are missing.
+"""
+from django.db import connections, router, transaction
+from django.db.models.signals import m2m_changed
+
+from user.models import User
+from .models import Debate
+from .retries import retry_on_lock
+
+Participant = Debate.participants.through
+
+
+def is_participant(debate_id, user_id):
+    return Participant.objects.filter(debate_id=debate_id, user_id=user_id).exists()
+
+
+def _lock_debate(debate_id, using):
+    """
+    Waits for the other transactions joining the debate to finish. SQLite has no
+    row locks; there a transaction whose read went stale fails to write instead.
+    """
+    list(Debate.objects.using(using).select_for_update().filter(pk=debate_id).values_list('pk', flat=True))
+
+
+def _insert_missing(debate_id, user_ids, using):
+    connection = connections[using]
+    debate_column = Participant._meta.get_field('debate').column
+    user_column = Participant._meta.get_field('user').column
+    # PostgreSQL and SQLite 3.35+ insert and report the new rows in one statement;
+    # other backends look the existing rows up first.
+    if connection.vendor in ('postgresql', 'sqlite') and connection.features.can_return_columns_from_insert:
+        quote = connection.ops.quote_name
+        rows = ", ".join(["(%s, %s)"] * len(user_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {quote(Participant._meta.db_table)} ({quote(debate_column)}, "
+                           f"{quote(user_column)}) VALUES {rows} ON CONFLICT DO NOTHING RETURNING {quote(user_column)}",
+                           [value for user_id in user_ids for value in (debate_id, user_id)])
+            return {row[0] for row in cursor.fetchall()}
+
+    # The debate row is locked first, so concurrent joins of the same debate take
+    # turns between reading the existing rows and inserting the missing ones.
+    _lock_debate(debate_id, using)
+    existing = set(Participant.objects.using(using).filter(debate_id=debate_id, user_id__in=user_ids)
+                   .values_list('user_id', flat=True))
+    missing = {user_id for user_id in user_ids if user_id not in existing}
+    Participant.objects.using(using).bulk_create(
+        [Participant(debate_id=debate_id, user_id=user_id) for user_id in missing], ignore_conflicts=True)
+    return missing
+
+
+@retry_on_lock
+def add_participants(debate, user_ids):
+    """
+    Makes the users of `user_ids` participants of `debate` and returns the ids of
+    those who were not participants before. Sends `m2m_changed` with `post_add`
+    for them, as `debate.participants.add()` would, so `participant_count`, the
+    caches and the live events follow; `pre_add` is not sent, since which rows
+    are new is only known once they are inserted.
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    if not user_ids:
+        return set()
+
+    using = router.db_for_write(Participant)
+    with transaction.atomic(using=using, savepoint=False):
+        added = _insert_missing(debate.pk, user_ids, using)
+        if added:
+            m2m_changed.send(sender=Participant, instance=debate, action="post_add", reverse=False, model=User,
+                             pk_set=added, using=using)
+    return added
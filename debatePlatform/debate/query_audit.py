@@ -0,0 +1,195 @@
+"""
+Query-plan audit of the hot querysets.
+
+`hot_querysets()` collects the querysets the views in `debate/views.py` and
+`api/views.py` and the tasks in `debate/tasks.py` run on every request or
+run. Where the code exposes them (`get_queryset()`, `KeysetPaginator`, the
+category registry) they are taken from it, so the audit follows the code;
+the few that are built inline are mirrored. `audit()` asks the database for the plan of
+each one (`EXPLAIN QUERY PLAN` on SQLite, `EXPLAIN` on PostgreSQL) and flags
+full table scans and sorts that need a temporary B-tree. Plans depend on the
+data, so audit a database of realistic size, e.g. one filled by `seed_data`.
+"""
+import re
+from dataclasses import dataclass, field
+
+from django.db import connections
+from django.test import RequestFactory
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.request import Request
+
+from user.models import User
+from .categories import _category_rows
+from .models import Argument, Category, Debate, Vote
+from .pagination import KeysetPaginator, encode_cursor
+from .transitions import winning_arguments
+
+SQLITE_FULL_SCAN = re.compile(r"\bSCAN (\w+)\b(?! USING)(?!.*VIRTUAL TABLE)")
+SQLITE_TEMP_SORT = re.compile(r"USE TEMP B-TREE FOR (ORDER BY|GROUP BY|DISTINCT|RIGHT PART OF ORDER BY)")
+POSTGRES_FULL_SCAN = re.compile(r"Seq Scan on (\w+)")
+POSTGRES_SORT = re.compile(r"^\s*(?:->\s*)?((?:Incremental )?Sort)\b", re.MULTILINE)
+
+
+@dataclass
+class HotQuery:
+    name: str
+    source: str
+    queryset: object
+    # Tables whose full scan is expected, e.g. the handful of categories.
+    allowed_scans: tuple = ()
+    # Set where no index can hold the order, e.g. ranking by relevance.
+    expected_sort: bool = False
+
+
+@dataclass
+class PlanReport:
+    query: HotQuery
+    plan: str
+    issues: list = field(default_factory=list)
+
+
+def _sample():
+    """A busy debate, its category and a user, so plans are taken for realistic lookups."""
+    debate = (Debate.objects.filter(status="Ongoing").select_related('category').order_by('-participant_count')
+              .first() or Debate(pk=0, participant_count=0, created_at=timezone.now()))
+    user = User.objects.order_by('-xp').first() or User(pk=0, slug='')
+    category = debate.category or Category.objects.order_by('pk').first()
+    return debate, category, user
+
+
+def _view(view_class, path, params=None, **kwargs):
+    view = view_class()
+    view.setup(RequestFactory().get(path, params), **kwargs)
+    return view
+
+
+def _api_view(view_class, action, path, **kwargs):
+    view = view_class(action=action, kwargs=kwargs, format_kwarg=None)
+    view.request = Request(RequestFactory().get(path))
+    return view
+
+
+def _page(queryset, per_page, cursor=None):
+    """The query `KeysetPaginator` runs for the page at `cursor`."""
+    return KeysetPaginator(queryset, per_page)._query(cursor)[0]
+
+
+def hot_querysets():
+    """The querysets, built by the views and helpers that run them."""
+    from api.pagination import DebateCursorPagination
+    from api.views import ArgumentViewSet, DebateViewSet
+    from .views import CategoryView, DebateDetailView, DebateListing, FilterView, HomeView, SearchView
+
+    debate, category, user = _sample()
+    now = timezone.now()
+    listing = _view(DebateListing, reverse('debate_listing'))
+    home = HomeView()
+    search = _view(SearchView, reverse('search'), {'query': "climate policy"})
+    status_filter = _view(FilterView, reverse('filter'), {'status': "Ongoing"})
+
+    queries = [
+        HotQuery('debate listing, first page', 'debate/views.py', _page(listing.get_queryset(), listing.paginate_by)),
+        HotQuery('debate listing, next page', 'debate/views.py',
+                 _page(listing.get_queryset(), listing.paginate_by, encode_cursor('next', debate))),
+        HotQuery('debate listing, previous page', 'debate/views.py',
+                 _page(listing.get_queryset(), listing.paginate_by, encode_cursor('previous', debate))),
+        HotQuery('debate detail', 'debate/views.py', DebateDetailView().get_queryset().filter(pk=debate.pk)),
+        HotQuery('debate detail arguments', 'debate/views.py',
+                 Argument.objects.filter(debate_id__in=[debate.pk]).select_related('author')),
+        HotQuery('voted arguments of a user', 'debate/votes.py',
+                 Vote.objects.filter(user_id=user.pk, argument__debate_id=debate.pk)
+                 .values_list('argument_id', flat=True)),
+        HotQuery('participant check', 'debate/participants.py',
+                 Debate.participants.through.objects.filter(debate_id=debate.pk, user_id=user.pk)[:1]),
+        HotQuery('home trending rail', 'debate/views.py', home.get_rail(("Scheduled", "Ongoing"), '-created_at')),
+        HotQuery('home latest rail', 'debate/views.py', home.get_rail(("Scheduled",), 'created_at')),
+        HotQuery('home active rail', 'debate/views.py', home.get_rail(("Ongoing",), 'created_at')),
+        HotQuery('search', 'debate/views.py', search.get_queryset()[:search.paginate_by], expected_sort=True),
+        HotQuery('filter by status', 'debate/views.py', _page(status_filter.get_queryset(), status_filter.paginate_by)),
+        # Category pages look their slug up in this registry (`get_category_by_slug`). It reads
+        # the handful of categories once per change, grouped by every selected column.
+        HotQuery('category registry', 'debate/categories.py', _category_rows(), allowed_scans=('debate_category',),
+                 expected_sort=True),
+        # The order is a column of the joined table, so the participations of the user are sorted.
+        HotQuery('profile, participated debates', 'user/views.py',
+                 Debate.objects.filter(participants=user.pk).order_by('-created_at')[:5], expected_sort=True),
+        HotQuery('profile, authored debates', 'user/views.py',
+                 Debate.objects.filter(author_id=user.pk).order_by('-created_at')[:5]),
+
+        HotQuery('API debate list', 'api/views.py',
+                 _page(_api_view(DebateViewSet, 'list', '/api/debates/').get_queryset(),
+                       DebateCursorPagination.page_size)),
+        HotQuery('API debate detail', 'api/views.py', _api_view(DebateViewSet, 'retrieve', '/api/debates/')
+                 .get_queryset().filter(pk=debate.pk)),
+        HotQuery('API debate participants', 'api/views.py',
+                 User.objects.filter(participated_debates__in=[debate.pk])),
+        HotQuery('API argument list', 'api/views.py', ArgumentViewSet.queryset[:50]),
+        HotQuery('API arguments of a debate, ranked', 'api/views.py',
+                 ArgumentViewSet.queryset.filter(debate_id=debate.pk)[:50]),
+        HotQuery('API user detail', 'api/views.py', User.objects.filter(slug=user.slug)),
+
+        HotQuery('transition check', 'debate/tasks.py',
+                 Debate.objects.filter(pk=debate.pk, status="Scheduled", start_time=now)[:1]),
+        HotQuery('due to start', 'debate/tasks.py',
+                 Debate.objects.filter(status="Scheduled", start_time__lte=now).values_list('pk', flat=True)),
+        HotQuery('due to finish', 'debate/tasks.py',
+                 Debate.objects.filter(status="Ongoing", end_time__lte=now).values_list('pk', flat=True)),
+        # Ranked by votes including the buffered ones, which only exist in the query.
+        HotQuery('winning arguments', 'debate/tasks.py', winning_arguments([debate.pk]), expected_sort=True),
+    ]
+    if category is not None:
+        category_page = _view(CategoryView, reverse('category', args=[category.slug]), slug=category.slug)
+        category_filter = _view(FilterView, reverse('filter'), {'status': "Ongoing", 'category': category.pk})
+        queries += [
+            HotQuery('category page', 'debate/views.py',
+                     _page(category_page.get_queryset(), category_page.paginate_by)),
+            HotQuery('filter by status and category', 'debate/views.py',
+                     _page(category_filter.get_queryset(), category_filter.paginate_by)),
+        ]
+    return queries
+
+
+def _issues(vendor, plan, query, tables):
+    if vendor == 'sqlite':
+        scans = SQLITE_FULL_SCAN.findall(plan)
+        sorts = [f"temporary B-tree for {what}" for what in SQLITE_TEMP_SORT.findall(plan)]
+    elif vendor == 'postgresql':
+        scans = POSTGRES_FULL_SCAN.findall(plan)
+        sorts = [f"{sort.lower()} step" for sort in POSTGRES_SORT.findall(plan)]
+    else:
+        return []
+    # Scans of subqueries, which have no table of their own, are not flagged.
+    issues = [f"full scan of {table}" for table in scans if table in tables and table not in query.allowed_scans]
+    return issues + ([] if query.expected_sort else sorts)
+
+
+def explain(queryset, using='default'):
+    """
+    The plan of `queryset` as text. `QuerySet.explain()` cannot be used: it puts
+    EXPLAIN inside the wrapper query Django builds for filters on window functions.
+    """
+    connection = connections[using]
+    sql, params = queryset.using(using).query.sql_with_params()
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            depth = {0: -1}
+            lines = []
+            for node, parent, _, detail in cursor.fetchall():
+                depth[node] = depth.get(parent, -1) + 1
+                lines.append("  " * depth[node] + detail)
+            return "\n".join(lines)
+        cursor.execute(f"EXPLAIN {sql}", params)
+        return "\n".join(row[0] for row in cursor.fetchall())
+
+
+def audit(using='default'):
+    """Returns a `PlanReport` for every hot queryset, in the order of `hot_querysets()`."""
+    connection = connections[using]
+    tables = set(connection.introspection.table_names())
+    reports = []
+    for query in hot_querysets():
+        plan = explain(query.queryset, using)
+        reports.append(PlanReport(query, plan, _issues(connection.vendor, plan, query, tables)))
+    return reports
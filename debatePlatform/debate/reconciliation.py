@@ -0,0 +1,184 @@
+"""
+Recomputes the denormalized vote and XP counters from their source tables.
+
+`Argument.vote_count` is the number of `Vote` rows of the argument, `User.wins`
+the number of winning arguments of the user and `User.xp` the reward for every
+vote on their arguments plus the reward for every win; `User.level` follows
+from xp. Each id range is checked with one aggregate query and fixed with one
+UPDATE in its own short transaction, so the job can run on a live database.
+The UPDATE recomputes the expected values itself, which keeps votes cast in
+between intact.
+
+Only existing rows count: deleting an argument takes back the xp of its votes
+and, for a winning argument, the win and its reward (`delete_argument`), so
+the live paths and this job agree. The vote buffer is read once per run.
+"""
+from dataclasses import dataclass, field
+
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
+
+from user import leaderboard
+from user.models import User, level_expression
+from . import vote_buffer
+from .caching import touch_debates, touch_users_on_commit
+from .models import Argument, Vote
+from .transitions import WINNER_REWARD_XP
+from .votes import VOTE_REWARD_XP
+
+
+@dataclass
+class Mismatch:
+    model: str
+    pk: int
+    field: str
+    stored: object
+    expected: object
+
+
+@dataclass
+class ReconciliationResult:
+    checked: int = 0
+    corrected: int = 0
+    mismatches: list = field(default_factory=list)
+
+
+def _counted(model, **filters):
+    """Correlated COUNT(*) over `model` rows matching `filters`, 0 when there are none."""
+    rows = (model.objects.filter(**filters)
+            .order_by()
+            .values(next(iter(filters)))
+            .annotate(total=models.Count('*'))
+            .values('total'))
+    return Coalesce(models.Subquery(rows), 0)
+
+
+def _minus_pending(expression, pending):
+    """Expected stored value: the true count minus what the vote buffer has not flushed yet."""
+    if not pending:
+        return expression
+    return expression - models.Case(
+        *[models.When(pk=pk, then=models.Value(delta)) for pk, delta in pending.items()],
+        default=models.Value(0),
+    )
+
+
+def _id_ranges(model, chunk_size):
+    last_id = model.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+    for start in range(0, last_id + 1, chunk_size):
+        yield start, start + chunk_size
+
+
+def _pending(kind):
+    return vote_buffer.get_buffer().pending(kind) if vote_buffer.enabled() else {}
+
+
+def _pending_by_range(pending, chunk_size):
+    """Splits `{pk: delta}` into the id ranges of `_id_ranges`, keyed by their start."""
+    ranges = {}
+    for pk, delta in pending.items():
+        ranges.setdefault(pk - pk % chunk_size, {})[pk] = delta
+    return ranges
+
+
+def _fresh_pending(kind, ids):
+    """The deltas buffered for `ids` right now, for the UPDATE that fixes them."""
+    return vote_buffer.get_buffer().get_many(kind, ids) if vote_buffer.enabled() else {}
+
+
+def reconcile_vote_counts(chunk_size=1000, dry_run=False, pending=None):
+    """
+    Recomputes `Argument.vote_count` from the `Vote` table. `pending` are the
+    buffered vote deltas per argument, read once from the vote buffer when not
+    given.
+    """
+    result = ReconciliationResult()
+    pending = _pending_by_range(_pending(vote_buffer.ARGUMENTS) if pending is None else pending, chunk_size)
+    counted = _counted(Vote, argument=models.OuterRef('pk'))
+
+    for start, end in _id_ranges(Argument, chunk_size):
+        arguments = Argument.objects.filter(pk__gte=start, pk__lt=end)
+
+        result.checked += arguments.count()
+        wrong = list(arguments.annotate(expected=_minus_pending(counted, pending.get(start)))
+                     .exclude(vote_count=models.F('expected'))
+                     .values_list('pk', 'vote_count', 'expected'))
+        result.mismatches += [Mismatch('argument', pk, 'vote_count', stored, should_be)
+                              for pk, stored, should_be in wrong]
+        if dry_run or not wrong:
+            continue
+
+        ids = [pk for pk, _, _ in wrong]
+        # Votes buffered since the run began must not be counted twice.
+        expected = _minus_pending(counted, _fresh_pending(vote_buffer.ARGUMENTS, ids))
+        with transaction.atomic():
+            result.corrected += arguments.filter(pk__in=ids).update(vote_count=expected)
+            debate_ids = set(arguments.filter(pk__in=ids).values_list('debate_id', flat=True))
+            transaction.on_commit(lambda debate_ids=debate_ids: touch_debates(debate_ids))
+
+    return result
+
+
+def _expected_xp(expected_wins, pending):
+    return _minus_pending(
+        VOTE_REWARD_XP * _counted(Vote, argument__author=models.OuterRef('pk')) + WINNER_REWARD_XP * expected_wins,
+        pending,
+    )
+
+
+def reconcile_users(chunk_size=1000, dry_run=False, pending=None):
+    """
+    Recomputes `User.wins`, `User.xp` and `User.level` from the `Argument` and
+    `Vote` tables. `pending` are the buffered xp deltas per user, read once from
+    the vote buffer when not given.
+    """
+    result = ReconciliationResult()
+    pending = _pending_by_range(_pending(vote_buffer.XP) if pending is None else pending, chunk_size)
+    expected_wins = _counted(Argument, author=models.OuterRef('pk'), winner=True)
+
+    for start, end in _id_ranges(User, chunk_size):
+        expected_xp = _expected_xp(expected_wins, pending.get(start))
+        users = User.objects.filter(pk__gte=start, pk__lt=end)
+
+        result.checked += users.count()
+        wrong = list(users.annotate(expected_wins=expected_wins, expected_xp=expected_xp,
+                                    expected_level=level_expression(models.F('expected_xp')))
+                     .exclude(wins=models.F('expected_wins'), xp=models.F('expected_xp'),
+                              level=models.F('expected_level'))
+                     .values_list('pk', 'wins', 'expected_wins', 'xp', 'expected_xp', 'level', 'expected_level'))
+        for pk, wins, should_win, xp, should_xp, level, should_level in wrong:
+            result.mismatches += [Mismatch('user', pk, name, stored, should_be)
+                                  for name, stored, should_be in (('wins', wins, should_win), ('xp', xp, should_xp),
+                                                                  ('level', level, should_level))
+                                  if stored != should_be]
+        if dry_run or not wrong:
+            continue
+
+        ids = [row[0] for row in wrong]
+        expected_xp = _expected_xp(expected_wins, _fresh_pending(vote_buffer.XP, ids))
+        with transaction.atomic():
+            result.corrected += users.filter(pk__in=ids).update(
+                wins=expected_wins, xp=expected_xp, level=level_expression(expected_xp))
+            scores = list(User.objects.filter(pk__in=ids).values_list('pk', *leaderboard.BOARDS))
+            transaction.on_commit(lambda scores=scores: _store_scores(scores))
+            touch_users_on_commit(ids)
+
+    return result
+
+
+def _store_scores(scores):
+    for index, name in enumerate(leaderboard.BOARDS, start=1):
+        leaderboard.store_scores(name, {row[0]: row[index] for row in scores})
+
+
+def reconcile_counters(chunk_size=1000, dry_run=False):
+    """
+    Reconciles arguments, then users. With the vote buffer enabled it is flushed
+    first, so only deltas that arrive during the run have to be accounted for.
+    """
+    if vote_buffer.enabled() and not dry_run:
+        vote_buffer.flush()
+    return {
+        'arguments': reconcile_vote_counts(chunk_size, dry_run),
+        'users': reconcile_users(chunk_size, dry_run),
+    }
@@ -0,0 +1,48 @@
+"""
+Retrying writes that lose the race for the SQLite write lock.
+
+SQLite lets one connection write at a time. A writer that cannot get the lock
+within the busy timeout fails with "database is locked", which under bursts
+of votes and joins reaches the user as an error. `retry_on_lock` runs such a
+write again after an exponentially growing, jittered pause, up to
+`settings.DATABASE_LOCK_RETRIES` times. Only whole transactions are retried:
+inside an outer `atomic` block the error is raised to the block's owner.
+"""
+import functools
+import random
+import time
+
+from django.conf import settings
+from django.db import OperationalError, transaction
+
+MAX_BACKOFF = 1.0
+
+
+def is_lock_error(error):
+    return isinstance(error, OperationalError) and "locked" in str(error)
+
+
+def backoff(attempt):
+    """Seconds to wait before retry number `attempt` (from 0), with jitter so retries do not collide again."""
+    return min(settings.DATABASE_LOCK_BACKOFF * 2 ** attempt, MAX_BACKOFF) * random.uniform(0.5, 1)
+
+
+def retry_on_lock(func):
+    """
+    Decorates a function that writes in transactions of its own, an `atomic`
+    block or single autocommitted statements, so it is run again when the
+    database is locked.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as error:
+                if (not is_lock_error(error) or attempt >= settings.DATABASE_LOCK_RETRIES
+                        or transaction.get_connection().in_atomic_block):
+                    raise
+            time.sleep(backoff(attempt))
+            attempt += 1
+    return wrapper
@@ -0,0 +1,6 @@
+from django.urls import path
+from .consumers import DebateConsumer
+
+websocket_urlpatterns = [
+    path('ws/debates/<int:debate_id>/', DebateConsumer.as_asgi()),
+]
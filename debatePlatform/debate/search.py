@@ -0,0 +1,121 @@
+"""
+Full-text search over debate titles and descriptions.
+
+SQLite uses the `debate_debate_fts` FTS5 table and PostgreSQL a GIN index on
+the tsvector of title and description, both created by migration
+`0006_debate_search_index`. Triggers keep the FTS5 table in sync with every
+insert, update and delete of a debate; PostgreSQL maintains the GIN index
+itself. Other backends fall back to substring matching without ranking.
+"""
+import re
+
+from django.db import connections, models
+from django.db.models.expressions import RawSQL
+
+from .models import Debate, DebateSearchEntry
+
+DEBATE_TABLE = Debate._meta.db_table
+FTS_TABLE = DebateSearchEntry._meta.db_table
+
+# Must stay identical to the expression of the GIN index so PostgreSQL can use it.
+PG_DOCUMENT = f"to_tsvector('english', coalesce(\"{DEBATE_TABLE}\".\"title\", '') || ' ' || " \
+              f"coalesce(\"{DEBATE_TABLE}\".\"description\", ''))"
+PG_QUERY = "websearch_to_tsquery('english', %s)"
+
+SQLITE_TRIGGERS = {
+    f"{FTS_TABLE}_insert": (
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON {DEBATE_TABLE} BEGIN "
+        f"INSERT INTO {FTS_TABLE}(rowid, title, description) VALUES (new.id, new.title, new.description); END"),
+    f"{FTS_TABLE}_delete": (
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON {DEBATE_TABLE} BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description) "
+        f"VALUES ('delete', old.id, old.title, old.description); END"),
+    f"{FTS_TABLE}_update": (
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE OF title, description "
+        f"ON {DEBATE_TABLE} BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description) "
+        f"VALUES ('delete', old.id, old.title, old.description); "
+        f"INSERT INTO {FTS_TABLE}(rowid, title, description) VALUES (new.id, new.title, new.description); END"),
+}
+
+
+@DebateSearchEntry._meta.get_field('document').register_lookup
+class Match(models.Lookup):
+    """`document__match=...`: an FTS5 MATCH on the whole index row."""
+    lookup_name = "match"
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f"{lhs} MATCH {rhs}", [*lhs_params, *rhs_params]
+
+
+def _fts5_query(query):
+    """Turns free text into an FTS5 query: every word must match, as a prefix."""
+    terms = re.findall(r"\w+", query)
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def search_debates(queryset, query):
+    """
+    Restricts `queryset` to debates matching `query` and annotates each with
+    `search_rank` (higher is more relevant). The result is ordered by rank and
+    can be paginated like any other queryset.
+    """
+    vendor = connections[queryset.db].vendor
+
+    if vendor == "sqlite":
+        match = _fts5_query(query)
+        if not match:
+            return queryset.none()
+        # Joining the index lets SQLite drive the query from the MATCH and read
+        # bm25() for the matched rows only; lower bm25 means more relevant.
+        matches = models.Q(search_entry__document__match=match)
+        rank = models.Func(models.F('search_entry__document'), models.Value(10.0), models.Value(1.0),
+                           function='bm25', template="-%(function)s(%(expressions)s)",
+                           output_field=models.FloatField())
+    elif vendor == "postgresql":
+        matches = RawSQL(
+            f"{PG_DOCUMENT} @@ {PG_QUERY}", (query,), output_field=models.BooleanField())
+        rank = RawSQL(
+            f"ts_rank({PG_DOCUMENT}, {PG_QUERY})", (query,), output_field=models.FloatField())
+    else:
+        matches = models.Q(title__icontains=query) | models.Q(description__icontains=query)
+        rank = models.Value(0.0, output_field=models.FloatField())
+
+    return (queryset.filter(matches)
+            .annotate(search_rank=rank)
+            .order_by('-search_rank', '-participant_count', '-created_at'))
+
+
+def ensure_search_index(connection):
+    """
+    Creates the full-text index if it is missing. On SQLite, rebuilding the
+    debate table in a migration drops its triggers, so this also runs after
+    every `migrate` and repopulates the index whenever a trigger was missing.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = %s", [DEBATE_TABLE])
+            existing = {name for name, in cursor.fetchall()}
+            if existing.issuperset(SQLITE_TRIGGERS):
+                return
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(title, description, "
+                f"content='{DEBATE_TABLE}', content_rowid='id', tokenize='unicode61 remove_diacritics 2')")
+            for statement in SQLITE_TRIGGERS.values():
+                cursor.execute(statement)
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        elif connection.vendor == "postgresql":
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS debate_debate_search_idx "
+                           f"ON {DEBATE_TABLE} USING GIN (({PG_DOCUMENT}))")
+
+
+def drop_search_index(connection):
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            for name in SQLITE_TRIGGERS:
+                cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+            cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+        elif connection.vendor == "postgresql":
+            cursor.execute("DROP INDEX IF EXISTS debate_debate_search_idx")
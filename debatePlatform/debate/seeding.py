@@ -0,0 +1,286 @@
+"""
+Synthetic data for load testing and for the test suite.
+
+`seed` fills the database with users, categories, debates in every status,
+participants, arguments and votes, written with `bulk_create` in batches.
+The layout decides the shape: `SkewedLayout` skews activity the way it is in
+production, `UniformLayout` gives every debate the same shape so data sets of
+different sizes stay comparable. The denormalized counters
+(`participant_count`, `vote_count`, `xp`, `wins`, `level`) are written
+consistent with the rows, so `reconcile_counters` finds nothing to fix
+afterwards.
+"""
+import itertools
+import random
+import time
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from user import leaderboard
+from user.models import User, level_for_xp
+from .caching import bump_version_on_commit, DEBATES, HOME_RAILS
+from .categories import CATEGORIES
+from .models import Argument, Category, Debate, Vote
+from .transitions import WINNER_REWARD_XP
+from .votes import VOTE_REWARD_XP
+
+ARGUMENTS_PER_DEBATE = 4
+STATUS_WEIGHTS = {"Scheduled": 0.25, "Ongoing": 0.15, "Finished": 0.55, "Canceled": 0.05}
+CATEGORY_NAMES = [
+    "Politics", "Science", "Technology", "Education", "Health", "Economy", "Environment", "Sports", "Culture",
+    "Philosophy", "History", "Law", "Media", "Religion", "Food", "Travel", "Games", "Music", "Film", "Space",
+]
+WORDS = [
+    "climate", "policy", "education", "freedom", "economy", "energy", "nuclear", "privacy", "internet", "health",
+    "vaccine", "taxes", "income", "universal", "basic", "school", "uniform", "space", "exploration", "artificial",
+    "intelligence", "robots", "jobs", "automation", "democracy", "voting", "election", "social", "media",
+    "censorship", "speech", "animal", "rights", "zoo", "meat", "vegan", "diet", "sports", "doping", "olympics",
+    "city", "transport", "cars", "bicycles", "housing", "rent", "control", "minimum", "wage", "immigration",
+]
+
+
+@dataclass
+class SeedSummary:
+    users: int = 0
+    categories: int = 0
+    debates: dict = field(default_factory=dict)
+    participants: int = 0
+    arguments: int = 0
+    votes: int = 0
+
+
+def _zipf_cum_weights(count, exponent):
+    return list(itertools.accumulate(1 / rank ** exponent for rank in range(1, count + 1)))
+
+
+def _pick_distinct(rng, population, cum_weights, count):
+    """Up to `count` distinct members of `population`, drawn with the given skew."""
+    count = min(count, len(population))
+    if count * 4 > len(population):
+        # Skewed draws would spend most of their time looking for the last rare members.
+        return rng.sample(population, count)
+    picked = {}
+    while len(picked) < count:
+        for member in rng.choices(population, cum_weights=cum_weights, k=2 * (count - len(picked))):
+            picked[member] = None
+            if len(picked) == count:
+                break
+    return list(picked)
+
+
+def _sentence(rng, length):
+    return " ".join(rng.choices(WORDS, k=length)).capitalize()
+
+
+def _skewed_times(rng, status, now):
+    if status == "Scheduled":
+        start_time = now + timedelta(minutes=rng.randint(10, 30 * 24 * 60))
+    elif status == "Ongoing":
+        start_time = now - timedelta(minutes=rng.randint(1, 24 * 60))
+    else:
+        start_time = now - timedelta(minutes=rng.randint(2 * 24 * 60, 365 * 24 * 60))
+    end_time = start_time + timedelta(minutes=rng.randint(60, 7 * 24 * 60))
+    if status == "Ongoing":
+        end_time = max(end_time, now + timedelta(minutes=10))
+    elif status in ("Finished", "Canceled"):
+        end_time = min(end_time, now - timedelta(minutes=1))
+    return start_time, end_time
+
+
+def _uniform_times(status, now, offset):
+    if status == "Scheduled":
+        return now + timedelta(days=1, minutes=offset), now + timedelta(days=2, minutes=offset)
+    if status == "Ongoing":
+        return now - timedelta(hours=1, minutes=offset), now + timedelta(hours=1, minutes=offset)
+    return now - timedelta(days=2, minutes=offset), now - timedelta(days=1, minutes=offset)
+
+
+class SkewedLayout:
+    """
+    Activity skewed the way it is in production: a few users take part in most
+    debates, a few debates draw most participants and a few arguments get most
+    votes. Finished debates have a winner.
+    """
+    picks_winners = True
+
+    def __init__(self, rng, prefix, user_ids, category_ids, debates, mean_participants):
+        self.rng = rng
+        self.user_ids = user_ids
+        self.user_weights = _zipf_cum_weights(len(user_ids), 1.1)
+        self.category_ids = category_ids
+        self.category_weights = _zipf_cum_weights(len(category_ids), 0.8)
+        self.mean_participants = mean_participants
+        self.now = timezone.now()
+
+    def debate(self, index):
+        rng = self.rng
+        status = rng.choices(*zip(*STATUS_WEIGHTS.items()))[0]
+        start_time, end_time = _skewed_times(rng, status, self.now)
+        return Debate(title=_sentence(rng, rng.randint(4, 9)) + "?",
+                      description=_sentence(rng, rng.randint(20, 60)) + ".",
+                      category_id=rng.choices(self.category_ids, cum_weights=self.category_weights)[0],
+                      author_id=rng.choices(self.user_ids, cum_weights=self.user_weights)[0],
+                      start_time=start_time, end_time=end_time, status=status)
+
+    def members(self, index):
+        # Pareto with alpha 1.5 has mean 3: most debates are small, a few are crowded.
+        size = max(1, round(self.mean_participants / 3 * self.rng.paretovariate(1.5)))
+        return _pick_distinct(self.rng, self.user_ids, self.user_weights, size)
+
+    def arguments(self, debate, members):
+        rng = self.rng
+        return [Argument(debate_id=debate.pk, author_id=rng.choice(members), side=rng.choice(("Pro", "Con")),
+                         text=_sentence(rng, rng.randint(15, 80)))
+                for _ in range(rng.randint(0, len(members) // 2 + 1))]
+
+    def voters(self, argument, members):
+        # Most arguments get a few votes; some get most of the debate.
+        count = round((len(members) - 1) * self.rng.betavariate(0.7, 2.5))
+        return self.rng.sample([user_id for user_id in members if user_id != argument.author_id], count)
+
+
+class UniformLayout:
+    """
+    The same shape for every debate, for tests that compare data sets of
+    different sizes: an equal number of debates per status, exactly
+    `mean_participants` participants each, `ARGUMENTS_PER_DEBATE` arguments per
+    started debate and three votes for every five participants per argument.
+    Winners are left to `finalize_debates`.
+    """
+    picks_winners = False
+
+    def __init__(self, rng, prefix, user_ids, category_ids, debates, mean_participants):
+        self.prefix = prefix
+        self.user_ids = sorted(user_ids)
+        self.category_ids = category_ids
+        self.participants = mean_participants
+        self.per_status = max(debates // len(Debate.STATUS_CHOICES), 1)
+        self.now = timezone.now()
+
+    def debate(self, index):
+        status = Debate.STATUS_CHOICES[min(index // self.per_status, len(Debate.STATUS_CHOICES) - 1)][0]
+        offset = index % self.per_status
+        start_time, end_time = _uniform_times(status, self.now, offset)
+        return Debate(title=f"Debate {self.prefix} {status} {offset}",
+                      description=f"Should {self.prefix} debate {offset}?",
+                      category_id=self.category_ids[offset % len(self.category_ids)],
+                      author_id=self.user_ids[offset % len(self.user_ids)],
+                      start_time=start_time, end_time=end_time, status=status)
+
+    def members(self, index):
+        return [self.user_ids[(index + i) % len(self.user_ids)] for i in range(self.participants)]
+
+    def arguments(self, debate, members):
+        return [Argument(debate_id=debate.pk, author_id=members[i % len(members)], side=("Pro", "Con")[i % 2],
+                         text=f"Argument {i} of {debate.title}")
+                for i in range(ARGUMENTS_PER_DEBATE)]
+
+    def voters(self, argument, members):
+        others = [user_id for user_id in members if user_id != argument.author_id]
+        return others[:len(members) * 3 // 5]
+
+
+LAYOUTS = {"skewed": SkewedLayout, "uniform": UniformLayout}
+
+
+def seed(users=1000, categories=10, debates=500, mean_participants=12, password="password", prefix=None,
+         batch_size=1000, seed=None, log=None, layout="skewed", category_ids=None):
+    """
+    Creates the given number of users, categories and debates with their
+    participants, arguments and votes, and returns a `SeedSummary`. Usernames
+    are `<prefix>-<n>`; the prefix defaults to one derived from the current time,
+    so repeated runs add to the data instead of colliding with it. `layout`
+    names the shape of the data in `LAYOUTS`. Debates go into the categories of
+    `category_ids` instead of new ones when it is given.
+    """
+    rng = random.Random(seed)
+    prefix = prefix or f"seed{time.time_ns() // 1_000_000:x}"
+    log = log or (lambda message: None)
+    summary = SeedSummary()
+    hashed_password = make_password(password)
+
+    for start in range(0, users, batch_size):
+        User.objects.bulk_create([
+            User(username=f"{prefix}-{i}", slug=f"{prefix}-{i}", email=f"{prefix}-{i}@example.com",
+                 password=hashed_password)
+            for i in range(start, min(start + batch_size, users))
+        ], batch_size=batch_size)
+    user_ids = list(User.objects.filter(username__startswith=f"{prefix}-").values_list('pk', flat=True))
+    rng.shuffle(user_ids)
+    summary.users = len(user_ids)
+    log(f"{summary.users} users")
+
+    if category_ids is None:
+        Category.objects.bulk_create([
+            Category(name=CATEGORY_NAMES[i % len(CATEGORY_NAMES)] + (f" {i // len(CATEGORY_NAMES) + 1}"
+                                                                     if i >= len(CATEGORY_NAMES) else ""),
+                     slug=f"{prefix}-category-{i}")
+            for i in range(categories)
+        ])
+        category_ids = list(Category.objects.filter(slug__startswith=f"{prefix}-category-")
+                            .values_list('pk', flat=True))
+        summary.categories = len(category_ids)
+    layout = LAYOUTS[layout](rng, prefix, user_ids, category_ids, debates, mean_participants)
+
+    xp = {}
+    wins = {}
+    for start in range(0, debates, batch_size):
+        with transaction.atomic():
+            batch = [layout.debate(i) for i in range(start, min(start + batch_size, debates))]
+            for debate in batch:
+                summary.debates[debate.status] = summary.debates.get(debate.status, 0) + 1
+
+            memberships, arguments = [], []
+            members_of = {}
+            for index, debate in enumerate(Debate.objects.bulk_create(batch), start):
+                members = layout.members(index)
+                members_of[debate.pk] = members
+                memberships += [Debate.participants.through(debate_id=debate.pk, user_id=user_id)
+                                for user_id in members]
+                debate.participant_count = len(members)
+
+                if debate.status in ("Ongoing", "Finished"):
+                    arguments += layout.arguments(debate, members)
+
+            Debate.participants.through.objects.bulk_create(memberships, batch_size=batch_size)
+            Debate.objects.bulk_update(batch, ['participant_count'], batch_size=batch_size)
+            summary.participants += len(memberships)
+
+            votes = []
+            arguments = Argument.objects.bulk_create(arguments, batch_size=batch_size)
+            best = {}
+            for argument in arguments:
+                voters = layout.voters(argument, members_of[argument.debate_id])
+                votes += [Vote(user_id=user_id, argument_id=argument.pk) for user_id in voters]
+                argument.vote_count = count = len(voters)
+                xp[argument.author_id] = xp.get(argument.author_id, 0) + VOTE_REWARD_XP * count
+                if count and count > best.get(argument.debate_id, (0, None))[0]:
+                    best[argument.debate_id] = (count, argument)
+
+            if layout.picks_winners:
+                for argument in [best[debate.pk][1] for debate in batch
+                                 if debate.status == "Finished" and debate.pk in best]:
+                    argument.winner = True
+                    wins[argument.author_id] = wins.get(argument.author_id, 0) + 1
+                    xp[argument.author_id] = xp.get(argument.author_id, 0) + WINNER_REWARD_XP
+
+            Vote.objects.bulk_create(votes, batch_size=batch_size)
+            Argument.objects.bulk_update(arguments, ['vote_count', 'winner'], batch_size=batch_size)
+            summary.arguments += len(arguments)
+            summary.votes += len(votes)
+        log(f"{min(start + batch_size, debates)} / {debates} debates")
+
+    scored = [User(pk=user_id, xp=xp.get(user_id, 0), wins=wins.get(user_id, 0),
+                   level=level_for_xp(xp.get(user_id, 0)))
+              for user_id in user_ids if user_id in xp or user_id in wins]
+    with transaction.atomic():
+        User.objects.bulk_update(scored, ['xp', 'wins', 'level'], batch_size=batch_size)
+        # bulk_create skips the signals that keep the caches and boards in step.
+        for name in (CATEGORIES, DEBATES, HOME_RAILS):
+            bump_version_on_commit(name)
+        transaction.on_commit(leaderboard.rebuild)
+    return summary
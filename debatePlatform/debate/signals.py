@@ -1,6 +1,11 @@
-from django.db.models.signals import pre_save
+from django.db.models import F
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
 from django.dispatch import receiver
-from .models import Debate
+from user.models import User
+from . import live
+from .caching import bump_version_on_commit, touch_debate_on_commit, HOME_RAILS
+from .categories import CATEGORIES
+from .models import Debate, Argument, Category, counted_participants
 
 @receiver(pre_save, sender=Debate)
 def update_user_level(sender, instance, **kwargs):
@@ -8,10 +13,104 @@ def update_user_level(sender, instance, **kwargs):
 
     This function listens to the `pre_save` signal of the `Debate` model. It checks
     if the debate's status is transitioning from "Ongoing" to "Finished" and, if
-    so, triggers the logic for finalizing the debate.
+    so, triggers the logic for finalizing the debate. The previous status is the
+    one tracked since the debate was loaded, so no extra query is needed.
 
     """
-    if instance.pk:
-        old_debate = Debate.objects.get(pk=instance.pk)
-        if old_debate.status == "Ongoing" and instance.status == "Finished":
-            instance.finish_debate()
\ No newline at end of file
+    if instance.status == "Finished" and instance.previous_status == "Ongoing":
+        instance.finish_debate()
+
+
+@receiver(post_save, sender=Debate)
+@receiver(post_delete, sender=Debate)
+def invalidate_home_rails(sender, **kwargs):
+    bump_version_on_commit(HOME_RAILS)
+
+
+@receiver(post_save, sender=Debate)
+@receiver(post_delete, sender=Debate)
+def touch_changed_debate(sender, instance, **kwargs):
+    touch_debate_on_commit(instance.pk)
+
+
+@receiver(m2m_changed, sender=Debate.participants.through)
+def touch_debates_on_leave(sender, instance, action, reverse, pk_set, **kwargs):
+    """Joins are published as live events, which touch the debate already."""
+    if action == "post_remove" and pk_set:
+        debate_ids = pk_set if reverse else [instance.pk]
+    elif action == "pre_clear":
+        debate_ids = list(instance.participated_debates.values_list('pk', flat=True)) if reverse else [instance.pk]
+    else:
+        return
+    for debate_id in debate_ids:
+        touch_debate_on_commit(debate_id)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Debate)
+@receiver(post_delete, sender=Debate)
+def invalidate_categories(sender, **kwargs):
+    bump_version_on_commit(CATEGORIES)
+
+
+@receiver(m2m_changed, sender=Debate.participants.through)
+def invalidate_home_rails_on_join(sender, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        bump_version_on_commit(HOME_RAILS)
+
+
+@receiver(m2m_changed, sender=Debate.participants.through)
+def update_participant_count(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Keeps `Debate.participant_count` in step with the participants table. Joins
+    use atomic F-expressions, `pk_set` only holds the rows that were really added.
+    Removals are rare and `pk_set` may name non-members, so they recount instead.
+    """
+    if action == "pre_clear" and reverse:
+        instance._cleared_debate_ids = list(instance.participated_debates.values_list('pk', flat=True))
+        return
+
+    if action == "post_add" and pk_set:
+        if reverse:
+            Debate.objects.filter(pk__in=pk_set).update(participant_count=F('participant_count') + 1)
+        else:
+            Debate.objects.filter(pk=instance.pk).update(participant_count=F('participant_count') + len(pk_set))
+    elif action == "post_remove" and pk_set:
+        debate_ids = pk_set if reverse else [instance.pk]
+        Debate.objects.filter(pk__in=debate_ids).update(participant_count=counted_participants())
+    elif action == "post_clear":
+        debate_ids = instance.__dict__.pop('_cleared_debate_ids', []) if reverse else [instance.pk]
+        Debate.objects.filter(pk__in=debate_ids).update(participant_count=counted_participants())
+
+
+@receiver(post_save, sender=Argument)
+def publish_argument_created(sender, instance, created, **kwargs):
+    if created:
+        live.publish(instance.debate_id, live.ARGUMENT_CREATED, argument=live.argument_payload(instance))
+
+
+@receiver(post_delete, sender=Argument)
+def publish_argument_deleted(sender, instance, **kwargs):
+    live.publish(instance.debate_id, live.ARGUMENT_DELETED, argument_id=instance.pk)
+
+
+@receiver(post_save, sender=Debate)
+def publish_status_changed(sender, instance, created, **kwargs):
+    if not created and instance.status != instance.previous_status:
+        live.publish(instance.pk, live.STATUS_CHANGED, status=instance.status)
+
+
+@receiver(m2m_changed, sender=Debate.participants.through)
+def publish_participants_joined(sender, instance, action, reverse, pk_set, **kwargs):
+    """Runs after `update_participant_count`, so the counts read here include the new participants."""
+    if action != "post_add" or not pk_set:
+        return
+
+    debate_ids = pk_set if reverse else [instance.pk]
+    users = [instance] if reverse else User.objects.filter(pk__in=pk_set).only('id', 'username', 'slug')
+    counts = dict(Debate.objects.filter(pk__in=debate_ids).values_list('pk', 'participant_count'))
+    for user in users:
+        for debate_id, participant_count in counts.items():
+            live.publish(debate_id, live.PARTICIPANT_JOINED, user=live.user_payload(user),
+                         participant_count=participant_count)
@@ -1,14 +1,96 @@
-from celery import shared_task
+import logging
+
+from celery import shared_task, current_app
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from .models import Debate
-from django.db.models import Q
+from .transitions import transition_due_debates
+from . import vote_buffer
+from .reconciliation import reconcile_counters as reconcile
+
+logger = logging.getLogger(__name__)
+
+
+def _transition_task_id(debate_id, transition, at):
+    return f"debate-{debate_id}-{transition}-{at.timestamp()}"
+
+
+def schedule_status_transitions(debate):
+    """
+    Queues one-shot tasks that move the debate to Ongoing at its start time and
+    to Finished at its end time. The task ids are derived from the debate id and
+    the target time, so a later reschedule can revoke them without storing them.
+    """
+    if debate.status == "Scheduled":
+        start_debate.apply_async(
+            args=(debate.pk, debate.start_time.isoformat()),
+            eta=debate.start_time,
+            task_id=_transition_task_id(debate.pk, "start", debate.start_time),
+        )
+    if debate.status in ("Scheduled", "Ongoing"):
+        end_debate.apply_async(
+            args=(debate.pk, debate.end_time.isoformat()),
+            eta=debate.end_time,
+            task_id=_transition_task_id(debate.pk, "end", debate.end_time),
+        )
+
+
+def revoke_status_transitions(debate_id, start_time, end_time):
+    """
+    Revokes the transition tasks queued for the given start and end time. Revoking
+    is best effort, the tasks themselves also check that the debate still matches.
+    """
+    current_app.control.revoke([
+        _transition_task_id(debate_id, "start", start_time),
+        _transition_task_id(debate_id, "end", end_time),
+    ])
+
+
+def _run_transition(task, debate_id, from_status, time_field, expected):
+    expected = parse_datetime(expected)
+    if not Debate.objects.filter(pk=debate_id, status=from_status, **{time_field: expected}).exists():
+        # Rescheduled, canceled, deleted or already moved by another task.
+        return
+
+    remaining = (expected - timezone.now()).total_seconds()
+    if remaining > 0:
+        raise task.retry(countdown=remaining)
+
+    return transition_due_debates(debate_ids=[debate_id]).as_dict()
+
+
+@shared_task(bind=True, max_retries=5)
+def start_debate(self, debate_id, start_time):
+    return _run_transition(self, debate_id, "Scheduled", "start_time", start_time)
+
+
+@shared_task(bind=True, max_retries=5)
+def end_debate(self, debate_id, end_time):
+    return _run_transition(self, debate_id, "Ongoing", "end_time", end_time)
 
 
 @shared_task(bind=True)
 def update_debate_status(self):
-    debates = Debate.objects.all()
+    """
+    Safety net for transitions whose one-shot task was lost (e.g. the worker was
+    down at the time). Due debates are moved in bulk, nothing else is loaded.
+    """
+    result = transition_due_debates()
+    logger.info("Debate status updated: %d started, %d finished, %d winners in %.3fs",
+                result.started, result.finished, result.winners, result.duration)
+    return result.as_dict()
+
+
+@shared_task
+def flush_vote_buffer():
+    """Writes the vote deltas collected in write-behind mode to the database."""
+    if not vote_buffer.enabled():
+        return None
+    return vote_buffer.flush()
 
-    for debate in debates.iterator():
-        debate.update_status()
-        debate.save()
 
-    print("Debate status updated")
+@shared_task
+def reconcile_counters(chunk_size=1000):
+    """Recomputes vote counts, xp, wins and levels in case a counter drifted."""
+    return {name: {"checked": result.checked, "corrected": result.corrected}
+            for name, result in reconcile(chunk_size).items()}
@@ -0,0 +1,160 @@
+"""
+Helpers for the query-budget tests.
+
+`seed_round` fills the database through `debate.seeding.seed` with its uniform
+layout and returns what it created: users, categories, debates in every
+status, participants, arguments and votes. `QueryCounter` counts the queries a
+block runs and the rows it fetches. `QueryBudgetTestCase` combines them: every
+budget is checked once against the seeded data and once after a four times
+larger round has been added, so a query count that grows with the data fails
+the test.
+"""
+from dataclasses import dataclass, field
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.utils import CursorWrapper
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from user import leaderboard
+from user.models import User
+from .models import Argument, Category, Debate
+from .seeding import seed
+
+PASSWORD = "budget-password"
+
+
+@dataclass
+class SeedRound:
+    """Everything one call of `seed_round` created, grouped the way tests look it up."""
+    users: list
+    categories: list
+    debates: dict = field(default_factory=dict)
+    arguments: dict = field(default_factory=dict)
+    participants: dict = field(default_factory=dict)
+
+    def debate(self, status="Ongoing"):
+        return self.debates[status][0]
+
+    def argument(self, status="Ongoing"):
+        return self.arguments[self.debate(status).pk][0]
+
+    def user(self, pk):
+        return next(user for user in self.users if user.pk == pk)
+
+    def outsider(self, debate):
+        """A user of this round who does not take part in `debate`."""
+        return next(user for user in self.users if user.pk not in self.participants[debate.pk])
+
+
+def seed_round(scale=1, prefix="r1", categories=None):
+    """
+    Seeds `10 * scale` users, 3 categories unless `categories` are given,
+    `2 * scale` debates per status with `5 * scale` participants each,
+    `seeding.ARGUMENTS_PER_DEBATE` arguments per started debate and `3 * scale`
+    votes per argument. The argument count per debate does not scale, so pages
+    showing one debate stay comparable between rounds.
+    """
+    seed(users=10 * scale, categories=3, debates=2 * scale * len(Debate.STATUS_CHOICES),
+         mean_participants=5 * scale, password=PASSWORD, prefix=prefix, layout="uniform",
+         category_ids=None if categories is None else [category.pk for category in categories])
+
+    users = list(User.objects.filter(username__startswith=f"{prefix}-").order_by('pk'))
+    if categories is None:
+        categories = list(Category.objects.filter(slug__startswith=f"{prefix}-category-").order_by('pk'))
+    data = SeedRound(users=users, categories=categories)
+    for debate in Debate.objects.filter(author__in=users).order_by('pk'):
+        data.debates.setdefault(debate.status, []).append(debate)
+        data.participants[debate.pk] = set()
+    memberships = Debate.participants.through.objects.filter(debate_id__in=data.participants)
+    for debate_id, user_id in memberships.values_list('debate_id', 'user_id'):
+        data.participants[debate_id].add(user_id)
+    for argument in Argument.objects.filter(debate_id__in=data.participants).order_by('pk'):
+        data.arguments.setdefault(argument.debate_id, []).append(argument)
+    return data
+
+
+class QueryCounter:
+    """
+    Counts the queries run and the rows fetched inside a `with` block. Rows are
+    counted as the database cursor hands them out, so a queryset that loads a
+    whole table shows up even when it runs a single query.
+    """
+
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        self.context = CaptureQueriesContext(connections[using])
+        self.rows = 0
+
+    @property
+    def queries(self):
+        return len(self.context.captured_queries)
+
+    def _counting(self, name):
+        def fetch(cursor, *args):
+            result = getattr(cursor.cursor, name)(*args)
+            if name == 'fetchone':
+                self.rows += result is not None
+            else:
+                self.rows += len(result)
+            return result
+        return fetch
+
+    def __enter__(self):
+        self.patches = [mock.patch.object(CursorWrapper, name, self._counting(name), create=True)
+                        for name in ('fetchone', 'fetchmany', 'fetchall')]
+        for patch in self.patches:
+            patch.start()
+        self.context.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.context.__exit__(*exc_info)
+        for patch in reversed(self.patches):
+            patch.stop()
+
+
+class QueryBudgetTestCase(TestCase):
+    """
+    `assertQueryBudget(request, queries, rows)` runs `request(round)` against the
+    first seeded round, seeds a four times larger second round and runs
+    `request(round)` against it. Both runs must stay within the budget and run
+    the same number of queries. Each run starts from an empty cache, so cached
+    pages do not hide the queries behind them. `login(round)` picks the user the
+    request is made as; logging in is not counted. Returns `(round, response)`
+    for both runs, so tests can check what the request answered.
+    """
+    GROWTH = 4
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.small = seed_round(scale=1, prefix="r1")
+
+    def measure(self, request, data, login=None):
+        cache.clear()
+        leaderboard.rebuild()
+        if login is not None:
+            self.login(login(data))
+        with QueryCounter() as counter:
+            response = request(data)
+        self.assertLess(response.status_code, 400, getattr(response, 'content', b'')[:500])
+        return counter, response
+
+    def login(self, user):
+        self.client.force_login(user)
+
+    def assertQueryBudget(self, request, queries, rows=None, login=None):
+        small, small_response = self.measure(request, self.small, login)
+        large_round = seed_round(scale=self.GROWTH, prefix="r2", categories=self.small.categories)
+        large, large_response = self.measure(request, large_round, login)
+
+        for label, counter in (("small", small), ("large", large)):
+            self.assertLessEqual(counter.queries, queries,
+                                 f"{counter.queries} queries with the {label} data set, budget is {queries}:\n" +
+                                 "\n".join(query['sql'] for query in counter.context.captured_queries))
+            if rows is not None:
+                self.assertLessEqual(counter.rows, rows,
+                                     f"{counter.rows} rows fetched with the {label} data set, budget is {rows}")
+        self.assertEqual(small.queries, large.queries, "the number of queries grows with the data")
+        return [(self.small, small_response), (large_round, large_response)]
@@ -1,3 +1,876 @@
-from django.test import TestCase
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, connection, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.test import APIClient
+
+from debatePlatform.db_router import (PrimaryReplicaRouter, ReplicaRoutingMiddleware, STICKY_COOKIE,
+                                      read_from_replicas)
+from user import leaderboard
+from user.models import User, level_for_xp
+from .models import Argument, Debate, Vote, VoteBufferFlush
+from .arguments import delete_argument
+from .participants import add_participants, is_participant
+from .query_audit import audit
+from .routing import websocket_urlpatterns
+from .reconciliation import reconcile_counters, reconcile_users, reconcile_vote_counts
+from .retries import retry_on_lock
+from .search import search_debates
+from .tasks import end_debate, start_debate
+from .votes import VOTE_REWARD_XP, toggle_vote, voted_argument_ids
+from . import live, participants, transitions, vote_buffer
+from .transitions import WINNER_REWARD_XP, finalize_debates, transition_due_debates
+from .testing import QueryBudgetTestCase, seed_round
+
+
+class DebatePageQueryBudgetTests(QueryBudgetTestCase):
+    """Query and row budgets of the pages in `debate/views.py`, and what they show."""
+
+    def assertListsDebates(self, response, expected):
+        """The page shows a full page of `expected`, or all of them, with their titles and participant counts."""
+        shown = list(response.context['debates'])
+        self.assertEqual(len(shown), min(len(expected), 8))
+        self.assertLessEqual({debate.pk for debate in shown}, {debate.pk for debate in expected})
+        for debate in shown:
+            self.assertContains(response, f'<h5 class="card-title">{debate.title}</h5>')
+            self.assertContains(response, f"<small>Participants: {debate.participant_count}</small>")
+
+    def assertShowsDebate(self, response, debate, arguments):
+        self.assertEqual(response.context['debate'], debate)
+        self.assertContains(response, f'<span id="participant-count">{debate.participant_count}</span>')
+        for argument in arguments:
+            self.assertContains(response, argument.text)
+            self.assertContains(response, f'data-vote-count="{argument.pk}">{argument.vote_count} votes</span>')
+
+    def test_home(self):
+        runs = self.assertQueryBudget(lambda data: self.client.get(reverse('home')), queries=6, rows=40)
+        users = []
+        for data, response in runs:
+            users += data.users
+            expected = sorted(users, key=lambda user: (-user.xp, user.pk))[:10]
+            self.assertEqual(response.context['xp_leaderboard'], expected)
+            for user in expected:
+                self.assertContains(response, user.username)
+
+    def test_debate_listing(self):
+        for data, response in self.assertQueryBudget(lambda data: self.client.get(reverse('debate_listing')),
+                                                     queries=2, rows=12):
+            # Each round's debates have more participants than the one before, so they come first.
+            self.assertListsDebates(response, [debate for debates in data.debates.values() for debate in debates])
+
+    def test_debate_detail_anonymous(self):
+        for data, response in self.assertQueryBudget(
+                lambda data: self.client.get(reverse('debate_detail', args=[data.debate().pk])), queries=3, rows=8):
+            self.assertShowsDebate(response, data.debate(), data.arguments[data.debate().pk])
+
+    def test_debate_detail_participant(self):
+        self.assertQueryBudget(lambda data: self.client.get(reverse('debate_detail', args=[data.debate().pk])),
+                               queries=7, rows=14, login=lambda data: data.users[0])
+
+    def test_finished_debate_detail(self):
+        for data, response in self.assertQueryBudget(
+                lambda data: self.client.get(reverse('debate_detail', args=[data.debate("Finished").pk])),
+                queries=3, rows=8):
+            self.assertShowsDebate(response, data.debate("Finished"), data.arguments[data.debate("Finished").pk])
+
+    def test_search(self):
+        ongoing = []
+        for data, response in self.assertQueryBudget(
+                lambda data: self.client.get(reverse('search'), {'query': 'Debate Ongoing'}), queries=3, rows=12):
+            ongoing += data.debates["Ongoing"]
+            self.assertListsDebates(response, ongoing)
+
+    def test_category(self):
+        category = self.small.categories[0]
+        for data, response in self.assertQueryBudget(
+                lambda data: self.client.get(reverse('category', args=[category.slug])), queries=2, rows=12):
+            self.assertListsDebates(response, [debate for debates in data.debates.values() for debate in debates
+                                               if debate.category_id == category.pk])
+
+    def test_filter(self):
+        category = self.small.categories[0]
+        ongoing = []
+        for data, response in self.assertQueryBudget(
+                lambda data: self.client.get(reverse('filter'), {'status': 'Ongoing', 'category': category.pk}),
+                queries=2, rows=12):
+            ongoing += [debate for debate in data.debates["Ongoing"] if debate.category_id == category.pk]
+            self.assertListsDebates(response, ongoing)
+
+    def test_create_debate_form(self):
+        self.assertQueryBudget(lambda data: self.client.get(reverse('create_debate')),
+                               queries=3, rows=6, login=lambda data: data.users[0])
+
+
+class DebateActionQueryBudgetTests(QueryBudgetTestCase):
+    """Query and row budgets of the form posts in `debate/views.py`."""
+
+    def post(self, url, data=None):
+        return self.client.post(url, data or {}, HTTP_REFERER='/')
+
+    def test_join(self):
+        self.assertQueryBudget(lambda data: self.post(reverse('join', args=[data.debate().pk])),
+                               queries=9, rows=10, login=lambda data: data.outsider(data.debate()))
+
+    def test_create_argument(self):
+        self.assertQueryBudget(
+            lambda data: self.post(reverse('create_argument', args=[data.debate().pk]),
+                                   {'text': "A new argument", 'side': "Pro"}),
+            queries=4, rows=4, login=lambda data: data.users[0])
+
+    def test_vote(self):
+        # Casting runs the insert in a savepoint of its own, three queries and its returned id more than an unvote.
+        self.assertQueryBudget(lambda data: self.post(reverse('vote', args=[data.argument().pk])),
+                               queries=11, rows=5, login=lambda data: data.outsider(data.debate()))
+
+    def test_unvote(self):
+        self.assertQueryBudget(lambda data: self.post(reverse('vote', args=[data.argument().pk])),
+                               queries=8, rows=4,
+                               login=lambda data: User.objects.filter(user_votes__argument=data.argument())[0])
+
+    def test_delete_argument(self):
+        self.assertQueryBudget(lambda data: self.post(reverse('delete_argument', args=[data.argument().pk])),
+                               queries=9, rows=4, login=lambda data: data.user(data.argument().author_id))
+
+    def test_delete_debate(self):
+        self.assertQueryBudget(lambda data: self.post(reverse('delete_debate', args=[data.debate("Scheduled").pk])),
+                               queries=7, rows=4, login=lambda data: data.debate("Scheduled").author)
+
+
+class AdminQueryBudgetTests(QueryBudgetTestCase):
+    """Query and row budgets of the admin change lists of the debate models."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.admin = User.objects.create_superuser(username="budget-admin", slug="budget-admin", password="x")
+
+    def assertChangeListBudget(self, model, queries, rows):
+        self.assertQueryBudget(lambda data: self.client.get(reverse(f'admin:debate_{model}_changelist')),
+                               queries=queries, rows=rows, login=lambda data: self.admin)
+
+    def test_category_changelist(self):
+        self.assertChangeListBudget('category', queries=5, rows=10)
+
+    def test_debate_changelist(self):
+        self.assertChangeListBudget('debate', queries=5, rows=110)
+
+    def test_argument_changelist(self):
+        self.assertChangeListBudget('argument', queries=5, rows=110)
+
+    def test_vote_changelist(self):
+        self.assertChangeListBudget('vote', queries=5, rows=110)
+
+
+class QueryAuditTests(TestCase):
+    """The hot querysets of the audit stay valid SQL and keep using their indexes as the views change."""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_round(scale=5)
+
+    def test_every_hot_queryset_uses_its_indexes(self):
+        reports = audit()
+        self.assertGreater(len(reports), 20)
+        for report in reports:
+            self.assertTrue(report.plan, report.query.name)
+            self.assertEqual(report.issues, [], f"{report.query.name}:\n{report.plan}")
+
+
+@override_settings(REPLICA_DATABASES=['replica1'], REPLICA_STICKY_SECONDS=5)
+class ReplicaRoutingTests(SimpleTestCase):
+    """Which database the router picks for the reads and writes of a request."""
+
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+
+    def route(self, request, write=False):
+        def view(request):
+            reads = [self.router.db_for_read(Debate)]
+            if write:
+                self.router.db_for_write(Debate)
+                reads.append(self.router.db_for_read(Debate))
+            return HttpResponse(",".join(reads))
+        return ReplicaRoutingMiddleware(view)(request)
+
+    def test_read_only_request_reads_from_replica(self):
+        response = self.route(RequestFactory().get('/debates/'))
+        self.assertEqual(response.content, b"replica1")
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+
+    def test_write_request_reads_from_primary(self):
+        self.assertEqual(self.route(RequestFactory().post('/vote/')).content, b"default")
+
+    def test_reads_after_write_stay_on_primary(self):
+        response = self.route(RequestFactory().get('/debates/'), write=True)
+        self.assertEqual(response.content, b"replica1,default")
+        self.assertEqual(response.cookies[STICKY_COOKIE]['max-age'], 5)
+
+    def test_client_that_wrote_reads_from_primary(self):
+        request = RequestFactory().get('/debates/')
+        request.COOKIES[STICKY_COOKIE] = '1'
+        self.assertEqual(self.route(request).content, b"default")
+
+    def test_reads_outside_requests_go_to_primary(self):
+        self.assertEqual(self.router.db_for_read(Debate), "default")
+        with read_from_replicas():
+            self.assertEqual(self.router.db_for_read(Debate), "replica1")
+        self.assertEqual(self.router.db_for_write(Debate), "default")
+
+    @override_settings(REPLICA_DATABASES=[])
+    def test_without_replicas_everything_goes_to_primary(self):
+        self.assertEqual(self.route(RequestFactory().get('/debates/')).content, b"default")
+
+
+@override_settings(DATABASE_LOCK_RETRIES=2, DATABASE_LOCK_BACKOFF=0)
+class RetryOnLockTests(SimpleTestCase):
+    """Writes that find the database locked are retried a bounded number of times."""
+    # Outside of a test transaction, so the retries are not suppressed.
+    databases = {'default'}
+
+    def failing(self, *errors):
+        calls = []
+
+        @retry_on_lock
+        def write():
+            calls.append(None)
+            if len(calls) <= len(errors):
+                raise errors[len(calls) - 1]
+            return len(calls)
+        return write, calls
+
+    def test_retries_until_the_lock_is_free(self):
+        write, _ = self.failing(OperationalError("database is locked"), OperationalError("database is locked"))
+        self.assertEqual(write(), 3)
+
+    def test_gives_up_after_the_last_retry(self):
+        write, calls = self.failing(*[OperationalError("database is locked")] * 3)
+        with self.assertRaises(OperationalError):
+            write()
+        self.assertEqual(len(calls), 3)
+
+    def test_other_errors_are_not_retried(self):
+        write, calls = self.failing(OperationalError("no such table: debate_debate"))
+        with self.assertRaises(OperationalError):
+            write()
+        self.assertEqual(len(calls), 1)
+
+    def test_inside_a_transaction_the_error_is_raised(self):
+        write, calls = self.failing(OperationalError("database is locked"))
+        with self.assertRaises(OperationalError), transaction.atomic():
+            write()
+        self.assertEqual(len(calls), 1)
+
+
+class ParticipantTests(TestCase):
+    """Joins insert only the missing memberships and count each new participant once."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_round()
+
+    def assertAdds(self, debate, user_ids, expected):
+        count = Debate.objects.get(pk=debate.pk).participant_count
+        self.assertEqual(add_participants(debate, user_ids), expected)
+        self.assertEqual(Debate.objects.get(pk=debate.pk).participant_count, count + len(expected))
+        self.assertTrue(all(is_participant(debate.pk, user_id) for user_id in user_ids))
+
+    def test_join_twice(self):
+        debate = self.data.debate()
+        outsider = self.data.outsider(debate)
+        self.assertFalse(is_participant(debate.pk, outsider.pk))
+        self.assertAdds(debate, [outsider.pk], {outsider.pk})
+        self.assertAdds(debate, [outsider.pk], set())
+
+    def test_add_members_and_outsiders(self):
+        debate = self.data.debate()
+        members = self.data.participants[debate.pk]
+        outsiders = {user.pk for user in self.data.users} - members
+        self.assertAdds(debate, [user.pk for user in self.data.users], outsiders)
+
+    def test_without_insert_returning(self):
+        debate = self.data.debate()
+        outsiders = {user.pk for user in self.data.users} - self.data.participants[debate.pk]
+        with mock.patch.object(connection.features, 'can_return_columns_from_insert', False):
+            self.assertAdds(debate, [user.pk for user in self.data.users], outsiders)
+
+    @override_settings(REPLICA_DATABASES=['replica1'])
+    def test_join_from_a_read_only_block_writes_to_the_primary(self):
+        debate = self.data.debate()
+        first, second = [user.pk for user in self.data.users if user.pk not in self.data.participants[debate.pk]][:2]
+        count = Debate.objects.get(pk=debate.pk).participant_count
+        with read_from_replicas():
+            self.assertEqual(add_participants(debate, [first]), {first})
+        with read_from_replicas(), \
+                mock.patch.object(connection.features, 'can_return_columns_from_insert', False):
+            self.assertEqual(add_participants(debate, [second]), {second})
+        self.assertEqual(Debate.objects.get(pk=debate.pk).participant_count, count + 2)
+
+    def test_without_insert_returning_waits_for_concurrent_joins(self):
+        debate = self.data.debate()
+        outsider = self.data.outsider(debate)
+        count = Debate.objects.get(pk=debate.pk).participant_count
+        lock_debate = participants._lock_debate
+
+        def join_while_waiting(debate_id, using):
+            # A concurrent join of the same user commits while this one waits for the lock.
+            participants.Participant.objects.create(debate_id=debate_id, user_id=outsider.pk)
+            lock_debate(debate_id, using)
+
+        with mock.patch.object(connection.features, 'can_return_columns_from_insert', False), \
+                mock.patch.object(participants, '_lock_debate', side_effect=join_while_waiting):
+            self.assertEqual(add_participants(debate, [outsider.pk]), set())
+        self.assertEqual(Debate.objects.get(pk=debate.pk).participant_count, count)
+        self.assertTrue(is_participant(debate.pk, outsider.pk))
+
+
+class StatusTransitionSchedulingTests(TestCase):
+    """Creating, rescheduling and canceling a debate queues and revokes its one-shot transition tasks."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_round()
+
+    def setUp(self):
+        patches = [mock.patch.object(start_debate, 'apply_async'), mock.patch.object(end_debate, 'apply_async'),
+                   mock.patch('debate.tasks.current_app')]
+        self.start, self.end, app = [patch.start() for patch in patches]
+        self.revoke = app.control.revoke
+        for patch in patches:
+            self.addCleanup(patch.stop)
+
+    def assertQueued(self, task, debate, transition, at):
+        task.assert_called_once()
+        (debate_id, time), options = task.call_args.kwargs['args'], task.call_args.kwargs
+        self.assertEqual((debate_id, parse_datetime(time)), (debate.pk, at))
+        self.assertEqual(options['eta'], at)
+        self.assertEqual(options['task_id'], f"debate-{debate.pk}-{transition}-{at.timestamp()}")
+
+    def test_created_debate_queues_start_and_end(self):
+        start_time = (timezone.now() + timedelta(days=1)).replace(second=0, microsecond=0)
+        self.client.force_login(self.data.users[0])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('create_debate'), {
+                'title': "A scheduled debate", 'description': "When does it start?",
+                'category': self.data.categories[0].pk, 'start_time': start_time.strftime("%Y-%m-%d %H:%M"),
+                'end_time': (start_time + timedelta(hours=1)).strftime("%Y-%m-%d %H:%M"),
+            })
+        debate = Debate.objects.get(title="A scheduled debate")
+        self.assertQueued(self.start, debate, "start", debate.start_time)
+        self.assertQueued(self.end, debate, "end", debate.end_time)
+        self.revoke.assert_not_called()
+
+    def test_ongoing_debate_queues_only_the_end(self):
+        debate = self.data.debate()
+        with self.captureOnCommitCallbacks(execute=True):
+            debate.schedule_status_transitions()
+        self.start.assert_not_called()
+        self.assertQueued(self.end, debate, "end", debate.end_time)
+
+    def test_rescheduled_debate_revokes_the_previous_tasks(self):
+        debate = self.data.debate("Scheduled")
+        previous_start_time, previous_end_time = debate.start_time, debate.end_time
+        start_time = timezone.now() + timedelta(days=3)
+        client = APIClient()
+        client.force_authenticate(debate.author)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.patch(reverse('debates-detail', args=[debate.pk]), {
+                'start_time': start_time.isoformat(), 'end_time': (start_time + timedelta(hours=1)).isoformat(),
+            })
+        self.assertEqual(response.status_code, 200, response.content)
+
+        self.revoke.assert_called_once_with([
+            f"debate-{debate.pk}-start-{previous_start_time.timestamp()}",
+            f"debate-{debate.pk}-end-{previous_end_time.timestamp()}",
+        ])
+        debate.refresh_from_db()
+        self.assertEqual(debate.start_time, start_time)
+        self.assertQueued(self.start, debate, "start", debate.start_time)
+        self.assertQueued(self.end, debate, "end", debate.end_time)
+
+    def test_canceled_debate_revokes_its_tasks(self):
+        debate = self.data.debate("Scheduled")
+        with self.captureOnCommitCallbacks(execute=True):
+            debate.cancel_debate()
+        self.revoke.assert_called_once_with([f"debate-{debate.pk}-start-{debate.start_time.timestamp()}",
+                                             f"debate-{debate.pk}-end-{debate.end_time.timestamp()}"])
+        self.start.assert_not_called()
+        self.end.assert_not_called()
+
+
+class TransitionTests(TestCase):
+    """Due debates move to their next status in bulk and each finished debate gets one winner."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_round()
+
+    def statuses(self):
+        return dict(Debate.objects.values_list('pk', 'status'))
+
+    def test_ongoing_debates_finish_with_a_winner(self):
+        debate = self.data.debate()
+        arguments = self.data.arguments[debate.pk]
+        # The most voted argument wins; the other debate ties, so its oldest argument wins.
+        Argument.objects.filter(pk=arguments[2].pk).update(vote_count=10)
+        author = User.objects.get(pk=arguments[2].author_id)
+
+        result = transition_due_debates(now=timezone.now() + timedelta(hours=2))
+
+        self.assertEqual((result.started, result.finished, result.winners), (0, 2, 2))
+        self.assertTrue(all(status == "Finished" for pk, status in self.statuses().items()
+                            if pk in {debate.pk for debate in self.data.debates["Ongoing"]}))
+        self.assertEqual(set(Argument.objects.filter(winner=True).values_list('pk', flat=True)),
+                         {arguments[2].pk, self.data.arguments[self.data.debates["Ongoing"][1].pk][0].pk})
+        winner = User.objects.get(pk=author.pk)
+        self.assertEqual(winner.xp, author.xp + WINNER_REWARD_XP)
+        self.assertEqual(winner.wins, author.wins + 1)
+        self.assertEqual(winner.level, level_for_xp(winner.xp))
+
+    def test_scheduled_debates_start(self):
+        result = transition_due_debates(now=timezone.now() + timedelta(days=1, hours=1))
+        self.assertEqual((result.started, result.finished, result.winners), (2, 2, 2))
+        statuses = self.statuses()
+        self.assertTrue(all(statuses[debate.pk] == "Ongoing" for debate in self.data.debates["Scheduled"]))
+
+    def test_nothing_due(self):
+        before = self.statuses()
+        result = transition_due_debates()
+        self.assertEqual((result.started, result.finished, result.winners), (0, 0, 0))
+        self.assertEqual(self.statuses(), before)
+
+    def test_running_twice_changes_nothing_more(self):
+        now = timezone.now() + timedelta(hours=2)
+        transition_due_debates(now=now)
+        xp = dict(User.objects.values_list('pk', 'xp'))
+
+        result = transition_due_debates(now=now)
+        self.assertEqual((result.started, result.finished, result.winners), (0, 0, 0))
+        self.assertEqual(dict(User.objects.values_list('pk', 'xp')), xp)
+        self.assertEqual(Argument.objects.filter(winner=True).count(), 2)
+
+    def test_finalizing_again_keeps_the_winner(self):
+        debate = self.data.debate("Finished")
+        self.assertEqual(finalize_debates([debate.pk]), 1)
+        xp = dict(User.objects.values_list('pk', 'xp'))
+        self.assertEqual(finalize_debates([debate.pk]), 0)
+        debate.finish_debate()
+        self.assertEqual(dict(User.objects.values_list('pk', 'xp')), xp)
+        self.assertEqual(Argument.objects.filter(debate=debate, winner=True).count(), 1)
+
+    def test_restricted_to_the_given_debates(self):
+        debate = self.data.debate()
+        result = transition_due_debates(now=timezone.now() + timedelta(days=3), debate_ids=[debate.pk])
+        self.assertEqual((result.started, result.finished, result.winners), (0, 1, 1))
+        self.assertEqual([pk for pk, status in self.statuses().items()
+                          if status == "Finished" and pk not in {d.pk for d in self.data.debates["Finished"]}],
+                         [debate.pk])
+
+    @mock.patch.object(transitions, 'CHUNK_SIZE', 1)
+    def test_backlog_in_chunks_without_update_returning(self):
+        with mock.patch.object(connection.features, 'can_return_columns_from_insert', False):
+            result = transition_due_debates(now=timezone.now() + timedelta(days=3))
+        self.assertEqual((result.started, result.finished, result.winners), (2, 4, 2))
+        self.assertNotIn("Scheduled", self.statuses().values())
+        self.assertNotIn("Ongoing", self.statuses().values())
+
+    @mock.patch.object(transitions, 'CHUNK_SIZE', 1)
+    def test_backlog_in_chunks(self):
+        result = transition_due_debates(now=timezone.now() + timedelta(days=3))
+        self.assertEqual((result.started, result.finished, result.winners), (2, 4, 2))
+
+
+class SearchTests(TestCase):
+    """Full-text search ranks title matches first and follows every change of a debate."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_round()
+        author = cls.data.users[0]
+        times = {'start_time': timezone.now(), 'end_time': timezone.now() + timedelta(hours=1)}
+        cls.in_description = Debate.objects.create(
+            title="Public transport", description="Would free buses help the climate?", author=author, **times)
+        cls.in_title = Debate.objects.create(
+            title="Climate policy", description="Should carbon be taxed?", author=author, **times)
+
+    def search(self, query):
+        return [debate.pk for debate in search_debates(Debate.objects.all(), query)]
+
+    def test_title_matches_rank_first(self):
+        self.assertEqual(self.search("climate"), [self.in_title.pk, self.in_description.pk])
+
+    def test_every_word_must_match_as_a_prefix(self):
+        self.assertEqual(self.search("clim tax"), [self.in_title.pk])
+        self.assertEqual(self.search("climate unicorns"), [])
+        self.assertEqual(self.search("?!"), [])
+
+    def test_updated_debate_is_reindexed(self):
+        Debate.objects.filter(pk=self.in_title.pk).update(title="Carbon policy", description="Is a tax fair?")
+        self.assertEqual(self.search("climate"), [self.in_description.pk])
+        self.assertEqual(self.search("carbon"), [self.in_title.pk])
+
+    def test_deleted_debate_is_removed(self):
+        self.in_description.delete()
+        self.assertEqual(self.search("climate"), [self.in_title.pk])
+        self.assertEqual(self.search("buses"), [])
+
+
+class ToggleVoteTests(TestCase):
+    """A vote moves the argument's count and its author's xp, level and leaderboard score by one step."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_round()
+
+    def setUp(self):
+        leaderboard.rebuild()
+        self.argument = Argument.objects.get(pk=self.data.argument().pk)
+        self.voter = User.objects.exclude(pk=self.argument.author_id).exclude(user_votes__argument=self.argument)[0]
+        self.author = User.objects.get(pk=self.argument.author_id)
+
+    def toggle(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return toggle_vote(self.voter, self.argument)
+
+    def assertState(self, voted, votes):
+        author = User.objects.get(pk=self.author.pk)
+        self.assertEqual(Vote.objects.filter(user=self.voter, argument=self.argument).exists(), voted)
+        self.assertEqual(Argument.objects.get(pk=self.argument.pk).vote_count, self.argument.vote_count + votes)
+        self.assertEqual(author.xp, self.author.xp + VOTE_REWARD_XP * votes)
+        self.assertEqual(author.level, level_for_xp(author.xp))
+        self.assertEqual(dict(leaderboard.get_leaderboard().top(leaderboard.XP, len(self.data.users)))[author.pk],
+                         author.xp)
+
+    def test_vote(self):
+        result = self.toggle()
+        self.assertEqual((result.voted, result.vote_count), (True, self.argument.vote_count + 1))
+        self.assertState(voted=True, votes=1)
+
+    def test_vote_again_removes_it(self):
+        self.toggle()
+        result = self.toggle()
+        self.assertEqual((result.voted, result.vote_count), (False, self.argument.vote_count))
+        self.assertState(voted=False, votes=0)
+
+    def test_concurrent_double_vote_counts_once(self):
+        self.toggle()
+        # The other request inserted the vote after this one found nothing to delete.
+        with mock.patch('django.db.models.query.QuerySet.delete', return_value=(0, {})):
+            result = self.toggle()
+        self.assertEqual((result.voted, result.vote_count), (True, self.argument.vote_count + 1))
+        self.assertState(voted=True, votes=1)
+
+    def test_without_update_returning(self):
+        with mock.patch.object(connection, 'vendor', 'mysql'):
+            result = self.toggle()
+        self.assertEqual((result.voted, result.vote_count), (True, self.argument.vote_count + 1))
+        self.assertState(voted=True, votes=1)
+
+    @override_settings(REPLICA_DATABASES=['replica1'])
+    def test_vote_from_a_read_only_block_writes_to_the_primary(self):
+        with read_from_replicas():
+            result = self.toggle()
+        self.assertEqual((result.voted, result.vote_count), (True, self.argument.vote_count + 1))
+        self.assertState(voted=True, votes=1)
+
+
+@override_settings(VOTE_BUFFER_ENABLED=True)
+class VoteBufferTests(TransactionTestCase):
+    """Buffered votes are visible right away and written to the database exactly once."""
+
+    def setUp(self):
+        vote_buffer.get_buffer.cache_clear()
+        self.addCleanup(vote_buffer.get_buffer.cache_clear)
+        self.buffer = vote_buffer.get_buffer()
+        self.data = seed_round()
+        self.argument = Argument.objects.get(pk=self.data.argument().pk)
+        self.author = User.objects.get(pk=self.argument.author_id)
+        self.voter = User.objects.exclude(pk=self.argument.author_id).exclude(user_votes__argument=self.argument)[0]
+
+    def assertStored(self, votes):
+        self.assertEqual(Argument.objects.get(pk=self.argument.pk).vote_count, self.argument.vote_count + votes)
+        author = User.objects.get(pk=self.author.pk)
+        self.assertEqual(author.xp, self.author.xp + VOTE_REWARD_XP * votes)
+        self.assertEqual(author.level, level_for_xp(author.xp))
+
+    def assertShown(self, votes):
+        argument, author = vote_buffer.apply_pending([Argument.objects.get(pk=self.argument.pk),
+                                                      User.objects.get(pk=self.author.pk)])
+        self.assertEqual(argument.vote_count, self.argument.vote_count + votes)
+        self.assertEqual(author.xp, self.author.xp + VOTE_REWARD_XP * votes)
+        self.assertEqual(author.level, level_for_xp(author.xp))
+        # Applying again does not add the deltas twice.
+        vote_buffer.apply_pending([argument, author])
+        self.assertEqual(argument.vote_count, self.argument.vote_count + votes)
+
+    def test_votes_are_stored_by_the_flush(self):
+        result = toggle_vote(self.voter, self.argument)
+        self.assertEqual(result.vote_count, self.argument.vote_count + 1)
+        self.assertStored(0)
+        self.assertShown(1)
+
+        self.assertEqual(vote_buffer.flush(), (1, 1))
+        self.assertStored(1)
+        self.assertShown(1)
+        self.assertEqual(self.buffer.pending(vote_buffer.ARGUMENTS), {})
+        self.assertEqual(vote_buffer.flush(), (0, 0))
+
+    def test_votes_cast_during_a_flush_are_kept(self):
+        toggle_vote(self.voter, self.argument)
+        take_snapshot = self.buffer.take_snapshot
+
+        def vote_meanwhile(token):
+            take_snapshot(token)
+            toggle_vote(self.voter, self.argument)
+
+        with mock.patch.object(self.buffer, 'take_snapshot', vote_meanwhile):
+            vote_buffer.flush()
+        self.assertStored(1)
+        self.assertShown(0)
+        self.assertEqual(self.buffer.pending(vote_buffer.ARGUMENTS), {self.argument.pk: -1})
+
+        vote_buffer.flush()
+        self.assertStored(0)
+
+    def test_flush_stopped_after_commit_is_not_applied_again(self):
+        toggle_vote(self.voter, self.argument)
+        with mock.patch.object(self.buffer, 'drop_snapshot', side_effect=RuntimeError("worker killed")):
+            with self.assertRaises(RuntimeError):
+                vote_buffer.flush()
+        self.assertStored(1)
+
+        self.assertEqual(vote_buffer.flush(), (0, 0))
+        self.assertStored(1)
+        self.assertShown(1)
+
+    def test_flush_stopped_before_commit_is_applied_by_the_next(self):
+        toggle_vote(self.voter, self.argument)
+        with mock.patch.object(VoteBufferFlush.objects, 'create', side_effect=RuntimeError("worker killed")):
+            with self.assertRaises(RuntimeError):
+                vote_buffer.flush()
+        self.assertStored(0)
+        self.assertShown(1)
+
+        self.assertEqual(vote_buffer.flush(), (1, 1))
+        self.assertStored(1)
+        self.assertShown(1)
+
+    def test_flush_inside_a_transaction_is_refused(self):
+        with self.assertRaises(transaction.TransactionManagementError), transaction.atomic():
+            vote_buffer.flush()
+
+
+class VotedArgumentsCacheTests(TestCase):
+    """The cached set of arguments a user voted for follows every vote and unvote in the debate."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_round()
+
+    def setUp(self):
+        cache.clear()
+        self.debate = self.data.debate()
+        self.argument = Argument.objects.get(pk=self.data.argument().pk)
+        self.voter = User.objects.exclude(pk=self.argument.author_id).exclude(user_votes__argument=self.argument)[0]
+
+    def voted(self):
+        with self.assertNumQueries(0):
+            return voted_argument_ids(self.voter, self.debate)
+
+    def toggle(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            toggle_vote(self.voter, self.argument)
+        return voted_argument_ids(self.voter, self.debate)
+
+    def test_vote_and_unvote_invalidate_the_cached_ids(self):
+        before = voted_argument_ids(self.voter, self.debate)
+        self.assertNotIn(self.argument.pk, self.voted())
+
+        self.assertEqual(self.toggle(), before | {self.argument.pk})
+        self.assertIn(self.argument.pk, self.voted())
+
+        self.assertEqual(self.toggle(), before)
+        self.assertNotIn(self.argument.pk, self.voted())
+
+    def test_votes_in_other_debates_keep_the_cached_ids(self):
+        other = self.data.debate("Finished")
+        cached = voted_argument_ids(self.voter, other)
+        self.toggle()
+        with self.assertNumQueries(0):
+            self.assertEqual(voted_argument_ids(self.voter, other), cached)
+
+    def test_anonymous_users_have_no_votes(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(voted_argument_ids(AnonymousUser(), self.debate), set())
+
+
+class ReconciliationTests(TestCase):
+    """Reconciliation finds drifted counters, fixes them and leaves buffered votes alone."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_round()
+
+    def setUp(self):
+        self.argument = Argument.objects.get(pk=self.data.argument().pk)
+        self.author = User.objects.get(pk=self.argument.author_id)
+
+    def drift(self):
+        Argument.objects.filter(pk=self.argument.pk).update(vote_count=self.argument.vote_count + 5)
+        User.objects.filter(pk=self.author.pk).update(xp=999, wins=2, level="Rhetorician")
+
+    def reconcile(self, *args):
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('reconcile_counters', *args, stdout=out)
+        return out.getvalue()
+
+    def test_consistent_counters_have_no_mismatches(self):
+        results = reconcile_counters(chunk_size=3, dry_run=True)
+        self.assertEqual([mismatch for result in results.values() for mismatch in result.mismatches], [])
+        self.assertEqual(results['users'].checked, len(self.data.users))
+
+    def test_dry_run_reports_without_correcting(self):
+        self.drift()
+        output = self.reconcile('--dry-run', '--chunk-size', '4')
+        vote_count = self.argument.vote_count
+        self.assertIn(f"argument {self.argument.pk}: vote_count {vote_count + 5} -> {vote_count}", output)
+        self.assertIn(f"user {self.author.pk}: xp 999 -> {self.author.xp}", output)
+        self.assertIn(f"user {self.author.pk}: wins 2 -> 0", output)
+        self.assertIn(f"user {self.author.pk}: level Rhetorician -> {self.author.level}", output)
+        self.assertIn("1 mismatches found", output)
+        self.assertEqual(Argument.objects.get(pk=self.argument.pk).vote_count, vote_count + 5)
+        self.assertEqual(User.objects.get(pk=self.author.pk).xp, 999)
+
+    def test_drifted_counters_are_corrected(self):
+        leaderboard.rebuild()
+        self.drift()
+        output = self.reconcile('--chunk-size', '4')
+        self.assertIn("1 corrected", output)
+        self.assertEqual(Argument.objects.get(pk=self.argument.pk).vote_count, self.argument.vote_count)
+        author = User.objects.get(pk=self.author.pk)
+        self.assertEqual((author.xp, author.wins, author.level), (self.author.xp, 0, self.author.level))
+        self.assertIn((author.pk, author.xp), leaderboard.get_leaderboard().top(leaderboard.XP, 100))
+        self.assertEqual(self.reconcile('--dry-run').count("0 mismatches found"), 2)
+
+    @override_settings(VOTE_BUFFER_ENABLED=True)
+    def test_buffered_votes_are_not_counted_twice(self):
+        vote_buffer.get_buffer.cache_clear()
+        self.addCleanup(vote_buffer.get_buffer.cache_clear)
+        buffer = vote_buffer.get_buffer()
+        # Two of the argument's votes and their xp are still waiting in the buffer.
+        buffer.add(vote_buffer.ARGUMENTS, {self.argument.pk: 2})
+        buffer.add(vote_buffer.XP, {self.author.pk: 2 * VOTE_REWARD_XP})
+        Argument.objects.filter(pk=self.argument.pk).update(vote_count=0)
+        User.objects.filter(pk=self.author.pk).update(xp=self.author.xp - 2 * VOTE_REWARD_XP)
+
+        with mock.patch.object(buffer, 'pending', wraps=buffer.pending) as pending:
+            arguments = reconcile_vote_counts(chunk_size=2)
+            users = reconcile_users(chunk_size=2)
+        self.assertEqual(pending.call_count, 2)
+
+        self.assertEqual([(m.pk, m.stored, m.expected) for m in arguments.mismatches],
+                         [(self.argument.pk, 0, self.argument.vote_count - 2)])
+        self.assertEqual(Argument.objects.get(pk=self.argument.pk).vote_count, self.argument.vote_count - 2)
+        self.assertEqual(users.mismatches, [])
+        self.assertEqual(User.objects.get(pk=self.author.pk).xp, self.author.xp - 2 * VOTE_REWARD_XP)
+
+    def test_deleting_a_winning_argument_agrees_with_reconciliation(self):
+        debate = self.data.debate("Finished")
+        finalize_debates([debate.pk])
+        winner = Argument.objects.get(debate=debate, winner=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            delete_argument(winner)
+
+        author = User.objects.get(pk=winner.author_id)
+        self.assertEqual(author.wins, 0)
+        results = reconcile_counters(dry_run=True)
+        self.assertEqual(results['users'].mismatches, [])
+
+
+class DebateConsumerTests(TransactionTestCase):
+    """The debate socket sends a snapshot, then the events published for the debate."""
+
+    def setUp(self):
+        self.data = seed_round()
+        self.debate = self.data.debate()
+        self.argument = Argument.objects.get(pk=self.data.argument().pk)
+
+    def communicator(self, debate_id):
+        return WebsocketCommunicator(URLRouter(websocket_urlpatterns), f"/ws/debates/{debate_id}/")
+
+    def test_snapshot_then_updates(self):
+        voter = User.objects.exclude(pk=self.argument.author_id).exclude(user_votes__argument=self.argument)[0]
+
+        async def watch():
+            communicator = self.communicator(self.debate.pk)
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            snapshot = await communicator.receive_json_from()
+            await sync_to_async(toggle_vote)(voter, self.argument)
+            event = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return snapshot, event
+
+        snapshot, event = async_to_sync(watch)()
+        self.assertEqual(snapshot['type'], "snapshot")
+        self.assertEqual(snapshot['debate'], {'id': self.debate.pk, 'status': "Ongoing",
+                                              'participant_count': len(self.data.participants[self.debate.pk])})
+        self.assertEqual([argument['id'] for argument in snapshot['arguments']],
+                         [argument.pk for argument in self.data.arguments[self.debate.pk]])
+        self.assertEqual(event, {'type': "vote_count.changed", 'seq': event['seq'], 'debate': self.debate.pk,
+                                 'argument_id': self.argument.pk, 'vote_count': self.argument.vote_count + 1})
+        self.assertGreater(event['seq'], snapshot['seq'])
+
+    def test_events_are_sent_once_committed(self):
+        def publish(status, commit=True):
+            with transaction.atomic():
+                live.publish(self.debate.pk, live.STATUS_CHANGED, status=status)
+                transaction.set_rollback(not commit)
+
+        async def watch():
+            communicator = self.communicator(self.debate.pk)
+            await communicator.connect()
+            await communicator.receive_json_from()
+            await sync_to_async(publish)("Canceled", commit=False)
+            nothing = await communicator.receive_nothing()
+            await sync_to_async(publish)("Finished")
+            event = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return nothing, event
+
+        nothing, event = async_to_sync(watch)()
+        self.assertTrue(nothing)
+        self.assertEqual((event['type'], event['status']), ("status.changed", "Finished"))
+
+    def test_broken_channel_layer_does_not_fail_the_write(self):
+        voter = self.data.outsider(self.debate)
+        voted = Vote.objects.filter(user=voter, argument=self.argument).exists()
+        with mock.patch('debate.live.get_channel_layer', side_effect=ConnectionError("layer down")):
+            result = toggle_vote(voter, self.argument)
+        self.assertNotEqual(result.voted, voted)
+        self.assertEqual(Argument.objects.get(pk=self.argument.pk).vote_count, result.vote_count)
+
+    def test_unknown_debate_is_closed_with_4404(self):
+        async def watch():
+            communicator = self.communicator(0)
+            connected, _ = await communicator.connect()
+            closed = await communicator.receive_output()
+            await communicator.wait()
+            return connected, closed
+
+        connected, closed = async_to_sync(watch)()
+        # Accepted first, so the browser sees 4404 and stops reconnecting.
+        self.assertTrue(connected)
+        self.assertEqual(closed, {'type': "websocket.close", 'code': 4404})
@@ -0,0 +1,179 @@
+import time
+from collections import Counter
+from dataclasses import dataclass, asdict
+
+from django.db import connection, models, transaction
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from user import leaderboard
+from user.models import User, level_expression
+from . import live, vote_buffer
+from .caching import bump_version_on_commit, touch_users_on_commit, HOME_RAILS
+from .categories import CATEGORIES
+from .models import Debate, Argument
+
+WINNER_REWARD_XP = 150
+# Debates per UPDATE and per finalize pass, well below SQLite's 999 parameters.
+CHUNK_SIZE = 500
+
+
+@dataclass
+class TransitionResult:
+    """Summary of one run of `transition_due_debates`."""
+    started: int = 0
+    finished: int = 0
+    winners: int = 0
+    duration: float = 0.0
+
+    def as_dict(self):
+        return asdict(self)
+
+
+def winning_arguments(debate_ids, pending=None):
+    """
+    The argument with the most votes, counting `pending` buffered votes, of each
+    given debate that has votes and no winner yet. Ties go to the older argument.
+    """
+    already_finalized = Argument.objects.filter(debate_id=models.OuterRef('debate_id'), winner=True)
+    return (
+        Argument.objects
+        .filter(debate_id__in=debate_ids)
+        .annotate(total_votes=vote_buffer.with_pending('vote_count', pending or {}))
+        .filter(total_votes__gt=0)
+        .exclude(models.Exists(already_finalized))
+        .annotate(position=models.Window(
+            RowNumber(),
+            partition_by=[models.F('debate_id')],
+            order_by=[models.F('total_votes').desc(), models.F('created_at').asc(), models.F('id').asc()],
+        ))
+        .filter(position=1)
+    )
+
+
+def finalize_debates(debate_ids, pending=None):
+    """
+    Picks the winning argument of every given debate and rewards its author.
+
+    The top argument of each debate is found with a single windowed query, the
+    winners are flagged with one UPDATE and authors get their xp, wins and level
+    in one UPDATE per distinct number of wins in this batch (normally just one).
+    Debates that already have a winner are skipped, so finalizing twice is safe.
+    `pending` are the buffered vote deltas per argument, read from the
+    write-behind buffer when not given. Returns the number of winners picked.
+    """
+    if not debate_ids:
+        return 0
+
+    # Votes still waiting in the write-behind buffer count towards the result.
+    if pending is None:
+        pending = vote_buffer.get_buffer().pending(vote_buffer.ARGUMENTS) if vote_buffer.enabled() else {}
+    winners = list(winning_arguments(debate_ids, pending).values_list('id', 'author_id'))
+    if not winners:
+        return 0
+
+    with transaction.atomic():
+        Argument.objects.filter(id__in=[argument_id for argument_id, _ in winners]).update(winner=True)
+
+        wins_per_author = Counter(author_id for _, author_id in winners)
+        authors_by_wins = {}
+        for author_id, wins in wins_per_author.items():
+            authors_by_wins.setdefault(wins, []).append(author_id)
+
+        for wins, author_ids in authors_by_wins.items():
+            new_xp = models.F('xp') + WINNER_REWARD_XP * wins
+            User.objects.filter(id__in=author_ids).update(
+                xp=new_xp,
+                wins=models.F('wins') + wins,
+                level=level_expression(new_xp),
+            )
+
+        leaderboard.record_changes(leaderboard.XP, {author_id: WINNER_REWARD_XP * wins
+                                                    for author_id, wins in wins_per_author.items()})
+        leaderboard.record_changes(leaderboard.WINS, dict(wins_per_author))
+        touch_users_on_commit(wins_per_author)
+
+    return len(winners)
+
+
+def _chunks(ids):
+    for index in range(0, len(ids), CHUNK_SIZE):
+        yield ids[index:index + CHUNK_SIZE]
+
+
+def _move_due_chunk(from_status, to_status, time_field, now, debate_ids):
+    status_column = Debate._meta.get_field('status').column
+    time_column = Debate._meta.get_field(time_field).column
+    pk_column = Debate._meta.pk.column
+    # PostgreSQL and SQLite 3.35+ (the same versions that return columns from an
+    # INSERT) update the due rows and report them in one statement.
+    if connection.vendor in ('postgresql', 'sqlite') and connection.features.can_return_columns_from_insert:
+        quote = connection.ops.quote_name
+        sql = (f"UPDATE {quote(Debate._meta.db_table)} SET {quote(status_column)} = %s "
+               f"WHERE {quote(status_column)} = %s AND {quote(time_column)} <= %s")
+        params = [to_status, from_status, connection.ops.adapt_datetimefield_value(now)]
+        if debate_ids is not None:
+            sql += f" AND {quote(pk_column)} IN ({', '.join(['%s'] * len(debate_ids))})"
+            params += debate_ids
+        with connection.cursor() as cursor:
+            cursor.execute(f"{sql} RETURNING {quote(pk_column)}", params)
+            return [row[0] for row in cursor.fetchall()]
+
+    due = Debate.objects.filter(status=from_status, **{f"{time_field}__lte": now})
+    if debate_ids is not None:
+        due = due.filter(pk__in=debate_ids)
+    if connection.features.has_select_for_update_skip_locked:
+        due = due.select_for_update(skip_locked=True)
+    moved = list(due.values_list('pk', flat=True))
+    for chunk in _chunks(moved):
+        Debate.objects.filter(pk__in=chunk, status=from_status).update(status=to_status)
+    return moved
+
+
+def _move_due(from_status, to_status, time_field, now, debate_ids=None):
+    """
+    Moves the debates in `from_status` whose `time_field` has passed to
+    `to_status` and returns their ids. `UPDATE ... RETURNING` where the database
+    has it, otherwise the due ids are selected and updated `CHUNK_SIZE` at a
+    time, so no statement exceeds the parameter limit however long the backlog.
+    """
+    if debate_ids is None:
+        return _move_due_chunk(from_status, to_status, time_field, now, None)
+    return [debate_id for chunk in _chunks(list(debate_ids))
+            for debate_id in _move_due_chunk(from_status, to_status, time_field, now, chunk)]
+
+
+def transition_due_debates(now=None, debate_ids=None):
+    """
+    Moves every due debate to its next status with set-based UPDATEs:
+    Scheduled -> Ongoing once `start_time` has passed, then Ongoing -> Finished
+    once `end_time` has passed, followed by a batched `finalize_debates` pass
+    over the debates that were just finished, `CHUNK_SIZE` debates at a time.
+
+    `debate_ids` restricts the run to the given debates.
+    """
+    now = now or timezone.now()
+    began = time.monotonic()
+    result = TransitionResult()
+
+    with transaction.atomic():
+        started_ids = _move_due("Scheduled", "Ongoing", "start_time", now, debate_ids)
+        result.started = len(started_ids)
+        for debate_id in started_ids:
+            live.publish(debate_id, live.STATUS_CHANGED, status="Ongoing")
+
+        finished_ids = _move_due("Ongoing", "Finished", "end_time", now, debate_ids)
+        result.finished = len(finished_ids)
+        if finished_ids:
+            pending = vote_buffer.get_buffer().pending(vote_buffer.ARGUMENTS) if vote_buffer.enabled() else {}
+            for chunk in _chunks(finished_ids):
+                result.winners += finalize_debates(chunk, pending)
+        for debate_id in finished_ids:
+            live.publish(debate_id, live.STATUS_CHANGED, status="Finished")
+
+        if result.started or result.finished:
+            bump_version_on_commit(HOME_RAILS)
+            bump_version_on_commit(CATEGORIES)
+
+    result.duration = time.monotonic() - began
+    return result
@@ -1,29 +1,37 @@
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.shortcuts import render, redirect
+from django.shortcuts import render, redirect, get_object_or_404
 from django.views import generic, View
-from .models import Debate, Argument, Vote, Category
-from user.models import User
+from .models import Debate, Argument
+from user import leaderboard
 from django.db import models
 from django.urls import reverse_lazy
 from .forms import CreateDebateForm, CreateArgumentForm, SearchForm
-from django.http import HttpResponseRedirect
+from django.http import HttpResponseRedirect, Http404
 from django.contrib import messages
-from django.db import transaction
-
-
-class DebateListing(generic.ListView):
+from .arguments import delete_argument
+from .caching import get_version, HOME_RAILS
+from .categories import get_category_by_slug
+from .pagination import KeysetPaginationMixin
+from .participants import add_participants, is_participant
+from .retries import retry_on_lock
+from .search import search_debates
+from .votes import toggle_vote, voted_argument_ids
+from .vote_buffer import apply_pending
+
+
+class DebateListing(KeysetPaginationMixin, generic.ListView):
     """
     Represents a view for listing debates.
 
     This class-based view provides functionality for displaying a list of debates
     with additional context such as participant count. It retrieves the required
     debate data using optimized queryset techniques to minimize database queries.
-    The view leverages the Django ListView for rendering a paginated list of debates.
+    The view leverages the Django ListView for rendering a list of debates, paginated
+    with a cursor so that deep pages are as cheap as the first one.
 
     """
     model = Debate
     queryset = Debate.objects.select_related('category', 'author') \
-        .annotate(participant_count=models.Count('participants')) \
         .order_by('-participant_count', '-created_at')
     template_name = 'debate_list.html'
     context_object_name = 'debates'
@@ -48,7 +56,19 @@ class DebateDetailView(generic.DetailView):
 
     def get_queryset(self):
         return Debate.objects.select_related('category', 'author').prefetch_related(
-            'participants', 'debate_arguments')
+            models.Prefetch('debate_arguments', queryset=Argument.objects.select_related('author')))
+
+    def get_object(self, queryset=None):
+        debate = super().get_object(queryset)
+        apply_pending(debate.debate_arguments.all())
+        return debate
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['voted_argument_ids'] = voted_argument_ids(self.request.user, self.object)
+        context['is_participant'] = (self.request.user.is_authenticated and
+                                     is_participant(self.object.pk, self.request.user.pk))
+        return context
 
 
 class CreateDebateView(LoginRequiredMixin, generic.CreateView):
@@ -69,7 +89,9 @@ class CreateDebateView(LoginRequiredMixin, generic.CreateView):
 
     def form_valid(self, form):
         form.instance.author = self.request.user
-        return super().form_valid(form)
+        response = super().form_valid(form)
+        self.object.schedule_status_transitions()
+        return response
 
 
 class JoinDebateView(LoginRequiredMixin, View):
@@ -85,9 +107,7 @@ class JoinDebateView(LoginRequiredMixin, View):
 
     def post(self, request, *args, **kwargs):
         debate = Debate.objects.get(id=kwargs['debate_id'])
-
-        if request.user not in debate.participants.all():
-            debate.participants.add(request.user)
+        add_participants(debate, [request.user.pk])
 
         return redirect(request.META.get('HTTP_REFERER'))
 
@@ -115,6 +135,10 @@ class CreateArgumentView(LoginRequiredMixin, generic.CreateView):
         form.instance.author = self.request.user
         form.instance.debate = debate
 
+        return self.save_argument(form)
+
+    @retry_on_lock
+    def save_argument(self, form):
         return super().form_valid(form)
 
     def get_success_url(self):
@@ -129,28 +153,33 @@ class HomeView(generic.TemplateView):
     a home page. The context data includes a curated list of debates and user
     leaderboards based on certain conditions.
 
+    Each debate rail is its own `ORDER BY ... LIMIT 5` query, passed to the template
+    unevaluated together with the rails version, so a rail whose rendered fragment
+    is still cached never hits the database.
+
     """
     template_name = 'home.html'
+    rail_size = 5
+
+    def get_rail(self, statuses, ordering):
+        debates = Debate.objects.select_related('category').order_by(ordering)
+        if len(statuses) == 1:
+            return debates.filter(status=statuses[0])[:self.rail_size]
+        # The (status, created_at) index cannot return several statuses in one
+        # order, so rails of several statuses exclude the others instead and walk
+        # the created_at index, rather than sorting every matching debate.
+        others = [status for status, _ in Debate.STATUS_CHOICES if status not in statuses]
+        return debates.exclude(status__in=others)[:self.rail_size]
 
     def get_context_data(self, **kwargs):
-        users = User.objects.all()
-        debates = Debate.objects.prefetch_related('participants').select_related('category').annotate(
-            participant_count=models.Count('participants'))
-
-        debates = list(debates)
-        users= list(users)
-
         context = super().get_context_data(**kwargs)
 
-        context['trending_debates'] = sorted(
-            (debate for debate in debates if debate.status in ('Scheduled', 'Ongoing')), key=lambda d: d.created_at,
-            reverse=True)[:5]
-        context['latest_debates'] = sorted((debate for debate in debates if debate.status == "Scheduled"),
-                                           key=lambda d: d.created_at)[:5]
-        context['active_debates'] = sorted((debate for debate in debates if debate.status == "Ongoing"),
-                                           key=lambda d: d.created_at)[:5]
-        context['xp_leaderboard'] = sorted(users, key=lambda u: u.xp, reverse=True)[:10]
-        context['win_leaderboard'] = sorted(users, key=lambda u: u.wins, reverse=True)[:10]
+        context['rails_version'] = get_version(HOME_RAILS)
+        context['trending_debates'] = self.get_rail(("Scheduled", "Ongoing"), '-created_at')
+        context['latest_debates'] = self.get_rail(("Scheduled",), 'created_at')
+        context['active_debates'] = self.get_rail(("Ongoing",), 'created_at')
+        context['xp_leaderboard'] = apply_pending(leaderboard.top_users(leaderboard.XP, 10))
+        context['win_leaderboard'] = apply_pending(leaderboard.top_users(leaderboard.WINS, 10))
         return context
 
 
@@ -167,23 +196,11 @@ class VoteView(LoginRequiredMixin, View):
     login_url = reverse_lazy('login')
 
     def post(self, request, *args, **kwargs):
-        argument = Argument.objects.get(id=kwargs['argument_id'])
-
-        vote = Vote.objects.filter(user=request.user, argument=argument)
+        argument = get_object_or_404(Argument.objects.only('id', 'author_id', 'debate_id'), id=kwargs['argument_id'])
 
-        if vote:
-            vote.delete()
-            argument.vote_count = models.F('vote_count') - 1
-            User.objects.filter(id=argument.author.id).update(xp=models.F('xp') - 2)
-            argument.save()
+        result = toggle_vote(request.user, argument)
+        if not result.voted:
             messages.success(request, "Your vote has been removed!")
-            return redirect(request.META.get('HTTP_REFERER'))
-
-        with transaction.atomic():
-            Vote.objects.create(user=request.user, argument=argument)
-            argument.vote_count = models.F('vote_count') + 1
-            User.objects.filter(id=argument.author.id).update(xp=models.F('xp') + 2)
-            argument.save()
 
         # messages.success(request, "Your vote has been submitted!")
         return redirect(request.META.get('HTTP_REFERER'))
@@ -195,9 +212,9 @@ class SearchView(generic.ListView):
     by a search query. It uses pagination and a custom form for search input.
 
     This view handles the logic to process a search query, filter debates by their
-    title or description, and return the results with additional context information
-    such as form validation. It organizes debates by the number of participants and
-    creation date.
+    title or description through the full-text index, and return the results with
+    additional context information such as form validation. Debates are ordered by
+    relevance, then by the number of participants and creation date.
 
     """
     model = Debate
@@ -210,11 +227,7 @@ class SearchView(generic.ListView):
         form = self.form_class(self.request.GET)
         if form.is_valid():
             query = form.cleaned_data['query']
-            return (Debate.objects.filter(
-                models.Q(title__contains=query) | models.Q(description__contains=query))
-                    .select_related('category', 'author')
-                    .annotate(participant_count=models.Count('participants'))
-                    .order_by('-participant_count', '-created_at'))
+            return search_debates(Debate.objects.select_related('category', 'author'), query)
         return Debate.objects.none()
 
     def get_context_data(self, **kwargs):
@@ -224,7 +237,7 @@ class SearchView(generic.ListView):
         return context
 
 
-class CategoryView(generic.ListView):
+class CategoryView(KeysetPaginationMixin, generic.ListView):
     """
     Handles the display and pagination of debates by category.
 
@@ -241,13 +254,14 @@ class CategoryView(generic.ListView):
     context_object_name = 'debates'
 
     def get_queryset(self):
-        category = Category.objects.get(slug=self.kwargs['slug'])
-        return (Debate.objects.filter(category=category).select_related('category', 'author')
-                .annotate(participant_count=models.Count('participants'))
+        category = get_category_by_slug(self.kwargs['slug'])
+        if category is None:
+            raise Http404("Category not found.")
+        return (Debate.objects.filter(category_id=category.id).select_related('category', 'author')
                 .order_by('-participant_count', '-created_at'))
 
 
-class FilterView(generic.ListView):
+class FilterView(KeysetPaginationMixin, generic.ListView):
     """
     FilterView is a Django generic ListView that is used to display a list of Debates
     with optional filtering based on status and category.
@@ -266,7 +280,6 @@ class FilterView(generic.ListView):
         status = self.request.GET.get('status')
         category_id = self.request.GET.get('category')
         debates = (Debate.objects.select_related('category', 'author')
-                   .annotate(participant_count=models.Count('participants'))
                    .order_by('-participant_count', '-created_at'))
 
         if status and status != "All":
@@ -289,8 +302,8 @@ class DeleteDebateView(LoginRequiredMixin, generic.DeleteView):  # For Moderator
     pk_url_kwarg = 'debate_id'
 
     def dispatch(self, request, *args, **kwargs):
-        debate = Debate.objects.get(id=kwargs['debate_id']).select_related('author')
-        if not request.user.is_staff and debate.author != request.user:
+        debate = Debate.objects.only('id', 'author_id').get(id=kwargs['debate_id'])
+        if not request.user.is_staff and debate.author_id != request.user.pk:
             messages.error(request, "You do not have permission to delete this debate.")
             return redirect(request.META.get('HTTP_REFERER'), reverse_lazy('debate_listing'))
         return super().dispatch(request, *args, **kwargs)
@@ -309,17 +322,13 @@ class DeleteArgumentView(LoginRequiredMixin, generic.DeleteView): # For Moderato
     def get_success_url(self):
         return self.request.META.get('HTTP_REFERER')
 
-    @transaction.atomic
-    def delete(self, request, *args, **kwargs):
-        argument = Argument.objects.get(id=kwargs.get('argument_id'))
-        user = argument.author
-        user.xp = models.F('xp') - argument.vote_count * 2
-        user.save(update_fields=['xp'])
-        return super().delete(request, *args, **kwargs)
+    def form_valid(self, form):
+        delete_argument(self.object)
+        return HttpResponseRedirect(self.get_success_url())
 
     def dispatch(self, request, *args, **kwargs):
-        argument = Argument.objects.select_related('author').get(id=kwargs['argument_id'])
-        if not request.user.is_staff and argument.author != request.user:
+        argument = Argument.objects.only('id', 'author_id').get(id=kwargs['argument_id'])
+        if not request.user.is_staff and argument.author_id != request.user.pk:
             messages.error(request, "You do not have permission to delete this argument.")
             return redirect(request.META.get('HTTP_REFERER'), reverse_lazy('debate_listing'))
         return super().dispatch(request, *args, **kwargs)
@@ -0,0 +1,310 @@
+"""
+Write-behind buffer for vote counters.
+
+With `VOTE_BUFFER_ENABLED`, a vote no longer updates its `Argument` row and
+the author's `User` row. Instead, the deltas are added to atomic counters (a
+Redis hash per kind, or process-local counters without Redis), and
+`flush` folds them into `Argument.vote_count`, `User.xp` and `User.level`
+in bulk. The `flush_vote_buffer` Celery task runs it every
+`VOTE_BUFFER_FLUSH_INTERVAL` seconds. Until then, readers add the pending
+delta to the stored value with `apply_pending`, so users see exact counts.
+"""
+import threading
+import uuid
+from collections import Counter
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import models, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+ARGUMENTS = "arguments"
+XP = "xp"
+KINDS = (ARGUMENTS, XP)
+
+# SQLite limits the number of variables of a single statement.
+FLUSH_BATCH_SIZE = 400
+# Tokens of committed flushes are only needed until their snapshot is dropped.
+FLUSH_TOKEN_RETENTION = timedelta(days=1)
+
+
+class RedisVoteBuffer:
+    """
+    Pending deltas stored in one Redis hash per kind, keyed by object id. A
+    flush works on a snapshot: the hashes are renamed to snapshot keys, so new
+    votes go to fresh hashes, and readers add both up until it is dropped.
+    """
+
+    # Stores the flush token and moves the live hashes to the snapshot keys in
+    # one atomic step. KEYS: the token key, then each live key and its snapshot key.
+    SNAPSHOT_SCRIPT = """
+        redis.call('SET', KEYS[1], ARGV[1])
+        for i = 2, #KEYS, 2 do
+            if redis.call('EXISTS', KEYS[i]) == 1 then
+                redis.call('RENAME', KEYS[i], KEYS[i + 1])
+            end
+        end
+    """
+
+    def __init__(self, url, prefix="vote_buffer"):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._take_snapshot = self.client.register_script(self.SNAPSHOT_SCRIPT)
+        self._flush_lock = self.client.lock(f"{prefix}:flush", timeout=300)
+
+    def _key(self, kind):
+        return f"{self.prefix}:{kind}"
+
+    def _snapshot_key(self, kind):
+        return f"{self.prefix}:snapshot:{kind}"
+
+    @property
+    def _token_key(self):
+        return f"{self.prefix}:snapshot:token"
+
+    def add(self, kind, deltas):
+        with self.client.pipeline() as pipe:
+            for object_id, delta in deltas.items():
+                pipe.hincrby(self._key(kind), object_id, delta)
+            pipe.execute()
+
+    def get_many(self, kind, object_ids):
+        object_ids = list(object_ids)
+        if not object_ids:
+            return {}
+        with self.client.pipeline(transaction=False) as pipe:
+            pipe.hmget(self._key(kind), object_ids)
+            pipe.hmget(self._snapshot_key(kind), object_ids)
+            live, flushing = pipe.execute()
+        deltas = {object_id: int(a or 0) + int(b or 0) for object_id, a, b in zip(object_ids, live, flushing)}
+        return {object_id: delta for object_id, delta in deltas.items() if delta}
+
+    def pending(self, kind):
+        with self.client.pipeline(transaction=False) as pipe:
+            pipe.hgetall(self._key(kind))
+            pipe.hgetall(self._snapshot_key(kind))
+            hashes = pipe.execute()
+        deltas = Counter()
+        for values in hashes:
+            deltas.update({int(object_id): int(delta) for object_id, delta in values.items()})
+        return {object_id: delta for object_id, delta in deltas.items() if delta}
+
+    def take_snapshot(self, token):
+        keys = [self._token_key]
+        for kind in KINDS:
+            keys += [self._key(kind), self._snapshot_key(kind)]
+        self._take_snapshot(keys=keys, args=[token])
+
+    def snapshot(self):
+        with self.client.pipeline(transaction=True) as pipe:
+            pipe.get(self._token_key)
+            for kind in KINDS:
+                pipe.hgetall(self._snapshot_key(kind))
+            token, *hashes = pipe.execute()
+        if token is None:
+            return None, {}
+        return token.decode(), {kind: {int(object_id): int(delta) for object_id, delta in values.items()
+                                       if int(delta)}
+                                for kind, values in zip(KINDS, hashes)}
+
+    def drop_snapshot(self):
+        self.client.delete(self._token_key, *[self._snapshot_key(kind) for kind in KINDS])
+
+    def try_lock(self):
+        return self._flush_lock.acquire(blocking=False)
+
+    def unlock(self):
+        self._flush_lock.release()
+
+
+class MemoryVoteBuffer:
+    """Process-local pending deltas for tests and development without Redis."""
+
+    def __init__(self, **kwargs):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._deltas = {kind: Counter() for kind in KINDS}
+        self._snapshot = {kind: Counter() for kind in KINDS}
+        self._token = None
+
+    def add(self, kind, deltas):
+        with self._lock:
+            self._deltas[kind].update(deltas)
+
+    def get_many(self, kind, object_ids):
+        with self._lock:
+            deltas = {object_id: self._deltas[kind][object_id] + self._snapshot[kind][object_id]
+                      for object_id in object_ids}
+        return {object_id: delta for object_id, delta in deltas.items() if delta}
+
+    def pending(self, kind):
+        with self._lock:
+            # Counter addition would drop negative deltas.
+            deltas = Counter(self._deltas[kind])
+            deltas.update(self._snapshot[kind])
+        return {object_id: delta for object_id, delta in deltas.items() if delta}
+
+    def take_snapshot(self, token):
+        with self._lock:
+            self._token = token
+            for kind in KINDS:
+                self._snapshot[kind], self._deltas[kind] = self._deltas[kind], Counter()
+
+    def snapshot(self):
+        with self._lock:
+            if self._token is None:
+                return None, {}
+            return self._token, {kind: {object_id: delta for object_id, delta in self._snapshot[kind].items()
+                                        if delta}
+                                 for kind in KINDS}
+
+    def drop_snapshot(self):
+        with self._lock:
+            self._token = None
+            self._snapshot = {kind: Counter() for kind in KINDS}
+
+    def try_lock(self):
+        return self._flush_lock.acquire(blocking=False)
+
+    def unlock(self):
+        self._flush_lock.release()
+
+
+BACKENDS = {
+    "redis": "debate.vote_buffer.RedisVoteBuffer",
+    "memory": "debate.vote_buffer.MemoryVoteBuffer",
+}
+
+
+def enabled():
+    return settings.VOTE_BUFFER_ENABLED
+
+
+@lru_cache(maxsize=None)
+def get_buffer():
+    backend = import_string(BACKENDS[settings.VOTE_BUFFER_BACKEND])
+    return backend(url=settings.VOTE_BUFFER_REDIS_URL)
+
+
+def record_vote(argument_id, author_id, delta, xp):
+    """Buffers the effect of one vote once the current transaction commits."""
+    def apply():
+        buffer = get_buffer()
+        buffer.add(ARGUMENTS, {argument_id: delta})
+        buffer.add(XP, {author_id: xp})
+
+    transaction.on_commit(apply)
+
+
+def pending_votes(argument_id):
+    if not enabled():
+        return 0
+    return get_buffer().get_many(ARGUMENTS, [argument_id]).get(argument_id, 0)
+
+
+def with_pending(field, deltas):
+    """`field` plus the pending delta of each row, as an expression usable in queries and updates."""
+    if not deltas:
+        return models.F(field)
+    return models.F(field) + models.Case(
+        *[models.When(pk=object_id, then=models.Value(delta)) for object_id, delta in deltas.items()],
+        default=models.Value(0),
+    )
+
+
+def apply_pending(instances):
+    """
+    Adds the pending deltas to loaded `Argument` or `User` instances in place,
+    with one lookup per kind. Instances that already include them are skipped,
+    so calling this again for the same objects is harmless.
+    """
+    from user.models import User, level_for_xp
+    from .models import Argument
+
+    if not enabled():
+        return instances
+
+    todo = [instance for instance in instances if not getattr(instance, '_pending_applied', False)]
+    for model, kind in ((Argument, ARGUMENTS), (User, XP)):
+        objects = [instance for instance in todo if isinstance(instance, model)]
+        if not objects:
+            continue
+        deltas = get_buffer().get_many(kind, {instance.pk for instance in objects})
+        for instance in objects:
+            instance._pending_applied = True
+            delta = deltas.get(instance.pk)
+            if not delta:
+                continue
+            if kind == ARGUMENTS:
+                instance.vote_count += delta
+            else:
+                instance.xp += delta
+                instance.level = level_for_xp(instance.xp)
+    return instances
+
+
+def flush():
+    """
+    Writes all pending deltas to the database with one UPDATE per batch of
+    arguments and users. Returns the number of arguments and users updated, or
+    `None` if another flush is already running.
+
+    The pending hashes are first moved to a snapshot under a new token, so
+    votes cast meanwhile are kept for the next flush. The UPDATEs commit
+    together with a `VoteBufferFlush` row holding the token, and the snapshot
+    is dropped afterwards. If a flush dies in between, the next one finds the
+    snapshot left behind and applies it only when its token is not in the
+    database, so no delta is ever written twice or lost. Readers may briefly
+    count a flushed delta twice, until the snapshot is dropped.
+
+    Must run outside of a transaction.
+    """
+    from user.models import User, level_expression
+    from .models import Argument, VoteBufferFlush
+
+    if transaction.get_connection().in_atomic_block:
+        raise transaction.TransactionManagementError("flush() cannot run inside a transaction.")
+
+    buffer = get_buffer()
+    if not buffer.try_lock():
+        return None
+
+    try:
+        token, snapshot = buffer.snapshot()
+        if token is not None and VoteBufferFlush.objects.filter(token=token).exists():
+            # The previous flush committed this snapshot but stopped before dropping it.
+            buffer.drop_snapshot()
+            token = None
+        if token is None:
+            token = uuid.uuid4().hex
+            buffer.take_snapshot(token)
+            token, snapshot = buffer.snapshot()
+
+        votes, xp = snapshot.get(ARGUMENTS, {}), snapshot.get(XP, {})
+        if not votes and not xp:
+            buffer.drop_snapshot()
+            return 0, 0
+
+        with transaction.atomic():
+            for batch in _batches(votes):
+                Argument.objects.filter(pk__in=batch).update(vote_count=with_pending('vote_count', batch))
+            for batch in _batches(xp):
+                new_xp = with_pending('xp', batch)
+                User.objects.filter(pk__in=batch).update(xp=new_xp, level=level_expression(new_xp))
+            VoteBufferFlush.objects.create(token=token)
+
+        buffer.drop_snapshot()
+        VoteBufferFlush.objects.filter(flushed_at__lt=timezone.now() - FLUSH_TOKEN_RETENTION).delete()
+    finally:
+        buffer.unlock()
+
+    return len(votes), len(xp)
+
+
+def _batches(deltas):
+    items = list(deltas.items())
+    for offset in range(0, len(items), FLUSH_BATCH_SIZE):
+        yield dict(items[offset:offset + FLUSH_BATCH_SIZE])
@@ -0,0 +1,111 @@
+"""
+Voting on arguments, shared by the web and API views.
+
+A vote is toggled by trying to delete it first and inserting it only if
+nothing was deleted. The number of affected rows, not an earlier read, decides
+which way the counters move, so concurrent clicks can neither violate the
+`(user, argument)` constraint nor make `vote_count` and `xp` drift.
+"""
+from dataclasses import dataclass
+
+from django.core.cache import cache
+from django.db import connections, models, router, transaction, IntegrityError
+
+from user import leaderboard
+from user.models import User, level_expression
+from . import live, vote_buffer
+from .caching import touch_users_on_commit
+from .models import Argument, Vote
+from .retries import retry_on_lock
+
+VOTE_REWARD_XP = 2
+VOTE_STATE_CACHE_TIMEOUT = 60 * 10
+
+
+@dataclass
+class VoteResult:
+    """Outcome of `toggle_vote`: whether the user now votes for the argument and its new vote count."""
+    voted: bool
+    vote_count: int
+
+
+def _vote_state_key(user_id, debate_id):
+    return f"voted_arguments:{user_id}:{debate_id}"
+
+
+def voted_argument_ids(user, debate):
+    """
+    Returns the ids of the arguments of `debate` the user has voted for, as a set.
+    It is loaded with one query and cached per user and debate until the user
+    votes in that debate again.
+    """
+    if not user.is_authenticated:
+        return set()
+
+    key = _vote_state_key(user.pk, debate.pk)
+    argument_ids = cache.get(key)
+    if argument_ids is None:
+        argument_ids = list(Vote.objects.filter(user=user, argument__debate=debate)
+                            .values_list('argument_id', flat=True))
+        cache.set(key, argument_ids, VOTE_STATE_CACHE_TIMEOUT)
+    return set(argument_ids)
+
+
+def _add_to_vote_count(argument, delta, using):
+    connection = connections[using]
+    # UPDATE ... RETURNING hands back the new count in the same round trip on
+    # PostgreSQL and SQLite 3.35+, the versions that also return columns from an
+    # INSERT. Other backends, MariaDB among them, read it back afterwards.
+    if connection.vendor in ('postgresql', 'sqlite') and connection.features.can_return_columns_from_insert:
+        table = connection.ops.quote_name(Argument._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(f"UPDATE {table} SET vote_count = vote_count + %s WHERE id = %s RETURNING vote_count",
+                           [delta, argument.pk])
+            return cursor.fetchone()[0]
+
+    Argument.objects.using(using).filter(pk=argument.pk).update(vote_count=models.F('vote_count') + delta)
+    return Argument.objects.using(using).values_list('vote_count', flat=True).get(pk=argument.pk)
+
+
+def _current_vote_count(argument, using):
+    stored = Argument.objects.using(using).values_list('vote_count', flat=True).get(pk=argument.pk)
+    return stored + vote_buffer.pending_votes(argument.pk)
+
+
+@retry_on_lock
+def toggle_vote(user, argument):
+    """
+    Removes the user's vote for `argument` if there is one and casts it otherwise,
+    then moves the argument's vote count and its author's xp and level accordingly.
+    """
+    using = router.db_for_write(Vote)
+    with transaction.atomic(using=using):
+        deleted, _ = Vote.objects.filter(user=user, argument=argument).delete()
+        if deleted:
+            delta = -1
+        else:
+            try:
+                with transaction.atomic(using=using):
+                    Vote.objects.create(user=user, argument=argument)
+                delta = 1
+            except IntegrityError:
+                # A concurrent request of the same user cast this vote first; this
+                # request has nothing left to toggle.
+                return VoteResult(voted=True, vote_count=_current_vote_count(argument, using))
+
+        if vote_buffer.enabled():
+            # The hot Argument and User rows are left alone; the flush task applies
+            # the deltas later in bulk.
+            vote_count = _current_vote_count(argument, using) + delta
+            vote_buffer.record_vote(argument.pk, argument.author_id, delta, VOTE_REWARD_XP * delta)
+        else:
+            vote_count = _add_to_vote_count(argument, delta, using)
+            new_xp = models.F('xp') + VOTE_REWARD_XP * delta
+            User.objects.filter(pk=argument.author_id).update(xp=new_xp, level=level_expression(new_xp))
+
+        leaderboard.record_changes(leaderboard.XP, {argument.author_id: VOTE_REWARD_XP * delta})
+        touch_users_on_commit([argument.author_id])
+        transaction.on_commit(lambda: cache.delete(_vote_state_key(user.pk, argument.debate_id)))
+        live.publish(argument.debate_id, live.VOTE_COUNT_CHANGED, argument_id=argument.pk, vote_count=vote_count)
+
+    return VoteResult(voted=delta > 0, vote_count=vote_count)
@@ -12,12 +12,9 @@ app.conf.update(timezone='Asia/Tbilisi')
 
 app.config_from_object(settings, namespace='CELERY')
 
-# Celery Beat Settings
-app.conf.beat_schedule = {
+# Celery Beat Settings live in settings.CELERY_BEAT_SCHEDULE.
 
-}
-
-app.autodiscover_tasks(["debate"])
+app.autodiscover_tasks(["debate", "user"])
 
 @app.task(bind=True)
 def debug_task(self):
@@ -0,0 +1,122 @@
+"""
+Read-replica routing.
+
+`PrimaryReplicaRouter` sends every write to the primary (`default`) and the
+reads of read-only requests to one of `settings.REPLICA_DATABASES`. Which
+requests are read-only is decided by `ReplicaRoutingMiddleware`: GET, HEAD
+and OPTIONS requests, unless the client wrote shortly before. Once a request
+writes, its remaining reads go to the primary as well, so it never reads
+around its own write, and the response sets a short-lived cookie that keeps
+the client's next requests (typically the redirect after a POST) on the
+primary until the replicas have caught up.
+
+Code outside a request (tasks, management commands, the shell) reads from
+the primary unless it opts in with `read_from_replicas()`.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+PRIMARY = DEFAULT_DB_ALIAS
+STICKY_COOKIE = 'use_primary_db'
+READ_ONLY_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class RoutingState:
+    """Routing of the current request or block. Shared by reference, so threads it hands work to see its writes."""
+
+    def __init__(self, replica_reads):
+        replicas = settings.REPLICA_DATABASES if replica_reads else None
+        self.replica = random.choice(replicas) if replicas else None
+        self.wrote = False
+
+
+_state = ContextVar('db_routing_state', default=None)
+
+
+@contextmanager
+def read_from_replicas():
+    """Sends the reads of the block to a replica until it writes."""
+    token = _state.set(RoutingState(replica_reads=True))
+    try:
+        yield
+    finally:
+        _state.reset(token)
+
+
+@contextmanager
+def use_primary():
+    """Sends every read of the block to the primary, e.g. inside a read-only request that must see fresh data."""
+    token = _state.set(RoutingState(replica_reads=False))
+    try:
+        yield
+    finally:
+        _state.reset(token)
+
+
+class PrimaryReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.replica is None or state.wrote:
+            return PRIMARY
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {PRIMARY, *settings.REPLICA_DATABASES}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """Marks read-only requests for `PrimaryReplicaRouter`. Goes first in `MIDDLEWARE`, so sessions are read through it."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        state = RoutingState(self.is_read_only(request))
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.stick_to_primary(state, response)
+
+    async def __acall__(self, request):
+        state = RoutingState(self.is_read_only(request))
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.stick_to_primary(state, response)
+
+    @staticmethod
+    def is_read_only(request):
+        return request.method in READ_ONLY_METHODS and STICKY_COOKIE not in request.COOKIES
+
+    @staticmethod
+    def stick_to_primary(state, response):
+        if state.wrote and settings.REPLICA_STICKY_SECONDS:
+            response.set_cookie(STICKY_COOKIE, '1', max_age=settings.REPLICA_STICKY_SECONDS, httponly=True,
+                                samesite='Lax')
+        return response
@@ -11,9 +11,12 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
 from pathlib import Path
-from decouple import config
+from decouple import config, Csv
 from datetime import timedelta
 import os
+import sys
+
+from celery.schedules import crontab
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -27,6 +30,8 @@ SECRET_KEY = "django-insecure-3wo)fpcs@v0o05ny3pf_)d=pfv0j-(@8pw82j*8l@#9@6@nf1i
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
 
+TESTING = 'test' in sys.argv
+
 ALLOWED_HOSTS = ["*"]
 
 INTERNAL_IPS = [
@@ -36,6 +41,7 @@ INTERNAL_IPS = [
 # Application definition
 
 INSTALLED_APPS = [
+    'daphne',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -52,12 +58,14 @@ INSTALLED_APPS = [
     'drf_spectacular_sidecar',
     'django_filters',
     'corsheaders',
+    'channels',
     'user',
     'api',
     'debate'
 ]
 
 MIDDLEWARE = [
+    'debatePlatform.db_router.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -91,16 +99,75 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'debatePlatform.wsgi.application'
+ASGI_APPLICATION = 'debatePlatform.asgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+# Reads of read-only requests go to the replicas, everything else to `default`
+# (see debatePlatform/db_router.py). DATABASE_REPLICAS lists one file name per
+# replica for SQLite and one host per replica for the other engines; with two
+# SQLite files, refresh the replica with `sqlite3 db.sqlite3 ".backup db-replica.sqlite3"`.
+
+DATABASE_ENGINE = config('DATABASE_ENGINE', default='django.db.backends.sqlite3')
+DATABASE_REPLICAS = config('DATABASE_REPLICAS', default='', cast=Csv())
+# Seconds a connection is kept open for the next request; 0 closes it after every request.
+DATABASE_CONN_MAX_AGE = config('DATABASE_CONN_MAX_AGE', default=60, cast=int)
+# Connection pool per process and database, PostgreSQL only (needs psycopg[pool]); 0 turns it off.
+DATABASE_POOL_MIN_SIZE = config('DATABASE_POOL_MIN_SIZE', default=2, cast=int)
+DATABASE_POOL_MAX_SIZE = config('DATABASE_POOL_MAX_SIZE', default=0, cast=int)
+# Opt-in SQLite mode for concurrent writers: WAL lets readers run next to the
+# writer, synchronous=NORMAL only syncs at checkpoints (still safe from
+# corruption in WAL mode), writers wait up to the busy timeout for the lock, and
+# write transactions take the lock at BEGIN instead of failing to upgrade a
+# read lock halfway through.
+SQLITE_CONCURRENT_MODE = config('SQLITE_CONCURRENT_MODE', default=False, cast=bool)
+SQLITE_BUSY_TIMEOUT_MS = config('SQLITE_BUSY_TIMEOUT_MS', default=5000, cast=int)
+SQLITE_CONCURRENT_OPTIONS = {
+    'init_command': f"PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL; PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}",
+    'transaction_mode': 'IMMEDIATE',
 }
+# Votes, joins and new arguments that still find the database locked are retried
+# this many times, after DATABASE_LOCK_BACKOFF seconds doubling per attempt.
+DATABASE_LOCK_RETRIES = config('DATABASE_LOCK_RETRIES', default=3, cast=int)
+DATABASE_LOCK_BACKOFF = config('DATABASE_LOCK_BACKOFF', default=0.05, cast=float)
+
+
+def database(**overrides):
+    entry = {
+        'ENGINE': DATABASE_ENGINE,
+        'NAME': config('DATABASE_NAME', default=str(BASE_DIR / 'db.sqlite3')),
+        'USER': config('DATABASE_USER', default=''),
+        'PASSWORD': config('DATABASE_PASSWORD', default=''),
+        'HOST': config('DATABASE_HOST', default=''),
+        'PORT': config('DATABASE_PORT', default=''),
+        'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': DATABASE_CONN_MAX_AGE > 0,
+        'OPTIONS': {},
+        **overrides,
+    }
+    if SQLITE_CONCURRENT_MODE and DATABASE_ENGINE == 'django.db.backends.sqlite3':
+        entry['OPTIONS'].update(SQLITE_CONCURRENT_OPTIONS)
+    if DATABASE_POOL_MAX_SIZE and DATABASE_ENGINE == 'django.db.backends.postgresql':
+        # Pooled connections replace persistent ones.
+        entry.update(CONN_MAX_AGE=0, CONN_HEALTH_CHECKS=False)
+        entry['OPTIONS']['pool'] = {'min_size': min(DATABASE_POOL_MIN_SIZE, DATABASE_POOL_MAX_SIZE),
+                                    'max_size': DATABASE_POOL_MAX_SIZE}
+    return entry
+
+
+DATABASES = {'default': database()}
+for index, replica in enumerate(DATABASE_REPLICAS, start=1):
+    if DATABASE_ENGINE == 'django.db.backends.sqlite3':
+        location = {'NAME': str(BASE_DIR / replica)}
+    else:
+        location = {'HOST': replica}
+    DATABASES[f'replica{index}'] = database(**location, TEST={'MIRROR': 'default'})
+
+REPLICA_DATABASES = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['debatePlatform.db_router.PrimaryReplicaRouter']
+# Seconds a client's reads stay on the primary after it wrote, so it sees its write once the replicas lag.
+REPLICA_STICKY_SECONDS = config('REPLICA_STICKY_SECONDS', default=5, cast=int)
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -209,4 +276,50 @@ CACHES = {
         "BACKEND": "django.core.cache.backends.redis.RedisCache",
         "LOCATION": "redis://127.0.0.1:6379",
     }
-}
\ No newline at end of file
+}
+
+if TESTING:
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+# LEADERBOARD SETTINGS
+
+LEADERBOARD_BACKEND = config('LEADERBOARD_BACKEND', default='redis')
+LEADERBOARD_REDIS_URL = config('LEADERBOARD_REDIS_URL', default='redis://127.0.0.1:6379/1')
+
+if TESTING:
+    LEADERBOARD_BACKEND = 'memory'
+
+# VOTE BUFFER SETTINGS
+
+VOTE_BUFFER_ENABLED = config('VOTE_BUFFER_ENABLED', default=False, cast=bool)
+VOTE_BUFFER_BACKEND = config('VOTE_BUFFER_BACKEND', default='redis')
+VOTE_BUFFER_REDIS_URL = config('VOTE_BUFFER_REDIS_URL', default='redis://127.0.0.1:6379/1')
+VOTE_BUFFER_FLUSH_INTERVAL = config('VOTE_BUFFER_FLUSH_INTERVAL', default=5, cast=int)
+
+CELERY_BEAT_SCHEDULE = {
+    'flush-vote-buffer': {
+        'task': 'debate.tasks.flush_vote_buffer',
+        'schedule': VOTE_BUFFER_FLUSH_INTERVAL,
+    },
+    'reconcile-counters': {
+        'task': 'debate.tasks.reconcile_counters',
+        'schedule': crontab(hour=4, minute=0),
+    },
+}
+
+if TESTING:
+    VOTE_BUFFER_BACKEND = 'memory'
+
+# CHANNELS SETTINGS
+
+CHANNEL_LAYERS = {
+    "default": {
+        "BACKEND": "channels_redis.core.RedisChannelLayer",
+        "CONFIG": {
+            "hosts": [config('CHANNEL_LAYER_REDIS_URL', default='redis://127.0.0.1:6379/2')],
+        },
+    }
+}
+
+if TESTING:
+    CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
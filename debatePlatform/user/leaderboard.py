@@ -0,0 +1,260 @@
+"""
+XP and wins leaderboards kept as sorted sets.
+
+Scores are changed incrementally wherever `User.xp` or `User.wins` changes, so
+reading the top of a board, a user's rank or the users around them costs
+O(log n) instead of loading and sorting the whole `User` table. The Redis
+backend is used in production, `MemoryLeaderboard` stands in for it in tests.
+
+A rebuild marks a board as built. A board that is not built (cold Redis,
+eviction, a flush) is never rebuilt inside a request: `top_users` answers from
+the `User` table and queues one `rebuild_leaderboards` task, guarded by a cache
+lock so concurrent requests do not queue one each. Score changes are only
+written to a built board, so a change arriving after the board was lost cannot
+leave behind a board of just the users who changed since; it queues the
+rebuild instead.
+"""
+import bisect
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+XP = "xp"
+WINS = "wins"
+BOARDS = (XP, WINS)
+
+REBUILD_LOCK_KEY = "leaderboard:rebuild-queued"
+REBUILD_LOCK_SECONDS = 300
+
+
+# Writes a score only while the board's built marker exists, in one round trip.
+SET_IF_BUILT = """
+if redis.call('exists', KEYS[2]) == 0 then return 0 end
+redis.call(ARGV[1], KEYS[1], ARGV[2], ARGV[3])
+return 1
+"""
+
+
+class RedisLeaderboard:
+    """Leaderboards stored as Redis sorted sets, one key per board plus its built marker."""
+
+    def __init__(self, url, prefix="leaderboard"):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._set_if_built = self.client.register_script(SET_IF_BUILT)
+
+    def _key(self, board):
+        return f"{self.prefix}:{board}"
+
+    def _built_key(self, board):
+        return f"{self.prefix}:{board}:built"
+
+    def is_built(self, board):
+        return bool(self.client.exists(self._built_key(board)))
+
+    def set(self, board, user_id, score):
+        """Stores a score; returns False without writing when the board is not built."""
+        return bool(self._set_if_built(keys=[self._key(board), self._built_key(board)],
+                                       args=["zadd", score, user_id]))
+
+    def incr(self, board, user_id, amount):
+        """Adds to a score; returns False without writing when the board is not built."""
+        return bool(self._set_if_built(keys=[self._key(board), self._built_key(board)],
+                                       args=["zincrby", amount, user_id]))
+
+    def remove(self, user_id):
+        with self.client.pipeline() as pipe:
+            for board in BOARDS:
+                pipe.zrem(self._key(board), user_id)
+            pipe.execute()
+
+    def top(self, board, count):
+        entries = self.client.zrevrange(self._key(board), 0, count - 1, withscores=True)
+        return [(int(member), int(score)) for member, score in entries]
+
+    def rank(self, board, user_id):
+        rank = self.client.zrevrank(self._key(board), user_id)
+        return None if rank is None else rank + 1
+
+    def around(self, board, user_id, radius):
+        rank = self.client.zrevrank(self._key(board), user_id)
+        if rank is None:
+            return []
+        start = max(rank - radius, 0)
+        entries = self.client.zrevrange(self._key(board), start, rank + radius, withscores=True)
+        return [(start + offset + 1, int(member), int(score)) for offset, (member, score) in enumerate(entries)]
+
+    def replace(self, board, entries, batch_size=5000):
+        """Fills a temporary key from `(user_id, score)` pairs and swaps it in atomically."""
+        key, staging_key = self._key(board), f"{self._key(board)}:rebuild"
+        self.client.delete(staging_key)
+        batch = {}
+        for user_id, score in entries:
+            batch[user_id] = score
+            if len(batch) >= batch_size:
+                self.client.zadd(staging_key, batch)
+                batch = {}
+        if batch:
+            self.client.zadd(staging_key, batch)
+
+        with self.client.pipeline() as pipe:
+            if self.client.exists(staging_key):
+                pipe.rename(staging_key, key)
+            else:
+                pipe.delete(key)
+            pipe.set(self._built_key(board), 1)
+            pipe.execute()
+
+    def delete(self, board):
+        self.client.delete(self._key(board), self._built_key(board))
+
+
+class MemoryLeaderboard:
+    """Process-local leaderboards for tests and development without Redis."""
+
+    def __init__(self, **kwargs):
+        self._lock = threading.Lock()
+        self._scores = {board: {} for board in BOARDS}
+        self._order = {board: [] for board in BOARDS}
+        self._built = set()
+
+    def _discard(self, board, user_id):
+        score = self._scores[board].pop(user_id, None)
+        if score is not None:
+            order = self._order[board]
+            del order[bisect.bisect_left(order, (-score, user_id))]
+
+    def _insert(self, board, user_id, score):
+        self._scores[board][user_id] = score
+        bisect.insort(self._order[board], (-score, user_id))
+
+    def is_built(self, board):
+        return board in self._built
+
+    def set(self, board, user_id, score):
+        with self._lock:
+            if board not in self._built:
+                return False
+            self._discard(board, user_id)
+            self._insert(board, user_id, score)
+            return True
+
+    def incr(self, board, user_id, amount):
+        with self._lock:
+            if board not in self._built:
+                return False
+            score = self._scores[board].get(user_id, 0)
+            self._discard(board, user_id)
+            self._insert(board, user_id, score + amount)
+            return True
+
+    def remove(self, user_id):
+        with self._lock:
+            for board in BOARDS:
+                self._discard(board, user_id)
+
+    def top(self, board, count):
+        return [(user_id, -score) for score, user_id in self._order[board][:count]]
+
+    def rank(self, board, user_id):
+        score = self._scores[board].get(user_id)
+        if score is None:
+            return None
+        return bisect.bisect_left(self._order[board], (-score, user_id)) + 1
+
+    def around(self, board, user_id, radius):
+        rank = self.rank(board, user_id)
+        if rank is None:
+            return []
+        start = max(rank - 1 - radius, 0)
+        entries = self._order[board][start:rank + radius]
+        return [(start + offset + 1, member, -score) for offset, (score, member) in enumerate(entries)]
+
+    def replace(self, board, entries, batch_size=None):
+        with self._lock:
+            self._scores[board] = dict(entries)
+            self._order[board] = sorted((-score, user_id) for user_id, score in self._scores[board].items())
+            self._built.add(board)
+
+    def delete(self, board):
+        with self._lock:
+            self._scores[board], self._order[board] = {}, []
+            self._built.discard(board)
+
+
+BACKENDS = {
+    "redis": "user.leaderboard.RedisLeaderboard",
+    "memory": "user.leaderboard.MemoryLeaderboard",
+}
+
+
+@lru_cache(maxsize=None)
+def get_leaderboard():
+    backend = import_string(BACKENDS[settings.LEADERBOARD_BACKEND])
+    return backend(url=settings.LEADERBOARD_REDIS_URL)
+
+
+def record_changes(board, deltas):
+    """Applies `{user_id: delta}` to a board once the current transaction commits."""
+    deltas = {user_id: delta for user_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    def apply():
+        leaderboard = get_leaderboard()
+        for user_id, delta in deltas.items():
+            if not leaderboard.incr(board, user_id, delta):
+                queue_rebuild()
+                return
+
+    transaction.on_commit(apply)
+
+
+def store_scores(board, scores):
+    """Stores `{user_id: score}` on a board, or queues a rebuild when it is not built."""
+    leaderboard = get_leaderboard()
+    for user_id, score in scores.items():
+        if not leaderboard.set(board, user_id, score):
+            queue_rebuild()
+            return
+
+
+def rebuild():
+    """Recreates both boards from the `User` table."""
+    from .models import User
+
+    leaderboard = get_leaderboard()
+    for board in BOARDS:
+        rows = User.objects.order_by().values_list("id", board).iterator(chunk_size=5000)
+        leaderboard.replace(board, rows)
+
+
+def queue_rebuild():
+    """Queues `rebuild_leaderboards` unless a rebuild is already queued or running."""
+    from .tasks import rebuild_leaderboards
+
+    if cache.add(REBUILD_LOCK_KEY, True, REBUILD_LOCK_SECONDS):
+        rebuild_leaderboards.delay()
+
+
+def top_users(board, count=10):
+    """
+    Returns the top `count` users of a board, loaded with a single query. While
+    the board is not built they are read from the `User` table and a rebuild is
+    queued.
+    """
+    from .models import User
+
+    leaderboard = get_leaderboard()
+    if not leaderboard.is_built(board):
+        queue_rebuild()
+        return list(User.objects.order_by(f"-{board}", "id")[:count])
+
+    user_ids = [user_id for user_id, _ in leaderboard.top(board, count)]
+    users = User.objects.in_bulk(user_ids)
+    return [users[user_id] for user_id in user_ids if user_id in users]
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from user import leaderboard
+
+
+class Command(BaseCommand):
+    help = "Recreates the XP and wins leaderboards from the User table."
+
+    def handle(self, *args, **options):
+        leaderboard.rebuild()
+        board = leaderboard.get_leaderboard()
+        for name in leaderboard.BOARDS:
+            top = board.top(name, 1)
+            self.stdout.write(self.style.SUCCESS(
+                f"Rebuilt {name} leaderboard" + (f" (leader: user {top[0][0]} with {top[0][1]})" if top else "")))
@@ -2,6 +2,33 @@ from django.contrib.auth.models import AbstractUser
 from django.utils.text import slugify
 from django.utils.translation import gettext_lazy as _
 from django.db import models
+from django.db.models.lookups import GreaterThanOrEqual
+
+LEVEL_THRESHOLDS = (
+    (800, "Rhetorician"),
+    (500, "Orator"),
+    (300, "Debater"),
+    (150, "Competitor"),
+)
+
+
+def level_for_xp(xp):
+    for threshold, level in LEVEL_THRESHOLDS:
+        if xp >= threshold:
+            return level
+    return "Novice"
+
+
+def level_expression(xp):
+    """
+    Database-side counterpart of `level_for_xp`, so bulk `update()` calls can
+    set the level in the same statement that changes xp.
+    """
+    return models.Case(
+        *[models.When(GreaterThanOrEqual(xp, threshold), then=models.Value(level))
+          for threshold, level in LEVEL_THRESHOLDS],
+        default=models.Value("Novice"),
+    )
 
 
 class User(AbstractUser):
@@ -22,22 +49,24 @@ class User(AbstractUser):
     level = models.CharField(max_length=20, choices=LEVEL_CHOICES, default="Novice", verbose_name=_("Level"))
     wins = models.IntegerField(default=0)
 
-    def level_up(self):
-        previous_level = self.level
+    TRACKED_FIELDS = ('xp', 'wins')
 
-        if self.xp >= 800:
-            self.level = "Rhetorician"
-        elif self.xp >= 500:
-            self.level = "Orator"
-        elif self.xp >= 300:
-            self.level = "Debater"
-        elif self.xp >= 150:
-            self.level = "Competitor"
-        else:
-            self.level = "Novice"
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {name: value for name, value in zip(field_names, values)
+                                   if name in cls.TRACKED_FIELDS}
+        return instance
 
-        if self.level != previous_level:
-            self.save()
+    def changed_scores(self):
+        """
+        Returns the tracked fields whose value differs from the one loaded from the
+        database. Fields holding an expression are left out; their change is not
+        known until the database has applied it.
+        """
+        loaded = getattr(self, '_loaded_values', {})
+        return {name: getattr(self, name) for name in self.TRACKED_FIELDS
+                if isinstance(getattr(self, name), int) and getattr(self, name) != loaded.get(name)}
 
     def __str__(self):
         return self.username
@@ -45,5 +74,18 @@ class User(AbstractUser):
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.username)
-        
-        super().save(*args, **kwargs)
\ No newline at end of file
+
+        # The level is written by the same statement as the xp it derives from, either
+        # as a value or, when xp is an F-expression, as the matching CASE expression.
+        self.level = level_for_xp(self.xp) if isinstance(self.xp, int) else level_expression(self.xp)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'xp' in update_fields and 'level' not in update_fields:
+            kwargs['update_fields'] = [*update_fields, 'level']
+
+        super().save(*args, **kwargs)
+        # Expressions stay on the instance after the save; read back what they wrote.
+        expressions = [name for name in ('xp', 'level', 'wins') if hasattr(getattr(self, name), 'resolve_expression')]
+        if expressions:
+            self.refresh_from_db(fields=expressions)
+        self._loaded_values = {name: getattr(self, name) for name in self.TRACKED_FIELDS
+                               if isinstance(getattr(self, name), int)}
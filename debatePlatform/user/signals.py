@@ -1,8 +1,31 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
+
+from debate.caching import touch_users_on_commit
+from . import leaderboard
 from .models import User
 
 @receiver(post_save, sender=User)
-def update_user_level(sender, instance, created, **kwargs):
-    if not created:
-        instance.level_up()
\ No newline at end of file
+def sync_leaderboards(sender, instance, created, **kwargs):
+    """
+    Stores the saved xp and wins on the leaderboards when they changed, and
+    touches the user, whose version the debates that show them depend on. Saves
+    that assign an F-expression instead of a value report their change via
+    `record_changes`.
+    """
+    scores = {board: score for board, score in instance.changed_scores().items() if board in leaderboard.BOARDS}
+
+    def store():
+        for board, score in scores.items():
+            leaderboard.store_scores(board, {instance.pk: score})
+
+    if scores:
+        transaction.on_commit(store)
+        if not created:
+            touch_users_on_commit([instance.pk])
+
+
+@receiver(post_delete, sender=User)
+def remove_from_leaderboards(sender, instance, **kwargs):
+    transaction.on_commit(lambda: leaderboard.get_leaderboard().remove(instance.pk))
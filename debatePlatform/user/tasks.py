@@ -0,0 +1,13 @@
+from celery import shared_task
+from django.core.cache import cache
+
+from . import leaderboard
+
+
+@shared_task
+def rebuild_leaderboards():
+    """Recreates both leaderboards from the `User` table, queued when a board went missing."""
+    try:
+        leaderboard.rebuild()
+    finally:
+        cache.delete(leaderboard.REBUILD_LOCK_KEY)
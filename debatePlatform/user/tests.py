@@ -1,3 +1,153 @@
-from django.test import TestCase
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from debate.testing import PASSWORD, QueryBudgetTestCase, seed_round
+from . import leaderboard
+from .models import User, level_for_xp
+from .tasks import rebuild_leaderboards
+
+# A 1x1 transparent GIF.
+PICTURE = (b"GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff!\xf9\x04\x01\x00\x00\x00\x00"
+           b",\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;")
+
+
+class UserPageQueryBudgetTests(QueryBudgetTestCase):
+    """Query and row budgets of the views in `user/views.py`."""
+
+    def test_profile(self):
+        users = []
+        for data, response in self.assertQueryBudget(
+                lambda data: self.client.get(reverse('profile', args=[data.users[0].slug])), queries=4, rows=13):
+            user = data.users[0]
+            users += data.users
+            ranking = sorted(users, key=lambda other: (-other.xp, other.pk))
+            self.assertEqual(response.context['profile_user'], user)
+            self.assertContains(response, f"XP: {user.xp} | Wins: {user.wins}")
+            self.assertEqual(response.context['xp_rank'], ranking.index(user) + 1)
+
+    def test_own_profile(self):
+        self.assertQueryBudget(lambda data: self.client.get(reverse('profile', args=[data.users[0].slug])),
+                               queries=6, rows=15, login=lambda data: data.users[0])
+
+    def test_login_form(self):
+        self.assertQueryBudget(lambda data: self.client.get(reverse('login')), queries=1, rows=3)
+
+    def test_login(self):
+        self.assertQueryBudget(
+            lambda data: self.client.post(reverse('login'), {'username': data.users[0].username, 'password': PASSWORD}),
+            queries=9, rows=3)
+
+    def test_register_form(self):
+        self.assertQueryBudget(lambda data: self.client.get(reverse('register')), queries=1, rows=3)
+
+    def test_register(self):
+        self.assertQueryBudget(
+            lambda data: self.client.post(reverse('register'), {
+                'username': f"new-{data.users[0].username}", 'email': f"new-{data.users[0].email}",
+                'password1': "A-long-password-1", 'password2': "A-long-password-1",
+            }),
+            queries=3, rows=1)
+        self.assertTrue(User.objects.filter(username=f"new-{self.small.users[0].username}").exists())
+
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+    def test_update_profile_picture(self):
+        self.assertQueryBudget(
+            lambda data: self.client.post(reverse('update_profile_picture', args=[data.users[0].slug]),
+                                          {'profile_picture': SimpleUploadedFile("picture.gif", PICTURE, "image/gif")},
+                                          HTTP_REFERER='/'),
+            queries=2, rows=1, login=lambda data: data.users[0])
+
+
+class UserSaveTests(TestCase):
+    """Saving an F-expression writes xp and level together and leaves plain values on the instance."""
+
+    def test_expression_save(self):
+        user = User.objects.create_user(username="saver", email="saver@example.com", password=PASSWORD)
+        user.xp = F('xp') + 500
+        user.wins = F('wins') + 1
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save(update_fields=['xp', 'wins'])
+        self.assertEqual((user.xp, user.wins, user.level), (500, 1, level_for_xp(500)))
+
+        user.save()
+        stored = User.objects.get(pk=user.pk)
+        self.assertEqual((stored.xp, stored.wins, stored.level), (500, 1, level_for_xp(500)))
+
+
+class LeaderboardTests(TestCase):
+    """The sorted-set boards rank users like the `User` table and survive a missing key."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_round()
+
+    def setUp(self):
+        cache.clear()
+        leaderboard.rebuild()
+        self.board = leaderboard.get_leaderboard()
+
+    def ranking(self, board):
+        return list(User.objects.order_by(f"-{board}", "id").values_list('pk', board))
+
+    def test_rebuild_ranks_by_score(self):
+        for board in leaderboard.BOARDS:
+            expected = self.ranking(board)
+            self.assertEqual(self.board.top(board, len(expected)), expected)
+            self.assertEqual(self.board.rank(board, expected[0][0]), 1)
+            self.assertEqual(self.board.rank(board, expected[-1][0]), len(expected))
+        self.assertEqual([user.pk for user in leaderboard.top_users(leaderboard.XP, 3)],
+                         [pk for pk, _ in self.ranking(leaderboard.XP)[:3]])
+
+    def test_changes_apply_on_commit(self):
+        last, _ = self.ranking(leaderboard.XP)[-1]
+        with self.captureOnCommitCallbacks(execute=True):
+            leaderboard.record_changes(leaderboard.XP, {last: 10_000})
+            self.assertNotEqual(self.board.rank(leaderboard.XP, last), 1)
+        self.assertEqual(self.board.rank(leaderboard.XP, last), 1)
+
+    def test_saved_scores_are_stored(self):
+        user = User.objects.get(pk=self.ranking(leaderboard.WINS)[-1][0])
+        user.wins = 50
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save(update_fields=['wins'])
+        self.assertEqual(self.board.top(leaderboard.WINS, 1), [(user.pk, 50)])
+
+    @mock.patch.object(rebuild_leaderboards, 'delay')
+    def test_missing_board_is_served_from_the_database(self, delay):
+        self.board.delete(leaderboard.XP)
+        expected = [pk for pk, _ in self.ranking(leaderboard.XP)[:5]]
+
+        for _ in range(3):
+            self.assertEqual([user.pk for user in leaderboard.top_users(leaderboard.XP, 5)], expected)
+        delay.assert_called_once_with()
+
+        rebuild_leaderboards()
+        self.assertEqual([user_id for user_id, _ in self.board.top(leaderboard.XP, 5)], expected)
+        leaderboard.queue_rebuild()
+        self.assertEqual(delay.call_count, 2)
+
+    @mock.patch.object(rebuild_leaderboards, 'delay')
+    def test_changes_do_not_recreate_a_missing_board(self, delay):
+        self.board.delete(leaderboard.XP)
+        last, _ = self.ranking(leaderboard.XP)[-1]
+        with self.captureOnCommitCallbacks(execute=True):
+            leaderboard.record_changes(leaderboard.XP, {last: 10_000})
+        delay.assert_called_once_with()
+        self.assertFalse(self.board.is_built(leaderboard.XP))
+        self.assertEqual(self.board.top(leaderboard.XP, 10), [])
+
+        expected = [pk for pk, _ in self.ranking(leaderboard.XP)[:5]]
+        self.assertEqual([user.pk for user in leaderboard.top_users(leaderboard.XP, 5)], expected)
+
+        user = User.objects.get(pk=last)
+        user.xp = 20_000
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save(update_fields=['xp'])
+        self.assertEqual(self.board.top(leaderboard.XP, 10), [])
+        self.assertEqual(delay.call_count, 1)
@@ -4,7 +4,9 @@ from django.views import generic
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib.auth.views import LoginView
 from .forms import SignUpForm
+from . import leaderboard
 from .models import User
+from debate.vote_buffer import apply_pending
 
 class ProfileView(generic.DetailView):
     model = User
@@ -12,7 +14,17 @@ class ProfileView(generic.DetailView):
     slug_field = 'slug'
     slug_url_kwarg = 'user_slug'
     context_object_name = 'profile_user'
-    queryset = User.objects.prefetch_related('author_debates', 'participated_debates')
+    recent_debates = 5
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        apply_pending([self.object])
+        board = leaderboard.get_leaderboard()
+        context['xp_rank'] = board.rank(leaderboard.XP, self.object.pk)
+        context['wins_rank'] = board.rank(leaderboard.WINS, self.object.pk)
+        context['participated_debates'] = self.object.participated_debates.order_by('-created_at')[:self.recent_debates]
+        context['authored_debates'] = self.object.author_debates.order_by('-created_at')[:self.recent_debates]
+        return context
 
 
 class LogInView(LoginView):
@@ -28,10 +40,10 @@ class RegisterView(generic.CreateView):
     success_url = reverse_lazy('login')
 
     def form_valid(self, form):
-        user = form.save()
+        response = super().form_valid(form)
 
-        print(f"User create successfully: {user}")
-        return super().form_valid(form)
+        print(f"User create successfully: {self.object}")
+        return response
 
 class UpdateProfilePicture(generic.UpdateView):
     model = User